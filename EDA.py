@@ -1,5 +1,6 @@
 #%%
-crime_data.to_csv('cleaned_data.csv',index = False)
+from storage import save_table, load_table
+save_table(crime_data, 'cleaned_data.parquet')
 
 #%%
 # II) Exploratory Data Analysis 
@@ -12,17 +13,25 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 from sklearn.preprocessing import LabelEncoder 
-from scipy.stats import chi2_contingency
+from chi_squared import chi_squared_tests, level_chi_squared_tests
 from plotly.subplots import make_subplots
 
 #%%
-crime_df = pd.read_csv("cleaned_data.csv", encoding='latin1')
+crime_df = load_table("cleaned_data.parquet")
 crime_df.shape
 crime_df.columns
 
 #%%
 crime_df['OCCURRED_ON_DATE'] = pd.to_datetime(crime_df['OCCURRED_ON_DATE'])
 crime_df['DATE'] = crime_df['OCCURRED_ON_DATE'].dt.day
+
+#%%
+# Count cube of the incidents over the chart dimensions, kept on disk next to the table
+# Every count chart below is a roll-up of the cube instead of a new scan of the incident rows.
+# The cube is built from the table on the first run only. The new incidents and corrections of a daily
+# data drop are absorbed without rescanning the history with crime_cube.update(drop) and crime_cube.save()
+from cube import IncrementalCountCube
+crime_cube = IncrementalCountCube.open("cleaned_data.parquet", data=crime_df)
 #%%
 # Dropping unwanted rows
 crime_df.drop(['INCIDENT_NUMBER','OFFENSE_DESCRIPTION','OCCURRED_ON_DATE','OFFENSE_CODE','Location'], axis=1, inplace = True)
@@ -36,7 +45,7 @@ crime_df.describe().T
 #UNIVARIATE ANALYSIS
 #%%
 #Count plot for YEAR
-sns.countplot(x = crime_df['YEAR'], color = '#FAB4C6')
+sns.barplot(data = crime_cube.rollup('YEAR').reset_index(), x = 'YEAR', y = 'count', color = '#FAB4C6')
 plt.title('Distribution of Incidents by Year')
 plt.xticks(rotation=90)
 plt.show()
@@ -45,7 +54,7 @@ plt.show()
 # The incidents were highest in the year 2017 and lowest in the year 2015
 #%%
 #Count plot for MONTH
-sns.countplot(x = crime_df['MONTH'], color = '#C8E4C5')
+sns.barplot(data = crime_cube.rollup('MONTH').reset_index(), x = 'MONTH', y = 'count', color = '#C8E4C5')
 plt.title('Distribution of Incidents by Month')
 plt.xticks(rotation=90)
 plt.show()
@@ -54,7 +63,7 @@ plt.show()
 # The incidents were highest in the month of July and August
 #%%
 #Count plot for HOUR
-sns.countplot(x = crime_df['HOUR'], color = '#FFB347')
+sns.barplot(data = crime_cube.rollup('HOUR').reset_index(), x = 'HOUR', y = 'count', color = '#FFB347')
 plt.title('Distribution of Incidents by Hour')
 plt.xticks(rotation=90)
 plt.show()
@@ -63,7 +72,7 @@ plt.show()
 # The Incidents recorded are higher between 9th hour to 19th hour and lower during the early morning
 #%%
 #Count plot for DATE
-sns.countplot(x = crime_df['DATE'], color = '#E6E200')
+sns.barplot(data = crime_cube.rollup('DATE').reset_index(), x = 'DATE', y = 'count', color = '#E6E200')
 plt.title('Distribution of Incidents by Day')
 plt.xticks(rotation=90)
 plt.show()
@@ -73,7 +82,7 @@ plt.show()
 #Count plot for DAY_OF_WEEK
 days_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
-sns.countplot(x = crime_df['DAY_OF_WEEK'], order = days_order, color = '#769FB6')
+sns.barplot(data = crime_cube.rollup('DAY_OF_WEEK').reset_index(), x = 'DAY_OF_WEEK', y = 'count', order = days_order, color = '#769FB6')
 
 plt.title('Distribution of Incidents by Day of the Week')
 plt.xticks(rotation=45)
@@ -82,7 +91,7 @@ plt.show()
 # It can be observed that the Incident rate is almost equal on all the days except the highest being on Friday and lowest on Sunday. 
 
 #%%
-sns.countplot(x = crime_df['DISTRICT'], color = '#CDB5CD')
+sns.barplot(data = crime_cube.rollup('DISTRICT').reset_index(), x = 'DISTRICT', y = 'count', color = '#CDB5CD')
 plt.title('Distribution of Incidents by District')
 plt.xticks(rotation=90)
 plt.show()
@@ -93,38 +102,39 @@ plt.show()
 # Analysis for SHOOTING variable
 #%%[markdown]
 # 1) Countplot for shooting
-sns.countplot(x=crime_df['SHOOTING'])
+sns.barplot(data=crime_cube.rollup('SHOOTING').reset_index(), x='SHOOTING', y='count')
 
 #%%[markdown]
 # 2)Pie Chart
-crime_df['SHOOTING'].value_counts().plot.pie(autopct = '%1.1f%%')
+crime_cube.value_counts('SHOOTING').plot.pie(autopct = '%1.1f%%')
 #%%[markdown]
 # 3) Distribution for the occurance of Shooting over the Years
-sns.countplot(x = crime_df['YEAR'], hue = crime_df['SHOOTING'])
+sns.barplot(data = crime_cube.rollup(['YEAR', 'SHOOTING']).reset_index(), x = 'YEAR', y = 'count', hue = 'SHOOTING')
 plt.title('Distribution of Shooting')
 
 #%%[markdown]
 # 4) Distribution of Shooting District wise
-crime_df[crime_df['SHOOTING'] == 'Y']['DISTRICT'].value_counts().plot(kind = 'bar', color = '#8CD9A3')
+crime_cube.value_counts('DISTRICT', where = {'SHOOTING': 'Y'}).plot(kind = 'bar', color = '#8CD9A3')
 plt.title('Distribution of Shooting occuring in the district')
 #%%
-crime_df[crime_df['SHOOTING'] == 'N']['DISTRICT'].value_counts().plot(kind = 'bar', color = '#FF5C5C')
+crime_cube.value_counts('DISTRICT', where = {'SHOOTING': 'N'}).plot(kind = 'bar', color = '#FF5C5C')
 plt.title('Distribution of Shooting not occuring in the district')
 #%%[markdown]
 # Observations for shooting variable
 
 #%%[markdown]
 # Distribution of different offence District wise
-order = crime_df['OFFENSE_CODE_GROUP'].value_counts().head(6)
+order = crime_cube.value_counts('OFFENSE_CODE_GROUP').head(6)
 order = order.drop('Other').index
-sns.countplot(data = crime_df, x='OFFENSE_CODE_GROUP',hue='DISTRICT', order = order, palette = 'plasma')
+offense_district_counts = crime_cube.rollup(['OFFENSE_CODE_GROUP', 'DISTRICT'], where = {'OFFENSE_CODE_GROUP': order}).reset_index()
+sns.barplot(data = offense_district_counts, x='OFFENSE_CODE_GROUP', y='count', hue='DISTRICT', order = order, palette = 'plasma')
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2)
 plt.xticks(rotation=75)
 plt.show()
 
 #%%
 #Line graph(District, Year, Offense code group)
-grouped = crime_df.groupby(['YEAR', 'DISTRICT'])['OFFENSE_CODE_GROUP'].count().reset_index()
+grouped = crime_cube.rollup(['YEAR', 'DISTRICT']).reset_index(name = 'OFFENSE_CODE_GROUP')
 sns.lineplot(data = grouped.reset_index(), x='YEAR', y='OFFENSE_CODE_GROUP',hue='DISTRICT', palette = 'plasma')
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2)
 plt.title('Line Graph for each district showing the number of incidents distributed over the years')
@@ -132,7 +142,7 @@ plt.show()
 #%%[markdown]
 #Line Graph for each district showing the number of incidents distributed over the years
 #plotly
-grouped = crime_df.groupby(['YEAR', 'DISTRICT'])['OFFENSE_CODE_GROUP'].count().reset_index()
+grouped = crime_cube.rollup(['YEAR', 'DISTRICT']).reset_index(name = 'OFFENSE_CODE_GROUP')
 fig = px.line(grouped, x='YEAR', y='OFFENSE_CODE_GROUP', color='DISTRICT', labels={'OFFENSE_CODE_GROUP': 'Number of Incidents', 'YEAR': 'YEAR'})
 
 # Update layout for legend
@@ -158,7 +168,7 @@ fig.update_layout(legend=dict(
 fig.show()
 #%%
 #Line graph(District, Month, Offense code group)
-grouped = crime_df.groupby(['MONTH', 'DISTRICT'])['OFFENSE_CODE_GROUP'].count().reset_index()
+grouped = crime_cube.rollup(['MONTH', 'DISTRICT']).reset_index(name = 'OFFENSE_CODE_GROUP')
 sns.lineplot(data = grouped.reset_index(), x='MONTH', y='OFFENSE_CODE_GROUP',hue='DISTRICT', palette = 'plasma')
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2)
 plt.title('Line Graph for each district showing the number of incidents distributed over the months')
@@ -167,7 +177,7 @@ plt.show()
 #%%[markdown]
 #Line Graph for each district showing the number of incidents distributed over the months
 #plotly
-grouped = crime_df.groupby(['MONTH', 'DISTRICT'])['OFFENSE_CODE_GROUP'].count().reset_index()
+grouped = crime_cube.rollup(['MONTH', 'DISTRICT']).reset_index(name = 'OFFENSE_CODE_GROUP')
 fig = px.line(grouped, x='MONTH', y='OFFENSE_CODE_GROUP', color='DISTRICT', labels={'OFFENSE_CODE_GROUP': 'Number of Incidents', 'MONTH': 'Month'})
 
 # Update layout for legend
@@ -193,8 +203,8 @@ fig.update_layout(legend=dict(
 fig.show()
 #%%
 #Pie chart for all the Offence Code Group
-labels = crime_df['OFFENSE_CODE_GROUP'].astype('category').cat.categories.tolist()
-counts = crime_df['OFFENSE_CODE_GROUP'].value_counts()
+counts = crime_cube.value_counts('OFFENSE_CODE_GROUP')
+labels = counts.index.sort_values().tolist()
 sizes = [counts[var_cat] for var_cat in labels]
 fig1, ax1 = plt.subplots(figsize = (22,12))
 ax1.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=140) 
@@ -205,7 +215,10 @@ plt.show()
 # Bivariate Analysis
 
 # %%
-numerical_columns = crime_df.select_dtypes(include=['int64']).columns
+# The data types are kept from cleaning (YEAR is categorical, MONTH and HOUR are small integers),
+# so the numerical columns are listed explicitly and converted to integers for the box plots
+numerical_columns = ['YEAR', 'MONTH', 'HOUR', 'DATE']
+numerical_df = crime_df[numerical_columns].astype('int64')
 len(numerical_columns)
 #%%
 # Determine the number of rows/columns for the subplot grid
@@ -219,7 +232,7 @@ fig, axes = plt.subplots(n_rows, n_cols, figsize=(n_cols*5, n_rows*5))
 axes = axes.flatten()
 
 for i, col in enumerate(numerical_columns):
-    sns.boxplot(x='SHOOTING', y=col, data=crime_df, ax=axes[i], color = '#d53e4f')
+    sns.boxplot(x=crime_df['SHOOTING'], y=numerical_df[col], ax=axes[i], color = '#d53e4f')
     axes[i].set_title(col)
     axes[i].set_xlabel('SHOOTING')
     axes[i].set_ylabel('')
@@ -229,17 +242,21 @@ plt.tight_layout()
 plt.show()
 #%%
 #Chi-squared Test
-categorical_columns = crime_df.select_dtypes(include=['object', 'category']).columns
+categorical_columns = ['OFFENSE_CODE_GROUP', 'DISTRICT', 'REPORTING_AREA', 'SHOOTING', 'DAY_OF_WEEK', 'UCR_PART', 'STREET']
 
-for col in categorical_columns:
-    # Create a cross-tabulation
-    contingency_table = pd.crosstab(crime_df[col], crime_df['SHOOTING'])
-    # Perform the Chi-squared test
-    chi2, p, dof, ex = chi2_contingency(contingency_table)
+# Every contingency table is counted from the category codes and all the tests are computed at once
+chi_squared_results = chi_squared_tests(crime_df, categorical_columns, target='SHOOTING')
+for col, p in chi_squared_results['p_value'].items():
     print(f"Chi-squared test for {col}: p-value = {p}")
 #%%
+# Chi-squared test of every STREET against SHOOTING, each street against all the others
+# Most streets have only a few incidents, so their sparse tables get permutation p-values,
+# computed over a pool of worker processes
+street_chi_squared = level_chi_squared_tests(crime_df, 'STREET', target='SHOOTING', permutations=999)
+street_chi_squared.sort_values('p_value').head(10)
+#%%
 # Selecting categorical columns
-categorical_columns = crime_df.select_dtypes(include=['object', 'category']).columns
+categorical_columns = ['OFFENSE_CODE_GROUP', 'DISTRICT', 'REPORTING_AREA', 'SHOOTING', 'DAY_OF_WEEK', 'UCR_PART', 'STREET']
 # len(categorical_columns)
 #%%
 # Create a figure and a grid of subplots
@@ -258,11 +275,15 @@ plt.show()
 
 #%%
 # Assuming Shooting is a Yes/No variable, we convert it to 1/0
-crime_df['SHOOTING'] = crime_df['SHOOTING'].map({'Y': 1, 'N': 0})
+crime_df['SHOOTING'] = crime_df['SHOOTING'].map({'Y': 1, 'N': 0}).astype('int64')
 
 # %%[markdown]
 # Correlation Matrix
-correlations = crime_df[['YEAR','MONTH','HOUR','DATE','SHOOTING','Lat','Long']].corr()
+# The correlation statistics are accumulated batch by batch from the Parquet table,
+# so the matrix is computed without loading the full table into memory
+from correlation import correlation_from_table
+correlation_statistics = correlation_from_table("cleaned_data.parquet", ['YEAR','MONTH','HOUR','DATE','SHOOTING','Lat','Long'])
+correlations = correlation_statistics.correlation()
 correlations
 #%%
 shooting_correlations = correlations['SHOOTING'].sort_values()
@@ -273,7 +294,7 @@ sns.heatmap(correlations,annot = True)
 
 #%%
 # Scatterplot using plotly
-correlations = crime_df[['YEAR','MONTH','HOUR','DATE','SHOOTING','Lat','Long']].corr()
+correlations = correlation_statistics.correlation()
 
 # Create the heatmap
 fig = px.imshow(correlations, text_auto=True, aspect="auto", title='Correlation Heatmap')
@@ -283,16 +304,16 @@ fig.show()
 #%%[markdown]
 # Scatterplot for Latitude and Longitude
 custom_colors = [ '#1f77b4',  '#ff7f0e',   '#2ca02c',   '#d62728',   '#9467bd',   '#8c564b',  '#e377c2',   '#7f7f7f',   '#bcbd22',   '#17becf',   '#aec7e8',  '#ffbb78']
-sns.scatterplot(data=crime_df, x='Long', y='Lat', hue='DISTRICT', alpha=0.5, palette = custom_colors)
+# The incidents are binned into a pixel grid per district and shaded, instead of drawing one marker per incident
+from density import density_plot
+density_plot(crime_df, x='Long', y='Lat', hue='DISTRICT', palette = custom_colors, xlim=(-71.200,-71.000), ylim=(42.200,42.400))
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2)
 plt.title('Scatter-plot for Latitude and Longitude')
-plt.xlim(-71.200,-71.000)
-plt.ylim(42.200,42.400)
 
 #%%
 # For time series analysis 
 #%%
-crime_df = pd.read_csv("cleaned_data.csv", encoding='latin1')
+crime_df = load_table("cleaned_data.parquet")
 crime_df.shape
 crime_df.columns
 
@@ -300,24 +321,16 @@ crime_df.columns
 #%%[markdown]
 #Time series analysis
 
-crime_df['SHOOTING'] = crime_df['SHOOTING'].map({'Y': 1, 'N': 0})
-crime_df['OCCURRED_ON_DATE'] = pd.to_datetime(crime_df['OCCURRED_ON_DATE'])
-crime_df.set_index('OCCURRED_ON_DATE', inplace=True)
-
-# Resample to a larger time frame (e.g., monthly) if needed
-shooting_time_series = crime_df.resample('M')['SHOOTING'].sum()
+# Monthly number of shootings, rolled up from the count cube
+shooting_time_series = crime_cube.monthly(where={'SHOOTING': 'Y'})
 shooting_time_series.plot()
 plt.show()
 
 #%%
 #TSA using plotly
 
-# Convert 'OCCURRED_ON_DATE' to datetime and sort
-crime_df['OCCURRED_ON_DATE'] = pd.to_datetime(crime_df['OCCURRED_ON_DATE'])
-crime_df.sort_values('OCCURRED_ON_DATE', inplace=True)
-
-# Group by 'OCCURRED_ON_DATE' and 'SHOOTING', then count the incidents
-grouped_df = crime_df.groupby([pd.Grouper(key='OCCURRED_ON_DATE', freq='M'), 'SHOOTING']).size().reset_index(name='NUM_INCIDENTS')
+# Number of incidents per month and SHOOTING, rolled up from the count cube
+grouped_df = crime_cube.monthly('SHOOTING').reset_index(name='NUM_INCIDENTS')
 
 # Create the line plot
 fig = px.line(grouped_df, x='OCCURRED_ON_DATE', y='NUM_INCIDENTS', color='SHOOTING', title='Monthly Trend of Incidents Over Time by Shooting')
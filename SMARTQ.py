@@ -16,9 +16,18 @@ from sklearn.metrics import accuracy_score, confusion_matrix
 
 #%%
 # Loading the crime dataset into a pandas DataFrame
-# The dataset is read from a CSV file named 'crime.csv'
-# The 'encoding' parameter is set to 'latin1' to handle special characters in the data that may not be properly interpreted using the default UTF-8 encoding
-crime_data = pd.read_csv("final_crime_data.csv", encoding='latin1')
+# The dataset is read from the Parquet file written at the end of the cleaning stage,
+# which keeps the data types assigned during cleaning
+from storage import load_table
+crime_data = load_table("final_crime_data.parquet")
+
+#%%
+# Profiling every column in a single pass
+# The counts, missing values, distinct values, min/max and most frequent values of all the columns are computed
+# with one scan per column and cached next to the data file, keyed by the hash of its content.
+# The sanity checks below read them from this profile instead of scanning the data again for every check.
+from profiler import profile_file
+raw_profile = profile_file("final_crime_data.parquet", data=crime_data)
 
 #%% [markdown]
 # I) Data Cleaning and Data Preprocessing
@@ -34,8 +43,7 @@ print(len(crime_data))
 # This is a crucial step for data sanity check to ensure that each column is of the appropriate data type
 
 #%%
-crime_data.info()
-crime_data.describe()
+print(raw_profile.describe())
 
 #%%
 # Addressing Missing Values and Inappropriate Data Types
@@ -54,7 +62,7 @@ crime_data.describe()
 # This step involves checking whether each entry in the 'INCIDENT_NUMBER' column is unique.
 # If every incident number is found to be unique, it can serve as a primary key for the dataset,
 # ensuring that each row represents a distinct incident and thereby maintaining data integrity.
-number_of_unique_rows = crime_data['INCIDENT_NUMBER'].nunique()
+number_of_unique_rows = raw_profile.nunique('INCIDENT_NUMBER')
 print("\nTotal Number of Unique Values in the Incident Number column: ", number_of_unique_rows)
 
 # Observing Duplicate Entries in 'INCIDENT_NUMBER'
@@ -67,31 +75,17 @@ print("\nTotal Number of Unique Values in the Incident Number column: ", number_
 
 #%%
 # Verifying the presence of duplicate rows i.e. to check whether single incident is reported multiple times
-# Group by 'INCIDENT_NUMBER'
-grouped = crime_data.groupby('INCIDENT_NUMBER')
-
-# Initialize a counter for incidents with multiple distinct entries
-multiple_entries_count = 0
-
-# Initialize a counter for printing sets
-print_counter = 0
-
-# Iterate through each group
-for name, group in grouped:
-    # Drop the 'INCIDENT_NUMBER' column as it's the same for the group
-    group_without_id = group.drop(columns=['INCIDENT_NUMBER'])
-
-    # Check if there are distinct rows in the group
-    if group_without_id.drop_duplicates().shape[0] > 1:
-        # Increment counter if more than one distinct entry is found
-        multiple_entries_count += 1
-
-        # Print the first three sets of rows
-        if print_counter < 3:
-            print(f"Incident number: {name}")
-            print(group)
-            print("\n")  
-            print_counter += 1
+# Every row is hashed over all columns except 'INCIDENT_NUMBER' and the distinct hashes are counted per incident,
+# which avoids looping over hundreds of thousands of groups in Python
+from cleaning import find_multi_offense_incidents
+multiple_entries_count, multi_offense_incidents = find_multi_offense_incidents(crime_data)
+
+# Print the first three sets of rows
+examples = crime_data[crime_data['INCIDENT_NUMBER'].isin(multi_offense_incidents[:3])]
+for name, group in examples.groupby('INCIDENT_NUMBER'):
+    print(f"Incident number: {name}")
+    print(group)
+    print("\n")
 
 print("Number of incidents with multiple distinct entries:", multiple_entries_count)
 
@@ -111,14 +105,14 @@ print("Number of incidents with multiple distinct entries:", multiple_entries_co
 #%%
 # 2) Analyzing 'OFFENSE_CODE' Column
 # First, determine the number of unique offense codes present in the dataset
-unique_code = crime_data['OFFENSE_CODE'].value_counts()
-number_of_unique_code = crime_data['OFFENSE_CODE'].nunique()
+unique_code = raw_profile.value_counts('OFFENSE_CODE')
+number_of_unique_code = raw_profile.nunique('OFFENSE_CODE')
 print(unique_code)
 print(number_of_unique_code)
 
 #%% 
 # Next, check for any missing values in 'OFFENSE_CODE'
-num_missing_code = crime_data['OFFENSE_CODE'].isnull().sum()
+num_missing_code = raw_profile.null_count('OFFENSE_CODE')
 print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_code)
 
 # The analysis shows there are no missing values in 'OFFENSE_CODE'
@@ -126,146 +120,56 @@ print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_code)
 # Converting 'OFFENSE_CODE' to a 'categorical' data type can be beneficial because
 # categorical treatment allows for easy grouping and analysis of different crime types without implying any numerical relationship between them.
 
-#%%
-# Convert 'OFFENSE_CODE' column to a categorical data type
-crime_data['OFFENSE_CODE'] = crime_data['OFFENSE_CODE'].astype('category')
-
-# Verify the conversion
-print(crime_data['OFFENSE_CODE'].dtype)
-
 #%%
 # 3) Analyzing `OFFENSE_CODE_GROUP` Column
 # First, determine the number of unique offense code groups present in the dataset
-unique_code_group = crime_data['OFFENSE_CODE_GROUP'].value_counts()
-number_of_unique_code_group = crime_data['OFFENSE_CODE_GROUP'].nunique()
+unique_code_group = raw_profile.value_counts('OFFENSE_CODE_GROUP')
+number_of_unique_code_group = raw_profile.nunique('OFFENSE_CODE_GROUP')
 print(unique_code_group)
 print(number_of_unique_code_group)
 
 #%% 
 # Next, check for any missing values in 'OFFENSE_CODE_GROUP'
-num_missing_code_group = crime_data['OFFENSE_CODE_GROUP'].isnull().sum()
+num_missing_code_group = raw_profile.null_count('OFFENSE_CODE_GROUP')
 print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_code_group)
 
-# It is observed that the 'OFFENSE_CODE_GROUP' column contains no missing values,
-# which is beneficial for a complete analysis. However, its current data type is 'object'.
-# For improved clarity and consistency in data handling, it would be advantageous to convert this column to 'string' type.
-# Convert 'OFFENSE_CODE_GROUP' column to string data type
-crime_data['OFFENSE_CODE_GROUP'] = crime_data['OFFENSE_CODE_GROUP'].astype('string')
-
-# Verify the conversion
-print(crime_data['OFFENSE_CODE_GROUP'].dtype)
-
 #%%
 # 4) Analyzing `OFFENSE_DESCRIPTION` Column
 # First, determine the number of unique offense description present in the dataset
-unique_description = crime_data['OFFENSE_DESCRIPTION'].value_counts()
-number_unique_description = crime_data['OFFENSE_DESCRIPTION'].nunique()
+unique_description = raw_profile.value_counts('OFFENSE_DESCRIPTION')
+number_unique_description = raw_profile.nunique('OFFENSE_DESCRIPTION')
 print(unique_description)
 print(number_unique_description)
 
 #%% 
 # Next, check for any missing values in 'OFFENSE_DESCRIPTION'
-num_missing_description = crime_data['OFFENSE_CODE_GROUP'].isnull().sum()
+num_missing_description = raw_profile.null_count('OFFENSE_CODE_GROUP')
 print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_description)
 
-# It is observed that the 'OFFENSE_DESCRIPTION' column contains no missing values,
-# However, its current data type is 'object'.
-# For improved clarity and consistency in data handling, it would be advantageous to convert this column to 'string' type.
-# Convert 'OFFENSE_DESCRIPTION' column to string data type
-crime_data['OFFENSE_DESCRIPTION'] = crime_data['OFFENSE_DESCRIPTION'].astype('string')
-
-# Verify the conversion
-print(crime_data['OFFENSE_DESCRIPTION'].dtype)
-
 #%%
 # 5) Analyzing `DISTRICT` Column
 # First, determine the number of unique districts present in this column
-unique_districts = crime_data['DISTRICT'].value_counts()
-num_unique_dstricts = crime_data['DISTRICT'].nunique()
+unique_districts = raw_profile.value_counts('DISTRICT')
+num_unique_dstricts = raw_profile.nunique('DISTRICT')
 print(unique_districts)
 print(num_unique_dstricts)
 
 #%% 
 # Next, check for any missing values in 'DISTRICT' column
-num_missing_districts = crime_data['DISTRICT'].isnull().sum()
-print("\nNumber of missing values in DISTRICT: ", num_missing_districts)
-
-#%%
-# To impute missing district values using the 'REPORTING_AREA' information, 
-# a relationship between 'REPORTING_AREA' and 'DISTRICT' should be established. 
-# The idea is to find the most common 'DISTRICT' for each 'REPORTING_AREA',
-# and then use this information to fill in missing 'DISTRICT' values.
-# Step 1: Find the Most Common District for Each Reporting Area
-most_common_district = crime_data.groupby(['REPORTING_AREA', 'DISTRICT']).size().reset_index(name='count')
-most_common_district = most_common_district.sort_values(['REPORTING_AREA', 'count'], ascending=False).drop_duplicates('REPORTING_AREA').set_index('REPORTING_AREA')['DISTRICT']
-
-# Step 2: Impute Missing District Values
-crime_data['DISTRICT'] = crime_data.apply(
-    lambda row: most_common_district[row['REPORTING_AREA']] if pd.isnull(row['DISTRICT']) and row['REPORTING_AREA'] in most_common_district else row['DISTRICT'],
-    axis=1
-)
-
-#%% 
-# Verify missing values in 'DISTRICT' column
-num_missing_districts = crime_data['DISTRICT'].isnull().sum()
+num_missing_districts = raw_profile.null_count('DISTRICT')
 print("\nNumber of missing values in DISTRICT: ", num_missing_districts)
 
-# It is observed that the 'DISTRICT' column contains no missing values now,
-# However, its current data type is 'object'.
-# For improved clarity and consistency in data handling, it would be advantageous to convert this column to 'string' type.
-# Convert 'DISTRICT' column to string data type
-#%%
-crime_data['DISTRICT'] = crime_data['DISTRICT'].astype('string')
-
-#%%
-# Updating District Codes with Real-Time District Names
-# The current dataset uses district codes, which are not immediately informative in real-world context.
-# After referencing the Boston Police Department's website, it's identified that these codes correspond to specific district names.
-# To enhance the dataset's readability and practical relevance, this step involves replacing the district codes
-# with their actual names. This will make the dataset more intuitive and meaningful for analysis and interpretation.
-
-# Define a function to replace a single district code with its name
-def replace_district_code(district_code):
-    # Mapping of district codes to names
-    district_name_mapping = {
-        'A1' : 'Downtown',
-        'A15': 'Charlestown',
-        'A7': 'East Boston',
-        'B2': 'Roxbury',
-        'B3': 'Mattapan',
-        'C6': 'South Boston',
-        'C11': 'Dorchester',
-        'D4': 'South End',
-        'D14': 'Brighton',
-        'E5': 'West Roxbury',
-        'E13': 'Jamaica Plain',
-        'E18': 'Hyde Park'
-    }
-    
-    # Return the corresponding district name or the original code if not found in the mapping
-    return district_name_mapping.get(district_code, district_code)
-
-# Apply the function to each row for the 'DISTRICT' column
-crime_data['DISTRICT'] = crime_data['DISTRICT'].apply(replace_district_code)
-
-#%%
-# Verify the change
-unique_districts = crime_data['DISTRICT'].value_counts()
-num_unique_dstricts = crime_data['DISTRICT'].nunique()
-print("\nUnique Districts count: ", unique_districts)
-print("\nNumber of Unique Districts: ", num_unique_dstricts)
-
 #%%
 # 6) Analyzing `Reporting Area` column
 # First, determine the number of unique reporting areas present in this column
-unique_reporting_areas = crime_data['REPORTING_AREA'].value_counts()
-num_unique_reporting_areas = crime_data['REPORTING_AREA'].nunique()
+unique_reporting_areas = raw_profile.value_counts('REPORTING_AREA')
+num_unique_reporting_areas = raw_profile.nunique('REPORTING_AREA')
 print(unique_reporting_areas)
 print(num_unique_reporting_areas)
 
 #%% 
 # Next, check for any missing values in 'REPORTING_AREA' column
-num_missing_reporting_area = crime_data['REPORTING_AREA'].isnull().sum()
+num_missing_reporting_area = raw_profile.null_count('REPORTING_AREA')
 print("\nNumber of missing values in REPORTING_AREA: ", num_missing_reporting_area)
 
 # Regarding the 'REPORTING_AREA' column:
@@ -276,8 +180,8 @@ print("\nNumber of missing values in REPORTING_AREA: ", num_missing_reporting_ar
 #%%
 # 7) Analyzing `SHOOTING` Column
 # First, determine the number of unique shooting values present in this column
-unique_shooting_values = crime_data['SHOOTING'].value_counts()
-num_unique_shooting_values = crime_data['SHOOTING'].nunique()
+unique_shooting_values = raw_profile.value_counts('SHOOTING')
+num_unique_shooting_values = raw_profile.nunique('SHOOTING')
 print(unique_shooting_values)
 print(num_unique_shooting_values)
 
@@ -288,23 +192,6 @@ print(num_unique_shooting_values)
 # Then, the column is converted to a categorical data type for efficient storage and processing.
 # This conversion facilitates clearer and more consistent data analysis regarding shooting incidents.
 
-#%%
-# Replace all non-'Y' values in 'SHOOTING' with 'N'
-crime_data['SHOOTING'] = crime_data['SHOOTING'].apply(lambda x: 'N' if x != 'Y' else 'Y')
-
-# Convert 'SHOOTING' column to a categorical data type
-crime_data['SHOOTING'] = crime_data['SHOOTING'].astype('category')
-
-#%%
-# Verify the conversion
-print(crime_data['SHOOTING'].unique())
-print(crime_data['SHOOTING'].dtype)
-
-#%% 
-# Next, check for any missing values in 'SHOOTING' column
-num_missing_shooting = crime_data['SHOOTING'].isnull().sum()
-print("\nNumber of missing values in REPORTING_AREA: ", num_missing_shooting)
-
 # Status of 'SHOOTING' Column
 # It is observed that the `SHOOTING` column contains no missing values,
 # and have only two categories, 'Y' and 'N'.
@@ -312,19 +199,18 @@ print("\nNumber of missing values in REPORTING_AREA: ", num_missing_shooting)
 #%%
 # 8) Analyzing `OCCURRED_ON_DATE` Column (date and time of occurrence of crime)
 # First, determine the number of unique occurences present in this column
-unique_shooting_values = crime_data['OCCURRED_ON_DATE'].value_counts()
-num_unique_shooting_values = crime_data['OCCURRED_ON_DATE'].nunique()
+unique_shooting_values = raw_profile.value_counts('OCCURRED_ON_DATE')
+num_unique_shooting_values = raw_profile.nunique('OCCURRED_ON_DATE')
 print(unique_shooting_values)
 print(num_unique_shooting_values)
 
 #%% 
 # Next, check for any missing values in 'REPORTING_AREA' column
-num_missing_reporting_area = crime_data['REPORTING_AREA'].isnull().sum()
+num_missing_reporting_area = raw_profile.null_count('REPORTING_AREA')
 print("\nNumber of missing values in REPORTING_AREA: ", num_missing_reporting_area)
 
 #%%
-crime_data['OCCURRED_ON_DATE'].info()
-crime_data['OCCURRED_ON_DATE'].describe()
+print(raw_profile.describe('OCCURRED_ON_DATE'))
 
 # Status of 'OCCURRED_ON_DATE' Column
 # Currently, the 'OCCURRED_ON_DATE' column has no missing values, and its data type is appropriate for analysis.
@@ -333,24 +219,17 @@ crime_data['OCCURRED_ON_DATE'].describe()
 #%%
 # 9) Analyzing `YEAR` Column
 # First, determine the number of unique YEAR's present in this column
-unique_year = crime_data['YEAR'].value_counts()
-num_unique_years = crime_data['YEAR'].nunique()
+unique_year = raw_profile.value_counts('YEAR')
+num_unique_years = raw_profile.nunique('YEAR')
 print(unique_year)
 print(num_unique_years)
 
 #%% 
 # Next, check for any missing values in 'YEAR' column
-num_missing_year = crime_data['YEAR'].isnull().sum()
+num_missing_year = raw_profile.null_count('YEAR')
 print("\nNumber of missing values in YEAR: ", num_missing_year)
 print(crime_data['YEAR'].dtype)
 
-# %%
-# Convert 'YEAR' column to a categorical data type
-crime_data['YEAR'] = crime_data['YEAR'].astype('category')
-
-# Optionally, to verify the conversion, you can check the data type again
-print(crime_data['YEAR'].dtype)
-
 # Status of the 'YEAR' Column
 # The 'YEAR' column currently has no missing values and is stored as a categorical data type. 
 # This format is chosen due to its utility in grouping, visualizing, and summarizing the data effectively.
@@ -360,19 +239,18 @@ print(crime_data['YEAR'].dtype)
 # %%
 # 10) Analyzing `MONTH` Column
 # First, determine the number of unique MONTH's present in this column
-unique_month = crime_data['MONTH'].value_counts()
-num_unique_months = crime_data['MONTH'].nunique()
+unique_month = raw_profile.value_counts('MONTH')
+num_unique_months = raw_profile.nunique('MONTH')
 print(unique_month)
 print(num_unique_months)
 
 # %%
 # Sanity check
-crime_data['MONTH'].info()
-crime_data['MONTH'].describe()
+print(raw_profile.describe('MONTH'))
 
 # %%
 # Next, check for any missing values in 'MONTH' column
-num_missing_month = crime_data['MONTH'].isnull().sum()
+num_missing_month = raw_profile.null_count('MONTH')
 print("\nNumber of missing values in MONTH: ", num_missing_month)
 
 # Status of the 'MONTH' Column
@@ -383,19 +261,18 @@ print("\nNumber of missing values in MONTH: ", num_missing_month)
 # %%
 # 11) Analyzing `DAY_OF_WEEK` Column
 # First, determine the number of unique values present in this column
-unique_day = crime_data['DAY_OF_WEEK'].value_counts()
-num_unique_day = crime_data['DAY_OF_WEEK'].nunique()
+unique_day = raw_profile.value_counts('DAY_OF_WEEK')
+num_unique_day = raw_profile.nunique('DAY_OF_WEEK')
 print(unique_day)
 print(num_unique_day)
 
 # %%
 # Sanity check
-crime_data['DAY_OF_WEEK'].info()
-crime_data['DAY_OF_WEEK'].describe()
+print(raw_profile.describe('DAY_OF_WEEK'))
 
 # %%
 # Next, check for any missing values in 'DAY_OF_WEEK' column
-num_missing_day = crime_data['DAY_OF_WEEK'].isnull().sum()
+num_missing_day = raw_profile.null_count('DAY_OF_WEEK')
 print("\nNumber of missing values in DAY_OF_WEEK: ", num_missing_day)
 
 # Converting 'DAY_OF_WEEK' Column to Categorical Type
@@ -405,11 +282,6 @@ print("\nNumber of missing values in DAY_OF_WEEK: ", num_missing_day)
 # It clearly defines the column as containing a limited and fixed set of values (the days of the week),
 # which is semantically more appropriate for a categorical variable.
 # This conversion is expected to facilitate more efficient and effective data analysis involving days of the week.
-#%%
-crime_data['DAY_OF_WEEK'] = crime_data['DAY_OF_WEEK'].astype('category')
-
-# Verify the conversion
-print(crime_data['DAY_OF_WEEK'].dtype)
 
 # Status of the 'DAY_OF_WEEK' Column
 # The 'MONTH' column in the dataset is complete with no missing values.
@@ -418,19 +290,18 @@ print(crime_data['DAY_OF_WEEK'].dtype)
 # %%
 # 12) Analyzing `HOUR` Column
 # First, determine the number of unique values present in this column
-unique_HOUR = crime_data['HOUR'].value_counts()
-num_unique_HOUR = crime_data['HOUR'].nunique()
+unique_HOUR = raw_profile.value_counts('HOUR')
+num_unique_HOUR = raw_profile.nunique('HOUR')
 print(unique_HOUR)
 print(num_unique_HOUR)
 
 # %%
 # Sanity check
-crime_data['HOUR'].info()
-crime_data['HOUR'].describe()
+print(raw_profile.describe('HOUR'))
 
 # %%
 # Next, check for any missing values in 'HOUR' column
-num_missing_HOUR = crime_data['HOUR'].isnull().sum()
+num_missing_HOUR = raw_profile.null_count('HOUR')
 print("\nNumber of missing values in HOUR: ", num_missing_HOUR)
 
 # Status of the 'HOUR' Column
@@ -443,19 +314,18 @@ print("\nNumber of missing values in HOUR: ", num_missing_HOUR)
 #%%
 # 13) Analyzing 'UCR_PART' column
 # First, determine the number of unique values present in this column
-unique_UCR_PART = crime_data['UCR_PART'].value_counts()
-num_unique_UCR_PART = crime_data['UCR_PART'].nunique()
+unique_UCR_PART = raw_profile.value_counts('UCR_PART')
+num_unique_UCR_PART = raw_profile.nunique('UCR_PART')
 print(unique_UCR_PART)
 print(num_unique_UCR_PART)
 
 #%%
 # Sanity check
-crime_data['UCR_PART'].info()
-crime_data['UCR_PART'].describe()
+print(raw_profile.describe('UCR_PART'))
 
 # %%
 # Next, check for any missing values in 'UCR_PART' column
-num_missing_UCR_PART = crime_data['UCR_PART'].isnull().sum()
+num_missing_UCR_PART = raw_profile.null_count('UCR_PART')
 print("\nNumber of missing values in UCR_PART: ", num_missing_UCR_PART)
 
 # There are 90 missing values in UCR_PART
@@ -481,87 +351,21 @@ print(offense_code_for_missing_UCR_PART.value_counts())
 # which generally encompasses less severe offenses.
 # This classification is crucial for understanding the severity and nature of the crimes represented in the dataset.
 
-#%%
-# User defined function for imputing
-def impute_ucr_part_subset(data, subset):
-    """
-    Impute missing UCR_PART values in a subset of the DataFrame based on OFFENSE_CODE_GROUP.
-    
-    :param data: pandas DataFrame containing 'UCR_PART' and 'OFFENSE_CODE_GROUP' columns
-    :param subset: Series containing the OFFENSE_CODE_GROUPs of rows with missing UCR_PART
-    """
-    # Mapping from OFFENSE_CODE_GROUP to UCR_PART
-    ucr_part_mapping = {
-        'HUMAN TRAFFICKING': 'Part One',
-        'HUMAN TRAFFICKING - INVOLUNTARY SERVITUDE': 'Part One',
-        'HOME INVASION': 'Part One',
-        'INVESTIGATE PERSON': 'Part Three'
-    }
-
-    # Find the indices in the main DataFrame that correspond to the subset
-    indices_to_impute = subset.index
-
-    # Impute missing UCR_PART values in the subset
-    for index in indices_to_impute:
-        offense_code_group = data.at[index, 'OFFENSE_CODE_GROUP']
-        if offense_code_group in ucr_part_mapping:
-            data.at[index, 'UCR_PART'] = ucr_part_mapping[offense_code_group]
-
-# Call the function
-impute_ucr_part_subset(crime_data, offense_code_for_missing_UCR_PART)
-
-# Check the results for the imputed subset
-print(crime_data.loc[offense_code_for_missing_UCR_PART.index][['OFFENSE_CODE_GROUP', 'UCR_PART']])
-
-#%% 
-# Verify the change
-unique_UCR_PART = crime_data['UCR_PART'].value_counts()
-num_unique_UCR_PART = crime_data['UCR_PART'].nunique()
-print(unique_UCR_PART)
-print(num_unique_UCR_PART)
-
-num_missing_UCR_PART = crime_data['UCR_PART'].isnull().sum()
-print("\nNumber of missing values in UCR_PART: ", num_missing_UCR_PART)
-
-
-# %%
-# Converting 'UCR_PART' Column to Categorical Type
-# because it simplifies operations like sorting, grouping, and filtering, based on UCR_PART, making them faster and more intuitive.
-# Change the data type 
-#%%
-crime_data['UCR_PART'] = crime_data['UCR_PART'].astype('category')
-
-#%%
-# Verify the conversion
-print(crime_data['UCR_PART'].dtype)
-
-# Status of the 'UCR_PART' Column
-# The 'UCR_PART' column in the dataset currently has no missing values.
-# Additionally, the data type of this column is appropriate for the kind of information it represents.
-
 # %%
 # 14) Analyzing `STREET` Column
 # First, determine the number of unique values present in this column
-unique_street = crime_data['STREET'].value_counts()
-num_unique_street = crime_data['STREET'].nunique()
+unique_street = raw_profile.value_counts('STREET')
+num_unique_street = raw_profile.nunique('STREET')
 print(unique_street)
 print(num_unique_street)
 
 # %%
 # Sanity check
-crime_data['STREET'].info()
-crime_data['STREET'].describe()
-
-#%% Convert the data type to 'STRING'
-crime_data['STREET'] = crime_data['STREET'].astype('string')
-
-#%%
-# Verify the change
-print(crime_data['STREET'].dtype)
+print(raw_profile.describe('STREET'))
 
 # %%
 # Next, check for any missing values in 'STREET' column
-num_missing_STREET = crime_data['STREET'].isnull().sum()
+num_missing_STREET = raw_profile.null_count('STREET')
 print("\nNumber of missing values in STREET: ", num_missing_STREET)
 
 # Handling Missing Values in 'STREET' Column
@@ -570,9 +374,65 @@ print("\nNumber of missing values in STREET: ", num_missing_STREET)
 # we categorize them as 'Not specified'. This allows us to maintain the integrity of the dataset 
 # while acknowledging the absence of certain location details.
 
+# State of the 'STREET' Column
+# There are no missing values present in the 'STREET' column of the dataset.
+# Additionally, the data type of the 'STREET' column is appropriately set as a string, which is ideal for textual street name data.
+
 #%%
-# Replace missing values in 'STREET' with 'Not specified'
-crime_data['STREET'].fillna('Not Specified', inplace=True)
+# Cleaning pipeline
+# The column rules decided above are declared once in CRIME_CLEANING_PIPELINE (cleaning.py), shared by project.py and SMARTQ.py:
+# - 'OFFENSE_CODE' is converted to a categorical data type, 'OFFENSE_CODE_GROUP' and 'OFFENSE_DESCRIPTION' to string
+# - the missing 'DISTRICT' values are imputed with the most common district of their 'REPORTING_AREA', looked up in the table
+#   with a single vectorized map (most_common_district_table and impute_district)
+# - the district codes are replaced by their names by renaming the categories of the column, once per distinct code
+# - all non-'Y' values in 'SHOOTING' are replaced with 'N' and the column is converted to a categorical data type
+# - 'YEAR' and 'DAY_OF_WEEK' are converted to a categorical data type
+# - the missing 'UCR_PART' values are imputed from 'OFFENSE_CODE_GROUP' with a rule table derived from the rows that already
+#   have a 'UCR_PART', extended with the classification above for the groups that never have one (UCR_PART_MAPPING),
+#   in a single vectorized assignment (impute_ucr_part), then the column is converted to a categorical data type
+# - 'STREET' is converted to string and its missing values are replaced with 'Not Specified'
+# The rules on the same column are fused, so each column is processed in one pass, and the wall time of every
+# step is reported (run(crime_data, memory=True) also reports the memory delta of every column, at the cost of
+# scanning the text columns twice more).
+from cleaning import CRIME_CLEANING_PIPELINE
+crime_data, cleaning_report = CRIME_CLEANING_PIPELINE.run(crime_data)
+
+#%%
+# Verify the conversions
+print(crime_data.dtypes)
+
+#%%
+# Verify the imputation and the district names
+num_missing_districts = crime_data['DISTRICT'].isnull().sum()
+print("\nNumber of missing values in DISTRICT: ", num_missing_districts)
+unique_districts = crime_data['DISTRICT'].value_counts()
+num_unique_dstricts = crime_data['DISTRICT'].nunique()
+print("\nUnique Districts count: ", unique_districts)
+print("\nNumber of Unique Districts: ", num_unique_dstricts)
+
+#%%
+# Verify the 'SHOOTING' conversion
+print(crime_data['SHOOTING'].unique())
+print(crime_data['SHOOTING'].dtype)
+
+#%% 
+# Next, check for any missing values in 'SHOOTING' column
+num_missing_shooting = crime_data['SHOOTING'].isnull().sum()
+print("\nNumber of missing values in REPORTING_AREA: ", num_missing_shooting)
+
+#%%
+# Check the results for the imputed subset of 'UCR_PART'
+print(crime_data.loc[offense_code_for_missing_UCR_PART.index][['OFFENSE_CODE_GROUP', 'UCR_PART']])
+
+#%% 
+# Verify the change
+unique_UCR_PART = crime_data['UCR_PART'].value_counts()
+num_unique_UCR_PART = crime_data['UCR_PART'].nunique()
+print(unique_UCR_PART)
+print(num_unique_UCR_PART)
+
+num_missing_UCR_PART = crime_data['UCR_PART'].isnull().sum()
+print("\nNumber of missing values in UCR_PART: ", num_missing_UCR_PART)
 
 #%%
 # Verify the operation
@@ -580,10 +440,6 @@ print(crime_data['STREET'].value_counts())
 num_missing_STREET = crime_data['STREET'].isnull().sum()
 print("\nNumber of missing values in STREET: ", num_missing_STREET)
 
-# State of the 'STREET' Column
-# There are no missing values present in the 'STREET' column of the dataset.
-# Additionally, the data type of the 'STREET' column is appropriately set as a string, which is ideal for textual street name data.
-
 
 # II) Exploratory Data Analysis 
 
@@ -591,17 +447,24 @@ print("\nNumber of missing values in STREET: ", num_missing_STREET)
 
 
 
+#%%
+# Count cube of the incidents over the chart dimensions, built once
+# The histograms below are drawn from roll-ups of the cube, weighted by the counts,
+# instead of binning every incident row again for every chart
+from cube import CountCube
+crime_cube = CountCube(crime_data)
+
 #%%
 #SMART QUESTIONS 
 # 1
 # Can we identify patterns or trends in the nature of 
 # crime over the years?
 
-top_categories = crime_data['OFFENSE_CODE_GROUP'].value_counts().nlargest(5).index
+top_categories = crime_cube.value_counts('OFFENSE_CODE_GROUP').head(5).index
 
-filtered_data = crime_data[crime_data['OFFENSE_CODE_GROUP'].isin(top_categories)]
+top_offenses = {'OFFENSE_CODE_GROUP': top_categories}
 
-sns.histplot(data=filtered_data, x="OFFENSE_CODE_GROUP", y="YEAR", hue="OFFENSE_CODE_GROUP", bins='auto').set(title='Histogram of Crime over the Years')
+sns.histplot(data=crime_cube.rollup(['OFFENSE_CODE_GROUP', 'YEAR'], where=top_offenses).reset_index(), x="OFFENSE_CODE_GROUP", y="YEAR", hue="OFFENSE_CODE_GROUP", weights='count', bins='auto').set(title='Histogram of Crime over the Years')
 plt.xticks(rotation=45)
 
 plt.show()
@@ -617,12 +480,12 @@ plt.show()
 #shows the days of the week the crime was higher 
 
 #day of the week most crime comitted 
-sns.histplot(crime_data, x="DAY_OF_WEEK").set(title='Histogram of Day of the week with the most crimes committed')
+sns.histplot(crime_cube.rollup('DAY_OF_WEEK').reset_index(), x="DAY_OF_WEEK", weights='count').set(title='Histogram of Day of the week with the most crimes committed')
 plt.xticks(rotation=45)
 
 #%%
 #year break down of committed crimes
-sns.histplot(data = crime_data, x = "YEAR").set(title='Histogram of Year with the most crimes committed')
+sns.histplot(data = crime_cube.rollup('YEAR').reset_index(), x = "YEAR", weights = 'count').set(title='Histogram of Year with the most crimes committed')
 plt.xticks(rotation=45)
 
 
@@ -631,13 +494,13 @@ plt.xticks(rotation=45)
 # %%
 
 #district where most crime was comitted 
-sns.histplot(data = crime_data, x = "DISTRICT").set(title='Histogram of District with the most crimes committed')
+sns.histplot(data = crime_cube.rollup('DISTRICT').reset_index(), x = "DISTRICT", weights = 'count').set(title='Histogram of District with the most crimes committed')
 plt.xticks(rotation=45)
 
 
 
 # %%
-sns.histplot(filtered_data, x="OFFENSE_CODE_GROUP", y="YEAR")
+sns.histplot(crime_cube.rollup(['OFFENSE_CODE_GROUP', 'YEAR'], where=top_offenses).reset_index(), x="OFFENSE_CODE_GROUP", y="YEAR", weights='count')
 plt.xticks(rotation=45)
 
 # %%
@@ -658,7 +521,7 @@ sns.lineplot(data=crime_data, x="OFFENSE_CODE_GROUP", y="YEAR", orient="y")
 #Are there certain locations that have a higher or more 
 # violent crime rate compared to other areas of Boston?
 
-sns.histplot(data=filtered_data, x="OFFENSE_CODE_GROUP", y="DISTRICT").set(title='Histogram of crime in District vs the nature of crime')
+sns.histplot(data=crime_cube.rollup(['OFFENSE_CODE_GROUP', 'DISTRICT'], where=top_offenses).reset_index(), x="OFFENSE_CODE_GROUP", y="DISTRICT", weights='count').set(title='Histogram of crime in District vs the nature of crime')
 plt.xticks(rotation=45)
 
 
@@ -667,7 +530,7 @@ plt.xticks(rotation=45)
 # Can we identify relationships between the type of offense, 
 # their specific district locations, and the
 # time variables (day of the week, hour) within the dataset?
-sns.histplot(data=filtered_data, x="OFFENSE_CODE_GROUP", y="DISTRICT", hue = "HOUR").set(title='Histogram of offense type, district, and hour')
+sns.histplot(data=crime_cube.rollup(['OFFENSE_CODE_GROUP', 'DISTRICT', 'HOUR'], where=top_offenses).reset_index(), x="OFFENSE_CODE_GROUP", y="DISTRICT", hue = "HOUR", weights='count').set(title='Histogram of offense type, district, and hour')
 plt.xticks(rotation=80)
 
 
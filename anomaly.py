@@ -0,0 +1,216 @@
+#%%
+# Streaming detection of abnormal daily counts per district and offense group
+# Every series (by default a DISTRICT x OFFENSE_CODE_GROUP pair) keeps a handful of numbers: the count of the
+# current day, an exponentially weighted mean and variance of its daily counts for every day of the week (the
+# seasonal baseline) and a CUSUM statistic of the standardized daily counts. An arriving incident only increments
+# the count of its series. When a day is over, the CUSUM and the baselines of all the series are updated at once
+# with array operations, and the series whose CUSUM crosses the threshold raise an alarm. The state is saved to
+# and restored from a pickle checkpoint, so the detector can follow a daily feed across runs.
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# Dimensions of the monitored series
+ANOMALY_DIMENSIONS = ['DISTRICT', 'OFFENSE_CODE_GROUP']
+
+# Weight of a new day in the baselines, the CUSUM allowance and alarm threshold in standard deviations
+DEFAULT_SMOOTHING = 0.1
+DEFAULT_SLACK = 0.5
+DEFAULT_THRESHOLD = 4.0
+
+# Number of days a series is observed before it can raise alarms
+WARMUP_DAYS = 28
+
+# Smallest variance of a daily count, so rare series do not alarm on a single incident
+MIN_VARIANCE = 0.5
+
+ALARM_COLUMNS = ['day', 'count', 'expected', 'z_score', 'cusum']
+
+
+def _grow(values, capacity):
+    # Copy of an array with more rows, the new rows are zeros
+    grown = np.zeros((capacity,) + values.shape[1:], dtype=values.dtype)
+    grown[:len(values)] = values
+    return grown
+
+
+class AnomalyDetector:
+    """
+    EWMA baselines per day of week and CUSUM alarms on the daily counts of many series.
+
+    :param dimensions: list of the columns identifying a series
+    :param where: optional dict of {column: label or list of labels}, only the matching incidents are counted,
+                  for example {'SHOOTING': 'Y'}
+    :param smoothing: weight of a new day in the baselines
+    :param slack: CUSUM allowance, in standard deviations
+    :param threshold: CUSUM alarm threshold, in standard deviations
+    :param warmup_days: number of days a series is observed before it can raise alarms
+    """
+
+    def __init__(self, dimensions=ANOMALY_DIMENSIONS, where=None, smoothing=DEFAULT_SMOOTHING, slack=DEFAULT_SLACK,
+                 threshold=DEFAULT_THRESHOLD, warmup_days=WARMUP_DAYS):
+        self.dimensions = list(dimensions)
+        self.where = where or {}
+        self.smoothing, self.slack, self.threshold, self.warmup_days = smoothing, slack, threshold, warmup_days
+
+        # Series ids by key, and the state of every series in arrays grown by doubling
+        self.ids, self.keys = {}, []
+        self.mean = np.zeros((0, 7))
+        self.variance = np.zeros((0, 7))
+        self.observed = np.zeros((0, 7), dtype=np.int64)
+        self.cusum = np.zeros(0)
+        self.today = np.zeros(0, dtype=np.int64)
+        # Current day as a number of days since 1970-01-01, None before the first incident
+        self.day = None
+        self.late = 0
+
+    def _series_id(self, key):
+        # Id of a series, created on its first incident
+        if key not in self.ids:
+            if len(self.keys) == len(self.cusum):
+                capacity = max(2 * len(self.cusum), 16)
+                self.mean, self.variance, self.observed, self.cusum, self.today = [
+                    _grow(values, capacity) for values in (self.mean, self.variance, self.observed, self.cusum, self.today)]
+            self.ids[key] = len(self.keys)
+            self.keys.append(key)
+        return self.ids[key]
+
+    def _close_day(self):
+        # Update the CUSUM and the baselines of every series with the counts of the current day, then open the next day
+        n = len(self.keys)
+        weekday = (self.day + 3) % 7  # 1970-01-01 was a Thursday
+        count = self.today[:n].astype(np.float64)
+        mean, variance, observed = self.mean[:n, weekday], self.variance[:n, weekday], self.observed[:n, weekday]
+
+        z_score = (count - mean) / np.sqrt(np.maximum(np.maximum(variance, mean), MIN_VARIANCE))
+        active = self.observed[:n].sum(axis=1) >= self.warmup_days
+        cusum = np.where(active, np.maximum(0, self.cusum[:n] + z_score - self.slack), 0)
+        alarm = np.flatnonzero(cusum > self.threshold)
+        alarms = None
+        if len(alarm):
+            alarms = pd.DataFrame([self.keys[i] for i in alarm], columns=self.dimensions)
+            alarms['day'] = pd.Timestamp(self.day, unit='D').as_unit('ns')
+            alarms['count'] = count[alarm].astype(np.int64)
+            alarms['expected'], alarms['z_score'], alarms['cusum'] = mean[alarm], z_score[alarm], cusum[alarm]
+        # The CUSUM restarts after an alarm
+        cusum[alarm] = 0
+        self.cusum[:n] = cusum
+
+        # Exponentially weighted mean and variance, averaging the first days equally
+        weight = np.maximum(self.smoothing, 1 / (observed + 1))
+        delta = count - mean
+        self.mean[:n, weekday] = mean + weight * delta
+        self.variance[:n, weekday] = (1 - weight) * (variance + weight * delta ** 2)
+        self.observed[:n, weekday] = observed + 1
+        self.today[:n] = 0
+        self.day += 1
+        return alarms
+
+    def _advance(self, day):
+        # Close the days before a day, the alarms of all of them
+        alarms = []
+        if self.day is None:
+            self.day = day
+        while self.day < day:
+            day_alarms = self._close_day()
+            if day_alarms is not None:
+                alarms.append(day_alarms)
+        return alarms
+
+    def _alarms(self, alarms):
+        # One DataFrame of the alarms of several days
+        if not alarms:
+            empty = pd.DataFrame(columns=self.dimensions + ALARM_COLUMNS)
+            return empty.astype({'day': 'datetime64[ns]', 'count': np.int64, 'expected': np.float64,
+                                 'z_score': np.float64, 'cusum': np.float64})
+        return pd.concat(alarms, ignore_index=True)
+
+    def add(self, key, time):
+        """
+        Count one arriving incident, the incidents must arrive in time order (the earlier days are over).
+
+        :param key: tuple of the values of the dimensions of the incident
+        :param time: time of the incident
+        :return: pandas DataFrame of the alarms of the days closed by this incident, None when no day was closed
+        """
+        day = int(np.datetime64(time, 'D').astype(np.int64))
+        closed = self.day is not None and day > self.day
+        alarms = self._advance(day)
+        if day < self.day:
+            self.late += 1
+        else:
+            # The id first, creating a series can replace the arrays
+            series = self._series_id(tuple(key))
+            self.today[series] += 1
+        return self._alarms(alarms) if closed else None
+
+    def update(self, data, time='OCCURRED_ON_DATE'):
+        """
+        Count a batch of incidents in time order, closing the days it goes past.
+
+        The days are moved forward to the last day of the batch even when none of its incidents match `where`.
+
+        :param data: pandas DataFrame of incidents with the dimension columns and the time column
+        :param time: name of the time column
+        :return: pandas DataFrame of the alarms of the closed days
+        """
+        batch_days = pd.to_datetime(data[time]).dropna()
+        last_day = int(np.datetime64(batch_days.max(), 'D').astype(np.int64)) if len(batch_days) else None
+        for col, values in self.where.items():
+            data = data[data[col].isin(values if isinstance(values, (list, tuple, set)) else [values])]
+        data = data[data[time].notna() & data[self.dimensions].notna().all(axis=1)]
+        alarms = []
+        if len(data):
+            days = pd.to_datetime(data[time]).to_numpy(dtype='datetime64[D]').astype(np.int64)
+            codes, keys = pd.MultiIndex.from_frame(data[self.dimensions]).factorize()
+
+            if self.day is not None:
+                self.late += int((days < self.day).sum())
+                codes, days = codes[days >= self.day], days[days >= self.day]
+            order = np.argsort(days, kind='stable')
+            codes, days = codes[order], days[order]
+            # Series ids by code, a series is created on the day of its first incident as with add()
+            ids = np.full(len(keys), -1, dtype=np.int64)
+            unique_days, starts = np.unique(days, return_index=True)
+            for day, start, end in zip(unique_days, starts, np.append(starts[1:], len(days))):
+                alarms += self._advance(int(day))
+                day_codes = codes[start:end]
+                for code in pd.unique(day_codes[ids[day_codes] < 0]):
+                    ids[code] = self._series_id(keys[code])
+                self.today[:len(self.keys)] += np.bincount(ids[day_codes], minlength=len(self.keys))
+        if last_day is not None and (self.day is None or last_day > self.day):
+            alarms += self._advance(last_day)
+        return self._alarms(alarms)
+
+    def close_day(self, day=None):
+        """
+        Close a day at the end of a daily feed, the next incidents are counted from the following day.
+
+        :param day: calendar day of the feed, the days up to and including it are closed, the current day when None
+        :return: pandas DataFrame of the alarms of the closed days
+        """
+        if day is None:
+            if self.day is None:
+                return self._alarms([])
+            alarms = self._close_day()
+            return self._alarms([alarms] if alarms is not None else [])
+
+        day = int(np.datetime64(pd.Timestamp(day), 'D').astype(np.int64))
+        return self._alarms(self._advance(day + 1))
+
+    def save(self, path):
+        """
+        :param path: path of the pickle file the state is written to
+        """
+        with open(path, 'wb') as file:
+            pickle.dump(self, file)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: path of a pickle file written by save()
+        :return: AnomalyDetector
+        """
+        with open(path, 'rb') as file:
+            return pickle.load(file)
@@ -0,0 +1,186 @@
+#%%
+# Batched chi-squared tests of independence between categorical features and a target
+# The bivariate analysis used to build a pd.crosstab and call chi2_contingency for one column at a time.
+# Here every contingency table is counted from the integer codes of the columns with np.bincount, all
+# the tables are stacked row-wise into one array and the statistics of all of them are computed at once.
+# Tables with small expected counts, where the chi-squared approximation is unreliable, can get
+# permutation p-values instead; those are sampled with fixed margins and spread over a process pool.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+
+from parallel import worker_count
+
+# Expected count below which a table is considered sparse
+SPARSE_EXPECTED_COUNT = 5
+
+
+def _codes(values):
+    # Integer codes of a column and the labels they refer to, missing values get the code -1
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy().astype(np.int64), values.cat.categories
+    codes, labels = pd.factorize(values, sort=True)
+    return codes.astype(np.int64), labels
+
+
+def contingency_table(values, target_codes, n_targets):
+    """
+    Count the contingency table of a column against the integer codes of the target.
+
+    :param values: pandas Series of the feature
+    :param target_codes: numpy array of the target codes, -1 for missing values
+    :param n_targets: number of target labels
+    :return: tuple of (2D numpy array of counts, labels of the rows), the rows that never occur are dropped like in pd.crosstab
+    """
+    codes, labels = _codes(values)
+    valid = (codes >= 0) & (target_codes >= 0)
+    counts = np.bincount(codes[valid] * n_targets + target_codes[valid],
+                         minlength=len(labels) * n_targets).reshape(len(labels), n_targets)
+    observed = counts.sum(axis=1) > 0
+    return counts[observed], labels[observed]
+
+
+def _chi_squared_statistics(rows, table_ids, n_tables, correction=True):
+    # Pearson statistics of many tables stacked row-wise, rows[i] belongs to the table table_ids[i]
+    rows = rows.astype(np.float64)
+    n_targets = rows.shape[1]
+    row_sums = rows.sum(axis=1)
+    col_sums = np.zeros((n_tables, n_targets))
+    np.add.at(col_sums, table_ids, rows)
+    totals = col_sums.sum(axis=1)
+
+    # Degrees of freedom count only the rows and target labels that occur in the table
+    n_rows = np.bincount(table_ids, weights=row_sums > 0, minlength=n_tables)
+    n_cols = (col_sums > 0).sum(axis=1)
+    dof = np.maximum(n_rows - 1, 0) * np.maximum(n_cols - 1, 0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        expected = row_sums[:, None] * col_sums[table_ids] / totals[table_ids, None]
+        difference = rows - expected
+        # Yates' continuity correction for the tables with one degree of freedom, as in chi2_contingency
+        if correction:
+            corrected = (dof == 1)[table_ids]
+            difference[corrected] = np.sign(difference[corrected]) * np.maximum(np.abs(difference[corrected]) - 0.5, 0)
+        terms = np.where(expected > 0, difference ** 2 / expected, 0)
+
+    statistics = np.bincount(table_ids, weights=terms.sum(axis=1), minlength=n_tables)
+    statistics[dof == 0] = 0
+
+    min_expected = np.full(n_tables, np.inf)
+    np.minimum.at(min_expected, table_ids, np.where(expected > 0, expected, np.inf).min(axis=1))
+
+    p_values = np.where(dof > 0, chi2.sf(statistics, np.maximum(dof, 1)), 1.0)
+    return statistics, p_values, dof.astype(np.int64), totals.astype(np.int64), min_expected
+
+
+def _permutation_exceedances(tables, permutations, seed):
+    # Number of random tables with the same margins whose statistic reaches the observed one, for every table.
+    # A random permutation of the target gives a table drawn row by row from multivariate hypergeometric
+    # distributions, so the cost depends on the size of the table and not on the number of rows.
+    rng = np.random.default_rng(seed)
+    exceedances = []
+    for table, observed in tables:
+        row_sums, col_sums = table.sum(axis=1), table.sum(axis=0)
+        expected = np.outer(row_sums, col_sums) / table.sum()
+        remaining = np.tile(col_sums, (permutations, 1))
+        statistics = np.zeros(permutations)
+
+        for i, row_sum in enumerate(row_sums):
+            if i == len(row_sums) - 1:
+                counts = remaining
+            else:
+                counts = np.zeros_like(remaining)
+                left = np.full(permutations, row_sum)
+                for j in range(len(col_sums) - 1):
+                    counts[:, j] = rng.hypergeometric(remaining[:, j], remaining[:, j + 1:].sum(axis=1), left)
+                    left = left - counts[:, j]
+                counts[:, -1] = left
+                remaining = remaining - counts
+            with np.errstate(divide='ignore', invalid='ignore'):
+                statistics += np.where(expected[i] > 0, (counts - expected[i]) ** 2 / expected[i], 0).sum(axis=1)
+
+        exceedances.append(int((statistics >= observed * (1 - 1e-12)).sum()))
+    return np.array(exceedances, dtype=np.int64)
+
+
+def _permutation_p_values(tables, permutations, n_jobs, random_state):
+    # Permutation p-values of the Pearson statistic, the permutations are split over a process pool
+    if not tables:
+        return np.zeros(0)
+
+    n_jobs = worker_count(n_jobs)
+    seeds = np.random.SeedSequence(random_state).spawn(n_jobs)
+    chunks = [permutations // n_jobs + (worker < permutations % n_jobs) for worker in range(n_jobs)]
+
+    if n_jobs == 1:
+        exceedances = _permutation_exceedances(tables, chunks[0], seeds[0])
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_permutation_exceedances, tables, chunk, seed)
+                       for chunk, seed in zip(chunks, seeds) if chunk > 0]
+            exceedances = sum(future.result() for future in futures)
+
+    return (exceedances + 1) / (permutations + 1)
+
+
+def _test_tables(tables, names, permutations, n_jobs, random_state):
+    # Statistics of a list of contingency tables, with permutation p-values for the sparse ones
+    rows = np.vstack(tables)
+    table_ids = np.repeat(np.arange(len(tables)), [len(table) for table in tables])
+    statistics, p_values, dof, totals, min_expected = _chi_squared_statistics(rows, table_ids, len(tables))
+
+    results = pd.DataFrame({'chi2': statistics, 'p_value': p_values, 'dof': dof, 'n': totals,
+                            'min_expected': min_expected, 'sparse_table': min_expected < SPARSE_EXPECTED_COUNT},
+                           index=names)
+
+    if permutations:
+        sparse = np.flatnonzero(results['sparse_table'].to_numpy() & (dof > 0))
+        pearson, _, _, _, _ = _chi_squared_statistics(rows, table_ids, len(tables), correction=False)
+        permutation_tables = [(tables[i], pearson[i]) for i in sparse]
+        results['permutation_p_value'] = np.nan
+        results.iloc[sparse, results.columns.get_loc('permutation_p_value')] = \
+            _permutation_p_values(permutation_tables, permutations, n_jobs, random_state)
+
+    return results
+
+
+def chi_squared_tests(data, columns, target='SHOOTING', permutations=0, n_jobs=None, random_state=0):
+    """
+    Chi-squared test of independence of every column against the target, like chi2_contingency on pd.crosstab.
+
+    :param data: pandas DataFrame containing the columns and the target
+    :param columns: list of categorical columns to test
+    :param target: name of the target column
+    :param permutations: number of permutations for the p-values of the sparse tables, none when 0
+    :param n_jobs: number of worker processes for the permutations, parallel.worker_count() when None
+    :param random_state: seed of the permutations
+    :return: pandas DataFrame indexed by column with the statistic, p-value, degrees of freedom, number of
+             rows, smallest expected count, whether the table is sparse and the permutation p-value if requested
+    """
+    target_codes, target_labels = _codes(data[target])
+    tables = [contingency_table(data[col], target_codes, len(target_labels))[0] for col in columns]
+    return _test_tables(tables, pd.Index(columns, name='feature'), permutations, n_jobs, random_state)
+
+
+def level_chi_squared_tests(data, column, target='SHOOTING', permutations=0, n_jobs=None, random_state=0):
+    """
+    Chi-squared test of every level of a column against the target, each level against all the others.
+
+    All the 2 x k tables are derived from the single contingency table of the column, so a column with
+    thousands of levels (for example OFFENSE_CODE or STREET) is counted once.
+
+    :param data: pandas DataFrame containing the column and the target
+    :param column: name of the categorical column whose levels are tested
+    :param target: name of the target column
+    :param permutations: number of permutations for the p-values of the sparse tables, none when 0
+    :param n_jobs: number of worker processes for the permutations, parallel.worker_count() when None
+    :param random_state: seed of the permutations
+    :return: pandas DataFrame indexed by level with the same columns as chi_squared_tests
+    """
+    target_codes, target_labels = _codes(data[target])
+    table, labels = contingency_table(data[column], target_codes, len(target_labels))
+    rest = table.sum(axis=0) - table
+    tables = list(np.stack([table, rest], axis=1))
+    return _test_tables(tables, pd.Index(labels, name=column), permutations, n_jobs, random_state)
@@ -0,0 +1,243 @@
+#%%
+# Reusable data cleaning components for the crime dataset
+# These functions replace the row-by-row loops of the cleaning section with vectorized
+# pandas/numpy operations, so they stay fast on the full incident history.
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def find_multi_offense_incidents(data, id_column='INCIDENT_NUMBER'):
+    """
+    Find the incidents that have more than one distinct entry (for example several offenses).
+
+    Every row is hashed over all columns except the incident number, and the number of
+    distinct hashes is counted per incident. This gives the same result as grouping by the
+    incident number and calling drop_duplicates on every group, without the Python loop.
+
+    :param data: pandas DataFrame containing the incident number column
+    :param id_column: name of the incident number column
+    :return: tuple of (number of incidents with multiple distinct entries, sorted Index of those incident numbers)
+    """
+    row_hashes = pd.util.hash_pandas_object(data.drop(columns=[id_column]), index=False)
+
+    distinct_entries = pd.DataFrame({id_column: data[id_column].to_numpy(),
+                                     'row_hash': row_hashes.to_numpy()}).drop_duplicates()
+    entries_per_incident = distinct_entries[id_column].value_counts()
+
+    multi_offense_incidents = entries_per_incident.index[entries_per_incident > 1].sort_values()
+    return len(multi_offense_incidents), multi_offense_incidents
+
+
+# Mapping of district codes to the district names used by the Boston Police Department
+DISTRICT_NAME_MAPPING = {
+    'A1': 'Downtown',
+    'A15': 'Charlestown',
+    'A7': 'East Boston',
+    'B2': 'Roxbury',
+    'B3': 'Mattapan',
+    'C6': 'South Boston',
+    'C11': 'Dorchester',
+    'D4': 'South End',
+    'D14': 'Brighton',
+    'E5': 'West Roxbury',
+    'E13': 'Jamaica Plain',
+    'E18': 'Hyde Park'
+}
+
+
+def most_common_value_table(data, key, target):
+    """
+    Build the lookup table of the most common value of one column for each value of another.
+
+    Rows where the target column is missing are ignored.
+
+    :param data: pandas DataFrame containing the key and target columns
+    :param key: name of the column to look up by
+    :param target: name of the column whose most common value is returned
+    :return: pandas Series indexed by the key with the most common target value as values
+    """
+    counts = data.groupby([key, target], observed=True).size().reset_index(name='count')
+    counts = counts.sort_values([key, 'count'], ascending=False).drop_duplicates(key)
+    return counts.set_index(key)[target]
+
+
+def most_common_district_table(data):
+    """
+    Build the lookup table of the most common DISTRICT for each REPORTING_AREA.
+
+    :param data: pandas DataFrame containing 'REPORTING_AREA' and 'DISTRICT' columns
+    :return: pandas Series indexed by REPORTING_AREA with the most common DISTRICT as values
+    """
+    return most_common_value_table(data, 'REPORTING_AREA', 'DISTRICT')
+
+
+def impute_district(data, most_common_district=None):
+    """
+    Fill missing DISTRICT values with the most common DISTRICT of the row's REPORTING_AREA.
+
+    Only the rows with a missing DISTRICT are looked up, with a single vectorized map.
+
+    :param data: pandas DataFrame containing 'REPORTING_AREA' and 'DISTRICT' columns
+    :param most_common_district: optional lookup table from most_common_district_table, built from data when None
+    :return: pandas Series with the imputed DISTRICT column
+    """
+    if most_common_district is None:
+        most_common_district = most_common_district_table(data)
+
+    district = data['DISTRICT'].copy()
+    missing = district.isnull()
+    district[missing] = data.loc[missing, 'REPORTING_AREA'].map(most_common_district).astype(district.dtype)
+    return district
+
+
+def rename_districts(district):
+    """
+    Replace the district codes with their names by renaming the categories.
+
+    Each distinct code is renamed once instead of calling a function for every row,
+    codes that are not in DISTRICT_NAME_MAPPING are kept as they are.
+
+    :param district: pandas Series of district codes
+    :return: categorical pandas Series of district names
+    """
+    district = district.astype('category')
+    return district.cat.rename_categories(lambda code: DISTRICT_NAME_MAPPING.get(code, code))
+
+
+# UCR_PART of the offense code groups that have no UCR_PART in the export,
+# following the Uniform Crime Reporting offense types defined by the FBI
+UCR_PART_MAPPING = {
+    'HUMAN TRAFFICKING': 'Part One',
+    'HUMAN TRAFFICKING - INVOLUNTARY SERVITUDE': 'Part One',
+    'HOME INVASION': 'Part One',
+    'INVESTIGATE PERSON': 'Part Three'
+}
+
+
+def ucr_part_rule_table(data, key='OFFENSE_CODE_GROUP', overrides=UCR_PART_MAPPING):
+    """
+    Build the rule table from an offense column to UCR_PART.
+
+    The table is derived from the rows that already have a UCR_PART (the most common UCR_PART
+    of each offense), and the explicit overrides take precedence over the derived rules.
+
+    :param data: pandas DataFrame containing the key column and 'UCR_PART'
+    :param key: offense column the rules are keyed by, 'OFFENSE_CODE_GROUP' or 'OFFENSE_CODE'
+    :param overrides: optional dict of rules that replace or extend the derived ones
+    :return: dict mapping offense values to UCR_PART
+    """
+    rules = most_common_value_table(data, key, 'UCR_PART').to_dict()
+    if overrides:
+        rules.update(overrides)
+    return rules
+
+
+def impute_ucr_part(data, rules=None, key='OFFENSE_CODE_GROUP'):
+    """
+    Fill missing UCR_PART values from a rule table, in a single masked assignment.
+
+    :param data: pandas DataFrame containing the key column and 'UCR_PART'
+    :param rules: dict or Series mapping offense values to UCR_PART, derived with ucr_part_rule_table when None
+    :param key: offense column the rules are keyed by
+    :return: pandas Series with the imputed UCR_PART column
+    """
+    if rules is None:
+        rules = ucr_part_rule_table(data, key)
+
+    ucr_part = data['UCR_PART'].copy()
+    missing = ucr_part.isnull()
+    imputed = data.loc[missing, key].map(rules)
+
+    # New UCR_PART values have to be declared before they can be assigned to a categorical column
+    if isinstance(ucr_part.dtype, pd.CategoricalDtype):
+        new_categories = set(imputed.dropna()) - set(ucr_part.cat.categories)
+        ucr_part = ucr_part.cat.add_categories(sorted(new_categories))
+
+    ucr_part[missing] = imputed
+    return ucr_part
+
+
+def normalise_shooting(shooting):
+    """
+    Standardize SHOOTING to 'Y' for shootings and 'N' for every other value, as a categorical.
+
+    :param shooting: pandas Series of raw SHOOTING values
+    :return: categorical pandas Series with the categories 'N' and 'Y'
+    """
+    is_shooting = shooting.eq('Y').to_numpy(dtype=bool, na_value=False)
+    return pd.Series(pd.Categorical(np.where(is_shooting, 'Y', 'N'), categories=['N', 'Y']),
+                     index=shooting.index, name=shooting.name)
+
+
+class CleaningPipeline:
+    """
+    Declarative list of column rules applied to the crime dataset.
+
+    Each step is a tuple of (step name, column, function). The function receives the current values
+    of the column and the DataFrame, and returns the new values of the column. The steps on the same
+    column are fused: the column is taken out of the DataFrame once, passed through all its rules in
+    order and assigned back once. Columns are processed in the order in which they first appear.
+
+    :param steps: list of (step name, column, function(column, data)) tuples
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+
+    def run(self, data, report=True, memory=False):
+        """
+        Apply the rules to a DataFrame and report the wall time of each step.
+
+        :param data: pandas DataFrame to clean, it is not modified
+        :param report: print the per-step report
+        :param memory: also measure the memory delta of every column, before its first step and after its last one;
+                       this scans the values of the text columns twice more, so it is off by default
+        :return: tuple of (cleaned DataFrame, report DataFrame with one row per step, the memory delta of a column
+                 is on the row of its last step)
+        """
+        cleaned = data.copy(deep=False)
+
+        steps_per_column = {}
+        for name, column, function in self.steps:
+            steps_per_column.setdefault(column, []).append((name, function))
+
+        rows = []
+        for column, steps in steps_per_column.items():
+            values = cleaned[column]
+            memory_before = values.memory_usage(deep=True, index=False) if memory else 0
+            for name, function in steps:
+                start = time.perf_counter()
+                values = function(values, cleaned)
+                rows.append({'step': name, 'column': column, 'seconds': time.perf_counter() - start,
+                             'memory_delta_mb': np.nan})
+            if memory:
+                rows[-1]['memory_delta_mb'] = (values.memory_usage(deep=True, index=False) - memory_before) / 1e6
+            cleaned[column] = values
+
+        steps_report = pd.DataFrame(rows, columns=['step', 'column', 'seconds', 'memory_delta_mb'])
+        if report:
+            printed = steps_report if memory else steps_report.drop(columns='memory_delta_mb')
+            print(printed.to_string(index=False))
+            print(f"Total: {steps_report['seconds'].sum():.3f} s"
+                  + (f", {steps_report['memory_delta_mb'].sum():+.1f} MB" if memory else ''))
+
+        return cleaned, steps_report
+
+
+# Cleaning rules of the crime dataset, shared by project.py and SMARTQ.py
+CRIME_CLEANING_PIPELINE = CleaningPipeline([
+    ('Convert OFFENSE_CODE to category', 'OFFENSE_CODE', lambda column, data: column.astype('category')),
+    ('Convert OFFENSE_CODE_GROUP to string', 'OFFENSE_CODE_GROUP', lambda column, data: column.astype('string')),
+    ('Convert OFFENSE_DESCRIPTION to string', 'OFFENSE_DESCRIPTION', lambda column, data: column.astype('string')),
+    ('Impute DISTRICT from REPORTING_AREA', 'DISTRICT', lambda column, data: impute_district(data)),
+    ('Replace district codes with names', 'DISTRICT', lambda column, data: rename_districts(column)),
+    ('Standardize SHOOTING to Y/N category', 'SHOOTING', lambda column, data: normalise_shooting(column)),
+    ('Convert YEAR to category', 'YEAR', lambda column, data: column.astype('category')),
+    ('Convert DAY_OF_WEEK to category', 'DAY_OF_WEEK', lambda column, data: column.astype('category')),
+    ('Impute UCR_PART from OFFENSE_CODE_GROUP', 'UCR_PART', lambda column, data: impute_ucr_part(data)),
+    ('Convert UCR_PART to category', 'UCR_PART', lambda column, data: column.astype('category')),
+    ('Convert STREET to string', 'STREET', lambda column, data: column.astype('string')),
+    ('Fill missing STREET with Not Specified', 'STREET', lambda column, data: column.fillna('Not Specified'))
+])
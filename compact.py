@@ -0,0 +1,92 @@
+#%%
+# Compact in-memory representation of the incident dataset
+# Most columns of the incident data are low-cardinality strings. Stored as 'string' or 'object',
+# every row holds its own Python string; dictionary-encoded (categorical) columns store each
+# distinct value once and keep only a small integer code (int8/int16) per row.
+import numpy as np
+import pandas as pd
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Dictionaries of the columns with a fixed set of values, shared by every compact table,
+# so tables built from different files or data drops use the same codes
+SHARED_DICTIONARIES = {
+    'DAY_OF_WEEK': pd.CategoricalDtype(DAYS_OF_WEEK, ordered=True),
+    'SHOOTING': pd.CategoricalDtype(['N', 'Y']),
+    'UCR_PART': pd.CategoricalDtype(['Part One', 'Part Two', 'Part Three', 'Other'])
+}
+
+# Columns whose dictionary is built from the data (districts, offense groups and descriptions,
+# and the interned street names)
+DATA_DICTIONARIES = ['DISTRICT', 'OFFENSE_CODE', 'OFFENSE_CODE_GROUP', 'OFFENSE_DESCRIPTION',
+                     'REPORTING_AREA', 'STREET']
+
+# Small integer columns
+SMALL_INTEGERS = {'MONTH': np.int8, 'HOUR': np.int8}
+
+# Unique text columns, stored as Arrow strings instead of one Python object per row
+ARROW_STRINGS = ['INCIDENT_NUMBER', 'Location']
+
+
+def to_compact_table(data):
+    """
+    Convert the incident DataFrame to its compact, dictionary-encoded representation.
+
+    Low-cardinality text columns become categoricals with int8/int16 codes (the fixed ones share
+    the dictionaries in SHARED_DICTIONARIES), STREET names are interned in a single dictionary,
+    MONTH/HOUR become int8 and unique text columns become Arrow strings. YEAR stays categorical.
+
+    :param data: pandas DataFrame of incidents
+    :return: compact pandas DataFrame with the same columns and values
+    """
+    compact = data.copy(deep=False)
+
+    for col, dtype in SHARED_DICTIONARIES.items():
+        if col in compact.columns:
+            values = compact[col].astype('string')
+            unknown = set(values.dropna().unique()) - set(dtype.categories)
+            if unknown:
+                dtype = pd.CategoricalDtype(list(dtype.categories) + sorted(unknown), ordered=dtype.ordered)
+            compact[col] = values.astype(dtype)
+
+    for col in DATA_DICTIONARIES:
+        if col in compact.columns:
+            compact[col] = compact[col].astype('category')
+
+    for col, dtype in SMALL_INTEGERS.items():
+        if col in compact.columns:
+            values = compact[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(values.cat.categories.dtype)
+            compact[col] = values.astype(dtype)
+
+    for col in ARROW_STRINGS:
+        if col in compact.columns:
+            compact[col] = compact[col].astype('string[pyarrow]')
+
+    return compact
+
+
+def memory_report(original, compact):
+    """
+    Compare the memory used by each column of the original and the compact table.
+
+    :param original: pandas DataFrame before to_compact_table
+    :param compact: pandas DataFrame returned by to_compact_table
+    :return: pandas DataFrame with the memory in MB of each column and the reduction factor
+    """
+    report = pd.DataFrame({
+        'original_mb': original.memory_usage(deep=True, index=False) / 1e6,
+        'compact_mb': compact.memory_usage(deep=True, index=False) / 1e6,
+        'original_dtype': original.dtypes.astype(str),
+        'compact_dtype': compact.dtypes.astype(str)
+    })
+    report.loc['Total', ['original_mb', 'compact_mb']] = report[['original_mb', 'compact_mb']].sum()
+    report['reduction'] = report['original_mb'] / report['compact_mb']
+
+    bytes_per_row = report.loc['Total', 'compact_mb'] * 1e6 / max(len(compact), 1)
+    print(report.round(2).to_string())
+    print(f"\n{bytes_per_row:.0f} bytes per incident, "
+          f"{1e9 / bytes_per_row / 1e6:.1f} million incidents per GB")
+
+    return report
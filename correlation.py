@@ -0,0 +1,176 @@
+#%%
+# Streaming correlation matrix for the correlation heatmap
+# The heatmap used to call corr() on the fully loaded table. The accumulator below keeps only the
+# sufficient statistics of every pair of columns (count, means, sums of squared deviations and the
+# co-moment), updates them chunk by chunk and merges the statistics of several workers with the
+# pairwise formulas of Welford and Chan, so the matrix is computed without holding the table in memory.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from parallel import worker_count
+
+# Columns of the correlation heatmap
+CORRELATION_COLUMNS = ['YEAR', 'MONTH', 'HOUR', 'DATE', 'SHOOTING', 'Lat', 'Long']
+
+# Number of rows read from the Parquet file at a time
+DEFAULT_BATCH_SIZE = 100_000
+
+
+def crime_numeric_columns(data, columns=CORRELATION_COLUMNS):
+    """
+    Numeric version of the heatmap columns, as prepared in the EDA section.
+
+    DATE is the day of the month of OCCURRED_ON_DATE and SHOOTING is 1 for 'Y' and 0 for 'N'.
+
+    :param data: pandas DataFrame of incidents
+    :param columns: list of columns to return
+    :return: pandas DataFrame of float64 columns
+    """
+    numeric = {}
+    for col in columns:
+        if col == 'DATE' and col not in data.columns:
+            values = pd.to_datetime(data['OCCURRED_ON_DATE']).dt.day
+        elif col == 'SHOOTING' and not pd.api.types.is_numeric_dtype(data[col]):
+            values = data[col].map({'Y': 1, 'N': 0})
+        else:
+            values = data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(values.cat.categories.dtype)
+        numeric[col] = values.astype('float64')
+    return pd.DataFrame(numeric, index=data.index)
+
+
+class StreamingCorrelation:
+    """
+    Online, mergeable covariance and correlation matrix of a fixed list of columns.
+
+    Missing values are handled pairwise like DataFrame.corr(): the statistics of every pair of
+    columns only use the rows where both columns have a value.
+
+    :param columns: list of column names
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        size = len(self.columns)
+        # Origin of every column, the mean of the first chunk where the column has a value (NaN before).
+        # The means are kept relative to it: a column far from zero, such as Long near -71, would otherwise
+        # round its mean to 1e-14 and the merges would carry that error into the co-moments.
+        self.origin = np.full(size, np.nan)
+        # For every pair (i, j), computed over the rows where both columns have a value:
+        # count, mean of column i (relative to its origin), sum of squared deviations of column i,
+        # and co-moment of i and j
+        self.count = np.zeros((size, size))
+        self.mean = np.zeros((size, size))
+        self.m2 = np.zeros((size, size))
+        self.comoment = np.zeros((size, size))
+
+    def _merge_statistics(self, origin, count, mean, m2, comoment):
+        # The other means are moved to the origins of this accumulator, the columns without one take the other's
+        self.origin = np.where(np.isnan(self.origin), origin, self.origin)
+        mean = np.where(count > 0, mean + np.nan_to_num(origin - self.origin)[:, None], 0)
+
+        # Chan's formulas for combining the statistics of two sets of rows
+        total = self.count + count
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratio = np.where(total > 0, count / total, 0)
+        weight = self.count * ratio
+        delta = mean - self.mean
+        self.mean = self.mean + delta * ratio
+        self.m2 = self.m2 + m2 + delta ** 2 * weight
+        self.comoment = self.comoment + comoment + delta * delta.T * weight
+        self.count = total
+
+    def update(self, data):
+        """
+        Add a chunk of rows to the statistics.
+
+        :param data: pandas DataFrame containing the columns as numbers
+        """
+        values = data[self.columns].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(values)
+        weights = valid.astype(np.float64)
+
+        # The chunk is centred on its own column means first, so the sums of products do not lose precision
+        shift = np.where(valid, values, 0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+        centred = np.where(valid, values - shift, 0)
+
+        count = weights.T @ weights
+        sums = centred.T @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            chunk_mean = np.where(count > 0, sums / count, 0)
+        m2 = (centred ** 2).T @ weights - chunk_mean * sums
+        comoment = centred.T @ centred - chunk_mean * sums.T
+
+        self._merge_statistics(np.where(valid.any(axis=0), shift, np.nan), count, chunk_mean, m2, comoment)
+
+    def merge(self, other):
+        """
+        Add the statistics of another accumulator over the same columns, for example from another worker.
+
+        :param other: StreamingCorrelation
+        :return: this accumulator
+        """
+        if other.columns != self.columns:
+            raise ValueError(f"Cannot merge the statistics of {other.columns} into {self.columns}")
+        self._merge_statistics(other.origin, other.count, other.mean, other.m2, other.comoment)
+        return self
+
+    def covariance(self):
+        """
+        :return: pandas DataFrame of the sample covariances, like DataFrame.cov()
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            covariance = np.where(self.count > 1, self.comoment / (self.count - 1), np.nan)
+        return pd.DataFrame(covariance, index=self.columns, columns=self.columns)
+
+    def correlation(self):
+        """
+        :return: pandas DataFrame of the Pearson correlations, like DataFrame.corr()
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        correlation = np.clip(np.where(self.count > 1, correlation, np.nan), -1, 1)
+        return pd.DataFrame(correlation, index=self.columns, columns=self.columns)
+
+
+def _correlation_of_row_groups(path, row_groups, columns, batch_size):
+    # Statistics of some row groups of a Parquet file, computed by one worker
+    accumulator = StreamingCorrelation(columns)
+    source_columns = [col for col in pq.read_schema(path).names
+                      if col in columns or (col == 'OCCURRED_ON_DATE' and 'DATE' in columns)]
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=row_groups, columns=source_columns):
+        accumulator.update(crime_numeric_columns(batch.to_pandas(), columns))
+    return accumulator
+
+
+def correlation_from_table(path, columns=CORRELATION_COLUMNS, batch_size=DEFAULT_BATCH_SIZE, n_jobs=1):
+    """
+    Correlation statistics of a Parquet table, streamed batch by batch.
+
+    The row groups of the file are split over n_jobs worker processes and the statistics
+    of the workers are merged, so only one batch per worker is in memory at a time.
+
+    :param path: path of the Parquet table
+    :param columns: list of the columns to correlate, prepared with crime_numeric_columns
+    :param batch_size: number of rows read at a time
+    :param n_jobs: number of worker processes, parallel.worker_count() when None
+    :return: StreamingCorrelation, call correlation() or covariance() for the matrices
+    """
+    row_groups = list(range(pq.ParquetFile(path).num_row_groups))
+    n_jobs = min(worker_count(n_jobs), max(len(row_groups), 1))
+
+    if n_jobs == 1:
+        return _correlation_of_row_groups(path, row_groups, columns, batch_size)
+
+    accumulator = StreamingCorrelation(columns)
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = [executor.submit(_correlation_of_row_groups, path, row_groups[worker::n_jobs], columns, batch_size)
+                   for worker in range(n_jobs)]
+        for future in futures:
+            accumulator.merge(future.result())
+    return accumulator
@@ -0,0 +1,401 @@
+#%%
+# Precomputed count cube for the charts of the EDA section
+# Every countplot, line chart and pie chart of the EDA section counts incidents over one or two columns,
+# and used to group the full incident table again for every chart. The cube counts the incidents once
+# for every combination of the chart dimensions, and every chart is then a roll-up (a sum over the
+# dimensions it does not show) of the non-empty cells of the cube, whose number does not grow with the
+# number of incident rows once every combination has been seen.
+# The incremental cube remembers the cells of every incident, so the daily data drops (new incidents
+# and corrections of existing ones) are absorbed in place and the cube is kept on disk between runs.
+import glob
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from storage import load_table, table_fingerprint
+
+# Dimensions of the cube, DATE is the day of the month as in the EDA section
+CUBE_DIMENSIONS = ['YEAR', 'MONTH', 'DATE', 'HOUR', 'DAY_OF_WEEK', 'DISTRICT',
+                   'OFFENSE_CODE_GROUP', 'UCR_PART', 'SHOOTING']
+
+
+def _dimension_values(data, dim):
+    # DATE is derived from OCCURRED_ON_DATE when the table does not have it yet
+    if dim == 'DATE' and dim not in data.columns:
+        return pd.to_datetime(data['OCCURRED_ON_DATE']).dt.day
+    return data[dim]
+
+
+def _initial_labels(values):
+    # Labels of a dimension, the categories keep their type and order so the charts keep them too
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.CategoricalIndex(values.cat.categories, dtype=values.dtype)
+    return pd.Index(pd.unique(values.dropna())).sort_values()
+
+
+def _extend_labels(labels, values):
+    # Append the labels seen for the first time, the codes of the existing labels do not change
+    new_labels = pd.Index(pd.unique(values.dropna())).difference(labels, sort=False)
+    if len(new_labels) == 0:
+        return labels
+    if isinstance(labels, pd.CategoricalIndex):
+        categories = list(labels.categories) + list(new_labels)
+        return pd.CategoricalIndex(categories, categories=categories, ordered=labels.ordered)
+    return labels.append(new_labels)
+
+
+class CountCube:
+    """
+    Sparse count cube of the incidents over a list of dimensions.
+
+    Each non-empty cell is stored once, as a packed integer key (one bit field per dimension holding
+    the label code, 0 for a missing value) and a count, with the keys kept sorted. Missing values of a
+    dimension have their own cell and are left out of the roll-ups over that dimension, like groupby
+    and countplot do.
+
+    :param data: pandas DataFrame of incidents
+    :param dimensions: list of the columns to count over
+    """
+
+    def __init__(self, data, dimensions=CUBE_DIMENSIONS):
+        self.dimensions = list(dimensions)
+        self.labels = {dim: _initial_labels(_dimension_values(data, dim)) for dim in self.dimensions}
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self._set_bits({dim: len(labels) for dim, labels in self.labels.items()})
+        self.update(data)
+
+    def _set_bits(self, sizes):
+        # Width of the bit field of every dimension, with room for twice as many labels
+        # so new labels rarely require repacking the keys
+        self.bits = {dim: int(2 * size + 1).bit_length() for dim, size in sizes.items()}
+        if sum(self.bits.values()) > 63:
+            raise ValueError(f"The cube dimensions need {sum(self.bits.values())} bits, more than an int64 key")
+        self.shifts = {}
+        shift = 0
+        for dim in reversed(self.dimensions):
+            self.shifts[dim] = shift
+            shift += self.bits[dim]
+
+    def _pack(self, codes):
+        key = np.zeros(len(codes[self.dimensions[0]]), dtype=np.int64)
+        for dim in self.dimensions:
+            key |= codes[dim].astype(np.int64) << self.shifts[dim]
+        return key
+
+    def _unpack(self, keys, dim):
+        # Label codes of one dimension, 0 is a missing value and c + 1 is self.labels[dim][c]
+        return (keys >> self.shifts[dim]) & ((1 << self.bits[dim]) - 1)
+
+    def _repack(self, sizes):
+        # Re-encode the keys after a dimension outgrew its bit field
+        codes = {dim: self._unpack(self.keys, dim) for dim in self.dimensions}
+        self._set_bits(sizes)
+        self.keys = self._pack(codes)
+        order = np.argsort(self.keys)
+        self.keys, self.counts = self.keys[order], self.counts[order]
+
+    def _row_keys(self, data):
+        # Packed key of every row, the labels seen for the first time are added to the dictionaries
+        codes = {}
+        for dim in self.dimensions:
+            values = _dimension_values(data, dim)
+            self.labels[dim] = _extend_labels(self.labels[dim], values)
+            codes[dim] = self.labels[dim].get_indexer(values) + 1
+
+        sizes = {dim: len(labels) for dim, labels in self.labels.items()}
+        if any(size >= 1 << self.bits[dim] for dim, size in sizes.items()):
+            self._repack(sizes)
+        return self._pack(codes)
+
+    def _add_keys(self, keys, sign):
+        # Add (sign=1) or subtract (sign=-1) one incident per key, in time proportional to the number
+        # of keys, plus a single copy of the cell arrays when cells are inserted or removed
+        batch_keys, batch_counts = np.unique(keys, return_counts=True)
+        positions = np.searchsorted(self.keys, batch_keys)
+        existing = positions < len(self.keys)
+        existing[existing] = self.keys[positions[existing]] == batch_keys[existing]
+
+        self.counts[positions[existing]] += sign * batch_counts[existing]
+        if sign > 0 and not existing.all():
+            self.keys = np.insert(self.keys, positions[~existing], batch_keys[~existing])
+            self.counts = np.insert(self.counts, positions[~existing], batch_counts[~existing])
+        elif sign < 0:
+            empty = positions[existing][self.counts[positions[existing]] <= 0]
+            if len(empty):
+                self.keys = np.delete(self.keys, empty)
+                self.counts = np.delete(self.counts, empty)
+
+    def update(self, batch):
+        """
+        Add a batch of incidents to the cube.
+
+        :param batch: pandas DataFrame with the cube dimensions
+        """
+        self._add_keys(self._row_keys(batch), 1)
+
+    @property
+    def total(self):
+        """
+        :return: number of incidents counted in the cube
+        """
+        return int(self.counts.sum())
+
+    def _where_mask(self, where):
+        # Cells matching every filter, a filter is a single label or a list of labels
+        mask = np.ones(len(self.counts), dtype=bool)
+        for dim, values in (where or {}).items():
+            if np.ndim(values) == 0:
+                values = [values]
+            wanted = self.labels[dim].get_indexer(pd.Index(values))
+            mask &= np.isin(self._unpack(self.keys, dim), wanted[wanted >= 0] + 1)
+        return mask
+
+    def rollup(self, dimensions, where=None):
+        """
+        Number of incidents for every combination of the given dimensions.
+
+        :param dimensions: dimension name or list of dimension names to keep
+        :param where: optional dict of {dimension: label or list of labels} to filter the incidents on
+        :return: pandas Series of counts indexed by the labels of the dimensions, without empty combinations
+        """
+        if isinstance(dimensions, str):
+            dimensions = [dimensions]
+
+        mask = self._where_mask(where)
+        codes = {}
+        for dim in dimensions:
+            codes[dim] = self._unpack(self.keys, dim)
+            mask &= codes[dim] > 0
+
+        key = np.zeros(mask.sum(), dtype=np.int64)
+        for dim in dimensions:
+            key = key * len(self.labels[dim]) + codes[dim][mask] - 1
+
+        groups, inverse = np.unique(key, return_inverse=True)
+        counts = np.bincount(inverse, weights=self.counts[mask], minlength=len(groups)).astype(np.int64)
+
+        group_codes = np.unravel_index(groups, [len(self.labels[dim]) for dim in dimensions])
+        if len(dimensions) == 1:
+            index = self.labels[dimensions[0]].take(group_codes[0])
+            index.name = dimensions[0]
+        else:
+            index = pd.MultiIndex.from_arrays([self.labels[dim].take(codes) for dim, codes in
+                                               zip(dimensions, group_codes)], names=dimensions)
+
+        # Labels seen in later batches are appended to the dictionaries, so the result is sorted here
+        return pd.Series(counts, index=index, name='count').sort_index()
+
+    def value_counts(self, dim, where=None):
+        """
+        Number of incidents for every label of one dimension, sorted like Series.value_counts.
+
+        :param dim: dimension name
+        :param where: optional dict of {dimension: label or list of labels} to filter the incidents on
+        :return: pandas Series of counts indexed by the labels of the dimension
+        """
+        return self.rollup(dim, where=where).sort_values(ascending=False, kind='stable')
+
+    def monthly(self, dimensions=None, where=None):
+        """
+        Number of incidents per calendar month, like grouping OCCURRED_ON_DATE with pd.Grouper(freq='M').
+
+        :param dimensions: optional dimension name or list of dimension names to split every month by
+        :param where: optional dict of {dimension: label or list of labels} to filter the incidents on
+        :return: pandas Series of counts indexed by the month end (named OCCURRED_ON_DATE) and the dimensions,
+                 the months without incidents are filled with 0 when there are no other dimensions
+        """
+        if isinstance(dimensions, str):
+            dimensions = [dimensions]
+        dimensions = list(dimensions or [])
+
+        counts = self.rollup(['YEAR', 'MONTH'] + dimensions, where=where).reset_index()
+        counts['OCCURRED_ON_DATE'] = pd.to_datetime(pd.DataFrame({
+            'year': counts['YEAR'].astype('int64'), 'month': counts['MONTH'].astype('int64'), 'day': 1
+        })) + pd.offsets.MonthEnd(0)
+        counts = counts.groupby(['OCCURRED_ON_DATE'] + dimensions, observed=True)['count'].sum()
+
+        if not dimensions and len(counts):
+            months = pd.date_range(counts.index.min(), counts.index.max(), freq=pd.offsets.MonthEnd(),
+                                   name='OCCURRED_ON_DATE')
+            counts = counts.reindex(months, fill_value=0)
+        return counts
+
+
+def _incident_array(values):
+    # Incident numbers as fixed-width bytes, a few bytes each instead of a Python string object
+    values = np.asarray(pd.Series(values, dtype=object).astype(str), dtype=str)
+    try:
+        return values.astype(bytes)
+    except UnicodeEncodeError:
+        return np.char.encode(values, 'utf-8')
+
+
+def _ranges(starts, lengths):
+    # Positions starts[i], ..., starts[i] + lengths[i] - 1 of every range, concatenated
+    total = int(lengths.sum())
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    return offsets + np.arange(total)
+
+
+class IncrementalCountCube(CountCube):
+    """
+    Count cube that absorbs new incidents and corrections without rescanning the history.
+
+    The cells of every incident are remembered by incident number. A batch is added in time proportional
+    to its size; when it contains an incident number that is already in the cube, the previous rows of that
+    incident are subtracted and the rows of the batch are added instead. A correction therefore carries all
+    the rows of the incident, and applying the same batch twice does not count it twice.
+
+    The incident numbers are kept sorted in a fixed-width bytes array, next to the start and the number of
+    the packed keys of their rows in one int64 log. A batch appends its keys to the log, and the keys left
+    behind by corrections are dropped once they outnumber the live ones.
+
+    :param data: pandas DataFrame of incidents
+    :param dimensions: list of the columns to count over
+    :param id_column: name of the incident number column
+    """
+
+    def __init__(self, data, dimensions=CUBE_DIMENSIONS, id_column='INCIDENT_NUMBER'):
+        self.id_column = id_column
+        self.incident_numbers = np.zeros(0, dtype='S1')
+        self.incident_starts = np.zeros(0, dtype=np.int64)
+        self.incident_lengths = np.zeros(0, dtype=np.int32)
+        # Log of the packed keys of the rows, the first n_rows entries are used
+        self.row_keys = np.zeros(0, dtype=np.int64)
+        self.n_rows = 0
+        super().__init__(data, dimensions=dimensions)
+
+    @property
+    def n_incidents(self):
+        """
+        :return: number of incidents counted in the cube
+        """
+        return int((self.incident_lengths > 0).sum())
+
+    def _repack(self, sizes):
+        old_bits, old_shifts = self.bits, self.shifts
+        super()._repack(sizes)
+
+        # The keys remembered for every incident are re-encoded in one pass as well
+        keys = self.row_keys[:self.n_rows]
+        codes = {dim: (keys >> old_shifts[dim]) & ((1 << old_bits[dim]) - 1) for dim in self.dimensions}
+        self.row_keys[:self.n_rows] = self._pack(codes)
+
+    def _find(self, incident_numbers):
+        # Positions of the known incident numbers in the sorted array, and whether each number is known
+        positions = np.searchsorted(self.incident_numbers, incident_numbers)
+        known = positions < len(self.incident_numbers)
+        known[known] = self.incident_numbers[positions[known]] == incident_numbers[known]
+        return positions, known
+
+    def _withdraw(self, positions):
+        # Subtract the rows of the incidents at the given positions, the incidents stay known with no rows
+        lengths = self.incident_lengths[positions]
+        if lengths.sum():
+            self._add_keys(self.row_keys[_ranges(self.incident_starts[positions], lengths)], -1)
+        self.incident_lengths[positions] = 0
+
+    def _compact(self):
+        # Drop the keys of the withdrawn and corrected rows from the log, keeping the rows of every incident together
+        live = self.incident_lengths > 0
+        lengths = self.incident_lengths[live]
+        self.row_keys = self.row_keys[_ranges(self.incident_starts[live], lengths)]
+        self.n_rows = len(self.row_keys)
+        self.incident_starts[live] = np.cumsum(lengths) - lengths
+
+    def remove(self, incident_numbers):
+        """
+        Subtract incidents from the cube, for example incidents withdrawn by a correction.
+
+        :param incident_numbers: iterable of incident numbers, unknown numbers are ignored
+        """
+        incident_numbers = np.unique(_incident_array(list(incident_numbers)))
+        positions, known = self._find(incident_numbers)
+        positions = positions[known]
+        self._withdraw(positions)
+        self.incident_numbers = np.delete(self.incident_numbers, positions)
+        self.incident_starts = np.delete(self.incident_starts, positions)
+        self.incident_lengths = np.delete(self.incident_lengths, positions)
+
+    def update(self, batch):
+        """
+        Absorb a batch of new and corrected incidents.
+
+        :param batch: pandas DataFrame with the incident number column and the cube dimensions
+        """
+        keys = self._row_keys(batch)
+        incident_numbers, inverse, lengths = np.unique(_incident_array(batch[self.id_column]),
+                                                       return_inverse=True, return_counts=True)
+
+        # The previous rows of the incidents already in the cube are subtracted, the new incidents are inserted
+        positions, known = self._find(incident_numbers)
+        self._withdraw(positions[known])
+        width = max(self.incident_numbers.dtype.itemsize, incident_numbers.dtype.itemsize)
+        insert_at = positions[~known]
+        self.incident_numbers = np.insert(self.incident_numbers.astype(f'S{width}'), insert_at,
+                                          incident_numbers[~known])
+        self.incident_starts = np.insert(self.incident_starts, insert_at, 0)
+        self.incident_lengths = np.insert(self.incident_lengths, insert_at, 0)
+        positions = positions + np.cumsum(~known) - ~known
+
+        # Keys of the batch appended to the log grouped by incident, the log doubles when it is full
+        order = np.argsort(inverse, kind='stable')
+        if self.n_rows + len(keys) > len(self.row_keys):
+            row_keys = np.zeros(max(2 * len(self.row_keys), self.n_rows + len(keys)), dtype=np.int64)
+            row_keys[:self.n_rows] = self.row_keys[:self.n_rows]
+            self.row_keys = row_keys
+        self.row_keys[self.n_rows:self.n_rows + len(keys)] = keys[order]
+        self.incident_starts[positions] = self.n_rows + np.cumsum(lengths) - lengths
+        self.incident_lengths[positions] = lengths
+        self.n_rows += len(keys)
+
+        self._add_keys(keys, 1)
+        if self.n_rows > 2 * self.incident_lengths.sum():
+            self._compact()
+
+    def save(self, path=None):
+        """
+        :param path: path of the pickle file the cube is written to, the path it was opened from when None
+        """
+        if self.n_rows < len(self.row_keys):
+            self.row_keys = self.row_keys[:self.n_rows].copy()
+        with open(path or self.path, 'wb') as file:
+            pickle.dump(self, file)
+
+    @classmethod
+    def open(cls, table_path, data=None, dimensions=CUBE_DIMENSIONS):
+        """
+        Open the cube kept on disk for a table, building and saving it on the first run.
+
+        The cube is stored next to the table as '<table_path>.cube.pkl' with the fingerprint of the table it was
+        built from (see storage.table_fingerprint). Writing the same table again keeps the cube and the data drops
+        absorbed with update() and save(); the cube is built again only when the rows of the table change, and
+        the cubes kept under the earlier '<table_path>.<identity>.cube.pkl' names are deleted.
+
+        :param table_path: path of the Parquet table holding the incident history
+        :param data: optional DataFrame already loaded from the table, used instead of reading it again
+        :param dimensions: list of the columns to count over
+        :return: IncrementalCountCube
+        """
+        path = f"{table_path}.cube.pkl"
+        fingerprint = table_fingerprint(table_path)
+        cube = None
+        if os.path.exists(path):
+            with open(path, 'rb') as file:
+                cube = pickle.load(file)
+            if cube.source != fingerprint or cube.dimensions != list(dimensions):
+                cube = None
+
+        if cube is None:
+            cube = cls(load_table(table_path) if data is None else data, dimensions=dimensions)
+            cube.source = fingerprint
+            cube.save(path)
+
+        for old_path in glob.glob(f"{glob.escape(table_path)}.*.cube.pkl"):
+            os.remove(old_path)
+
+        cube.path = path
+        return cube
@@ -0,0 +1,121 @@
+#%%
+# Batched additive seasonal decomposition of many incident series
+# seasonal_decompose works on one series at a time. The classical additive decomposition only needs a centred
+# moving average (the trend) and the mean of the detrended values at every position of the period (the seasonal
+# component), so here it is computed for a whole matrix of series at once: one convolution along the time axis and
+# one reshape of the detrended values into cycles. With several periods (for example a week and a year) the trend
+# is the moving average of the longest period and the seasonal components are estimated one after the other, from
+# the shortest period, on what the previous ones left. The series come from a time series store and the components
+# are cached per selection, so the plotting cells only read them.
+import numpy as np
+import pandas as pd
+from scipy.signal import convolve
+
+# Periods of the daily series: a week and a year
+DEFAULT_PERIODS = (7, 365)
+
+
+def _moving_average_filter(period):
+    # Centred moving average of seasonal_decompose, a 2 x period average for the even periods
+    if period % 2 == 0:
+        return np.array([0.5] + [1] * (period - 1) + [0.5]) / period
+    return np.repeat(1 / period, period)
+
+
+def _period_means(values, period):
+    # Mean of every position of the period over the cycles, ignoring the missing values, centred on 0
+    n_series, n_obs = values.shape
+    cycles = -(-n_obs // period)
+    padded = np.full((n_series, cycles * period), np.nan)
+    padded[:, :n_obs] = values
+    means = np.nanmean(padded.reshape(n_series, cycles, period), axis=1)
+    return means - means.mean(axis=1, keepdims=True)
+
+
+def decompose_matrix(values, periods=DEFAULT_PERIODS):
+    """
+    Additive decomposition of every row of a matrix of series, like seasonal_decompose with model='additive'.
+
+    With a single period the components are the ones of seasonal_decompose(series, model='additive', period=period).
+
+    :param values: numpy array of shape (series, observations)
+    :param periods: list of the seasonal periods in observations
+    :return: tuple of (trend, dict of {period: seasonal}, residual) numpy arrays of the shape of values,
+             the trend and the residual are missing on the half period at both ends
+    """
+    values = np.asarray(values, dtype=np.float64)
+    periods = sorted(periods)
+    n_obs = values.shape[1]
+    if n_obs < 2 * periods[-1]:
+        raise ValueError(f"The series have {n_obs} observations, at least {2 * periods[-1]} are needed "
+                         f"for a period of {periods[-1]}")
+
+    # Centred moving average of the longest period, missing on the half period at both ends
+    moving_filter = _moving_average_filter(periods[-1])
+    half = len(moving_filter) // 2
+    trend = np.full(values.shape, np.nan)
+    trend[:, half:n_obs - half] = convolve(values, moving_filter[None, :], mode='valid')
+
+    remainder = values - trend
+    seasonal = {}
+    for period in periods:
+        means = _period_means(remainder, period)
+        seasonal[period] = np.tile(means, n_obs // period + 1)[:, :n_obs]
+        remainder = remainder - seasonal[period]
+    return trend, seasonal, remainder
+
+
+class SeasonalDecomposition:
+    """
+    Components of a batch of series, as DataFrames indexed by period with one column per series.
+
+    :param observed: pandas DataFrame of the series
+    :param trend: pandas DataFrame of the trends
+    :param seasonal: dict of {period: pandas DataFrame of the seasonal components}
+    :param resid: pandas DataFrame of the residuals
+    """
+
+    def __init__(self, observed, trend, seasonal, resid):
+        self.observed = observed
+        self.trend = trend
+        self.seasonal = seasonal
+        self.resid = resid
+
+
+class BatchDecomposer:
+    """
+    Seasonal decomposition of the series of a time series store, cached per selection.
+
+    :param store: TimeSeriesStore of the incident counts
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.cache = {}
+
+    def decompose(self, by=None, periods=DEFAULT_PERIODS, freq='D', where=None):
+        """
+        Decompose the series of every group of dimensions, all of them at once.
+
+        :param by: optional dimension or list of dimensions, for example ['DISTRICT', 'OFFENSE_CODE_GROUP'],
+                   the series of all the incidents (a single column named 'count') when None
+        :param periods: list of the seasonal periods, in periods of freq
+        :param freq: frequency of the series, 'h', 'D', 'W' or 'M'
+        :param where: optional dict of {dimension: label or list of labels} to count only some incidents
+        :return: SeasonalDecomposition
+        """
+        key = (tuple(np.atleast_1d(by)) if by is not None else None, tuple(sorted(periods)), freq,
+               tuple(sorted((col, tuple(np.atleast_1d(values))) for col, values in (where or {}).items())))
+        if key not in self.cache:
+            observed = self.store.get(freq, where=where, by=by)
+            if by is None:
+                observed = observed.to_frame()
+            trend, seasonal, resid = decompose_matrix(observed.to_numpy().T, periods)
+
+            def frame(values):
+                return pd.DataFrame(values.T, index=observed.index, columns=observed.columns)
+
+            self.cache[key] = SeasonalDecomposition(observed, frame(trend),
+                                                    {period: frame(values) for period, values in seasonal.items()},
+                                                    frame(resid))
+        return self.cache[key]
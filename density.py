@@ -0,0 +1,114 @@
+#%%
+# Rasterized density rendering of the incident coordinates
+# The Lat/Long scatter plot used to draw one marker per incident, which takes minutes and produces a huge
+# vector figure at the full volume. Here the points are binned into a fixed pixel grid per category with a
+# single vectorized bincount, and every pixel is shaded with the mix of the category colours of its points
+# and an opacity that grows with the log of its count. The grid has a fixed size, so the memory used does
+# not depend on the number of points, and chunks of points can be added one at a time.
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.colors import to_rgb
+
+# Window of the scatter plot of the EDA section
+DEFAULT_XLIM = (-71.2, -71.0)
+DEFAULT_YLIM = (42.2, 42.4)
+
+# Size of the pixel grid
+DEFAULT_WIDTH = 600
+DEFAULT_HEIGHT = 600
+
+
+class DensityRaster:
+    """
+    Per-category point counts on a fixed pixel grid.
+
+    :param categories: list of the category labels, in the order of the palette
+    :param xlim: (min, max) of the x coordinates, points outside are dropped
+    :param ylim: (min, max) of the y coordinates, points outside are dropped
+    :param width: number of pixels along x
+    :param height: number of pixels along y
+    """
+
+    def __init__(self, categories, xlim=DEFAULT_XLIM, ylim=DEFAULT_YLIM, width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT):
+        self.categories = pd.Index(categories)
+        self.xlim, self.ylim = xlim, ylim
+        self.width, self.height = width, height
+        self.counts = np.zeros((len(self.categories), height, width), dtype=np.int64)
+
+    def update(self, x, y, category):
+        """
+        Add a chunk of points to the grid.
+
+        :param x: array-like of x coordinates (longitudes)
+        :param y: array-like of y coordinates (latitudes)
+        :param category: array-like of the category of every point, unknown or missing categories are dropped
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        codes = self.categories.get_indexer(pd.Index(category))
+
+        column = np.floor((x - self.xlim[0]) / (self.xlim[1] - self.xlim[0]) * self.width)
+        row = np.floor((y - self.ylim[0]) / (self.ylim[1] - self.ylim[0]) * self.height)
+        inside = (codes >= 0) & (column >= 0) & (column < self.width) & (row >= 0) & (row < self.height)
+
+        pixel = (codes[inside] * self.height + row[inside].astype(np.int64)) * self.width + column[inside].astype(np.int64)
+        self.counts += np.bincount(pixel, minlength=self.counts.size).reshape(self.counts.shape)
+
+    def shade(self, colors, min_alpha=0.3):
+        """
+        Shade the grid into an RGBA image.
+
+        :param colors: list of colours, one per category
+        :param min_alpha: opacity of the pixels holding a single point, the densest pixel is opaque
+        :return: numpy array of shape (height, width, 4), row 0 is the lowest y
+        """
+        rgb = np.array([to_rgb(color) for color in colors])
+        total = self.counts.sum(axis=0)
+
+        image = np.zeros((self.height, self.width, 4))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            image[..., :3] = np.nan_to_num(np.einsum('khw,kc->hwc', self.counts, rgb) / total[..., None])
+        if total.max() > 0:
+            scaled = np.log1p(total) / np.log1p(total.max())
+            image[..., 3] = np.where(total > 0, min_alpha + (1 - min_alpha) * scaled, 0)
+        return image
+
+
+def density_plot(data, x='Long', y='Lat', hue='DISTRICT', palette=None, xlim=DEFAULT_XLIM, ylim=DEFAULT_YLIM,
+                 width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT, ax=None):
+    """
+    Draw the points of a DataFrame as a rasterized density image coloured by category, like sns.scatterplot with hue.
+
+    :param data: pandas DataFrame of incidents
+    :param x: name of the x column
+    :param y: name of the y column
+    :param hue: name of the category column
+    :param palette: list of colours assigned to the categories in order, the default colour cycle when None
+    :param xlim: (min, max) window of x
+    :param ylim: (min, max) window of y
+    :param width: number of pixels along x
+    :param height: number of pixels along y
+    :param ax: matplotlib Axes to draw on, the current Axes when None
+    :return: matplotlib Axes
+    """
+    ax = ax or plt.gca()
+    if isinstance(data[hue].dtype, pd.CategoricalDtype):
+        categories = data[hue].cat.categories
+    else:
+        categories = pd.Index(pd.unique(data[hue].dropna()))
+    colors = list(palette or plt.rcParams['axes.prop_cycle'].by_key()['color'])
+    colors = [colors[index % len(colors)] for index in range(len(categories))]
+
+    raster = DensityRaster(categories, xlim=xlim, ylim=ylim, width=width, height=height)
+    raster.update(data[x], data[y], data[hue])
+
+    ax.imshow(raster.shade(colors), origin='lower', extent=(*xlim, *ylim), aspect='auto', interpolation='nearest')
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    # Empty scatter plots as legend entries, so plt.legend() lists the categories as with sns.scatterplot
+    for label, color in zip(categories, colors):
+        ax.scatter([], [], color=color, label=label)
+    return ax
@@ -0,0 +1,250 @@
+#%%
+# Forecasts of the shooting counts per district, with rolling-origin backtests
+# The shootings are forecast from their daily or weekly counts per district (read from a time series store of
+# the incidents, so a shooting with several offense rows is counted once)
+# with count models: Poisson and negative binomial regressions on a trend and yearly (and for daily series,
+# weekly) seasonal terms, simple exponential smoothing, and the recent mean as a reference. The models are compared
+# on rolling-origin backtests: every origin of the last periods is a fold, fitted on the counts before it and
+# scored on the next periods. The folds are spread over a process pool across districts and origins, and every
+# fold is cached under a hash of the counts it used, so adding a new week only fits the new origin. The folds of
+# the origins that left the backtest are dropped from the cache.
+import hashlib
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+
+from parallel import worker_count
+
+# Number of yearly harmonics of the regressions
+YEARLY_HARMONICS = 2
+
+# Smoothing constants tried by the exponential smoothing
+SMOOTHING_GRID = np.linspace(0.05, 0.95, 19)
+
+# Length of the window of the recent mean, in years
+MEAN_WINDOW_YEARS = 1
+
+
+def seasonal_features(index, start):
+    """
+    Design matrix of the regressions: intercept, linear trend, yearly harmonics and, for daily periods, the day of week.
+
+    :param index: pandas DatetimeIndex of the periods
+    :param start: pandas Timestamp the trend is counted from
+    :return: numpy array of shape (periods, features)
+    """
+    years = np.asarray((index - start) / pd.Timedelta(days=365.25), dtype=np.float64)
+    phase = 2 * np.pi * index.dayofyear.to_numpy() / 365.25
+    columns = [np.ones(len(index)), years]
+    for harmonic in range(1, YEARLY_HARMONICS + 1):
+        columns += [np.sin(harmonic * phase), np.cos(harmonic * phase)]
+    if len(index) > 1 and (index[1] - index[0]) == pd.Timedelta(days=1):
+        columns += [(index.dayofweek == day).astype(np.float64) for day in range(1, 7)]
+    return np.column_stack(columns)
+
+
+def _glm_forecast(history, future_index, negative_binomial):
+    # Poisson regression, or a negative binomial one whose dispersion is estimated from the Poisson fit
+    if history.sum() == 0:
+        return np.zeros(len(future_index))
+    features = seasonal_features(history.index, history.index[0])
+    future = seasonal_features(future_index, history.index[0])
+    values = history.to_numpy(dtype=np.float64)
+    fit = sm.GLM(values, features, family=sm.families.Poisson()).fit()
+    if negative_binomial:
+        mu = fit.mu
+        dispersion = max(((values - mu) ** 2 - values).sum() / (mu ** 2).sum(), 1e-8)
+        fit = sm.GLM(values, features, family=sm.families.NegativeBinomial(alpha=dispersion)).fit()
+    return fit.predict(future)
+
+
+def poisson_forecast(history, future_index):
+    """
+    Forecast with a Poisson regression on the trend and the seasonal terms.
+
+    :param history: pandas Series of the counts, indexed by period
+    :param future_index: pandas DatetimeIndex of the periods to forecast
+    :return: numpy array of the expected counts
+    """
+    return _glm_forecast(history, future_index, negative_binomial=False)
+
+
+def negative_binomial_forecast(history, future_index):
+    """
+    Forecast with a negative binomial regression on the trend and the seasonal terms.
+
+    :param history: pandas Series of the counts, indexed by period
+    :param future_index: pandas DatetimeIndex of the periods to forecast
+    :return: numpy array of the expected counts
+    """
+    return _glm_forecast(history, future_index, negative_binomial=True)
+
+
+def exponential_smoothing_forecast(history, future_index):
+    """
+    Forecast with simple exponential smoothing, the smoothing constant minimising the one-step errors.
+
+    :param history: pandas Series of the counts, indexed by period
+    :param future_index: pandas DatetimeIndex of the periods to forecast
+    :return: numpy array of the expected counts, the last level repeated
+    """
+    values = history.to_numpy(dtype=np.float64)
+    # Levels of every smoothing constant of the grid at once
+    level = np.full(len(SMOOTHING_GRID), values[0])
+    errors = np.zeros(len(SMOOTHING_GRID))
+    for value in values[1:]:
+        errors += (value - level) ** 2
+        level = level + SMOOTHING_GRID * (value - level)
+    return np.full(len(future_index), level[errors.argmin()])
+
+
+def mean_forecast(history, future_index):
+    """
+    Forecast with the mean of the last year of counts.
+
+    :param history: pandas Series of the counts, indexed by period
+    :param future_index: pandas DatetimeIndex of the periods to forecast
+    :return: numpy array of the expected counts
+    """
+    recent = history[history.index > history.index[-1] - pd.DateOffset(years=MEAN_WINDOW_YEARS)]
+    return np.full(len(future_index), recent.mean())
+
+
+FORECAST_MODELS = {'poisson': poisson_forecast, 'negative_binomial': negative_binomial_forecast,
+                   'exponential_smoothing': exponential_smoothing_forecast, 'mean': mean_forecast}
+
+
+def _fold_key(model, column, history, actual):
+    # Key of a fold: the model, the series and a hash of the counts it is fitted and scored on
+    digest = hashlib.blake2b(digest_size=16)
+    for values in (history.index.asi8, history.to_numpy(dtype=np.int64), actual.index.asi8,
+                   actual.to_numpy(dtype=np.int64)):
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return model, column, digest.hexdigest()
+
+
+def _run_folds(folds):
+    # Forecasts of a list of (model, history, future index) folds
+    return [FORECAST_MODELS[model](history, future_index) for model, history, future_index in folds]
+
+
+class ShootingForecaster:
+    """
+    Forecasts and backtests of the shooting counts of every district.
+
+    :param store: TimeSeriesStore of the incident counts, built with incident='INCIDENT_NUMBER' so an incident with
+                  several offense rows is counted once
+    :param freq: frequency of the counts, 'D' or 'W'
+    :param by: dimension the series are split by
+    :param where: dict of {dimension: label or list of labels} selecting the counted incidents
+    :param cache_path: optional path of the pickle file the backtest folds are cached in
+    """
+
+    def __init__(self, store, freq='W', by='DISTRICT', where=None, cache_path=None):
+        where = {'SHOOTING': 'Y'} if where is None else where
+        series = store.get(freq, where=where, by=by)
+        # The first and the last periods are dropped when the data only covers part of them
+        starts = series.index if freq == 'D' else series.index - pd.Timedelta(days=6)
+        complete = (starts >= store.first.normalize()) & (series.index <= store.last.normalize())
+        self.series = series[complete]
+        self.by = by
+        self.period = pd.Timedelta(days=1 if freq == 'D' else 7)
+        self.cache_path = cache_path
+        self.cache = {}
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, 'rb') as file:
+                self.cache = pickle.load(file)
+
+    def forecast(self, horizon, model='negative_binomial'):
+        """
+        Forecast the next periods of every series from all the counts.
+
+        :param horizon: number of periods to forecast
+        :param model: name of the model, one of FORECAST_MODELS
+        :return: pandas DataFrame of the expected counts, indexed by period with one column per series
+        """
+        future_index = pd.date_range(self.series.index[-1] + self.period, periods=horizon, freq=self.period,
+                                     name=self.series.index.name)
+        return pd.DataFrame({column: FORECAST_MODELS[model](self.series[column], future_index)
+                             for column in self.series.columns}, index=future_index)
+
+    def backtest(self, horizon=4, n_origins=26, models=tuple(FORECAST_MODELS), min_history=104, n_jobs=None):
+        """
+        Rolling-origin backtest of the models on every series.
+
+        :param horizon: number of periods forecast at every origin
+        :param n_origins: number of origins, the last ones whose horizon is fully observed
+        :param models: names of the models to backtest
+        :param min_history: smallest number of periods a fold is fitted on
+        :param n_jobs: number of worker processes for the folds that are not cached, parallel.worker_count() when None
+        :return: pandas DataFrame with one row per model, series (a column named after by), origin and step, holding the actual
+                 and the forecast counts
+        """
+        last_origin = len(self.series) - horizon
+        origins = range(max(min_history, last_origin - n_origins + 1), last_origin + 1)
+        cached = len(self.cache)
+
+        keys, folds, rows = [], [], []
+        for column in self.series.columns:
+            for origin in origins:
+                history, actual = self.series[column].iloc[:origin], self.series[column].iloc[origin:origin + horizon]
+                for model in models:
+                    key = _fold_key(model, column, history, actual)
+                    keys.append(key)
+                    rows.append((model, column, actual))
+                    if key not in self.cache:
+                        folds.append((key, (model, history, actual.index)))
+
+        # Only the folds of this backtest are kept, so the cache does not grow with every new week
+        current = set(keys)
+        self.cache = {key: forecast for key, forecast in self.cache.items() if key in current}
+        stale = len(self.cache) < cached
+
+        # The folds that are not cached are split over the process pool
+        if folds:
+            n_jobs = min(worker_count(n_jobs), len(folds))
+            chunks = [[fold for _, fold in folds[worker::n_jobs]] for worker in range(n_jobs)]
+            if n_jobs == 1:
+                forecasts = [_run_folds(chunks[0])]
+            else:
+                with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                    forecasts = list(executor.map(_run_folds, chunks))
+            for worker in range(n_jobs):
+                for (key, _), forecast in zip(folds[worker::n_jobs], forecasts[worker]):
+                    self.cache[key] = np.asarray(forecast, dtype=np.float64)
+        if (folds or stale) and self.cache_path is not None:
+            with open(self.cache_path, 'wb') as file:
+                pickle.dump(self.cache, file)
+
+        lengths = [len(actual) for _, _, actual in rows]
+        return pd.DataFrame({
+            'model': np.repeat([model for model, _, _ in rows], lengths),
+            self.by: np.repeat([column for _, column, _ in rows], lengths),
+            'origin': np.repeat([actual.index[0] for _, _, actual in rows], lengths),
+            'step': np.concatenate([np.arange(1, length + 1) for length in lengths]),
+            'period': np.concatenate([actual.index for _, _, actual in rows]),
+            'actual': np.concatenate([actual.to_numpy() for _, _, actual in rows]),
+            'forecast': np.concatenate([self.cache[key] for key in keys])})
+
+
+def backtest_scores(folds, by='model'):
+    """
+    Errors of the backtest forecasts.
+
+    :param folds: pandas DataFrame returned by ShootingForecaster.backtest
+    :param by: column or list of columns the errors are computed by, for example ['model', 'DISTRICT']
+    :return: pandas DataFrame of the mean absolute error, root mean squared error and mean Poisson deviance
+    """
+    error = folds['forecast'] - folds['actual']
+    forecast = folds['forecast'].clip(lower=1e-9)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deviance = 2 * (np.where(folds['actual'] > 0, folds['actual'] * np.log(folds['actual'] / forecast), 0)
+                        - (folds['actual'] - forecast))
+    scores = pd.DataFrame({'absolute_error': error.abs(), 'squared_error': error ** 2, 'poisson_deviance': deviance})
+    scores = scores.groupby([folds[col] for col in np.atleast_1d(by)]).mean()
+    scores['squared_error'] = np.sqrt(scores['squared_error'])
+    return scores.rename(columns={'absolute_error': 'mae', 'squared_error': 'rmse'})
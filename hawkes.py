@@ -0,0 +1,191 @@
+#%%
+# Self-exciting (Hawkes) point process of the shootings per district
+# The intensity of the events of a district is a constant baseline plus a bump after every earlier event, which
+# decays exponentially: lambda_d(t) = mu_d + sum over earlier events j of a_(d, d_j) * beta * exp(-beta (t - t_j)),
+# where a_(d, d_j) is alpha for the events of the same district and gamma (0 unless the cross-district excitation
+# is fitted) for the events of the other districts. With an exponential kernel the sums over the earlier events
+# follow a recursion, so the log likelihood and its gradient cost O(n); the recursion is evaluated with cumulative
+# sums over blocks of time, so the fit is vectorized. The expected number of events of every district in the next
+# days, offspring included, follows from the linear equation of the expected intensity.
+import numpy as np
+import pandas as pd
+from scipy.linalg import expm
+from scipy.optimize import minimize
+
+# Largest decay (beta times the time span) inside a block of the vectorized recursion, exp(30) keeps full precision
+_BLOCK_SPAN = 30
+
+
+def _decayed_sums(times, beta):
+    """
+    Sums over the earlier events of the exponential kernel and of the lag times the kernel, for sorted times.
+
+    Events at exactly the same time are simultaneous: none of them is earlier than the others, so they do not
+    excite each other.
+
+    :param times: sorted numpy array of event times in days
+    :param beta: decay rate per day
+    :return: tuple of numpy arrays (R, U) with R_i = sum_(t_j<t_i) exp(-beta (t_i - t_j)) and
+             U_i = sum_(t_j<t_i) (t_i - t_j) exp(-beta (t_i - t_j))
+    """
+    if len(times) == 0:
+        return np.zeros(0), np.zeros(0)
+    # Within a block the weights exp(beta * (t - origin)) stay below exp(_BLOCK_SPAN), the earlier blocks are
+    # carried over as a decayed sum
+    blocks = np.floor(beta * (times - times[0]) / _BLOCK_SPAN).astype(np.int64)
+    unique_blocks, starts = np.unique(blocks, return_index=True)
+    ends = np.append(starts[1:], len(times))
+
+    decayed, lagged = np.empty(len(times)), np.empty(len(times))
+    carry, carry_lagged, previous = 0.0, 0.0, None
+    for block, start, end in zip(unique_blocks, starts, ends):
+        origin = times[0] + block * _BLOCK_SPAN / beta
+        if previous is not None:
+            gap = (block - previous[0]) * _BLOCK_SPAN / beta
+            carry = np.exp(-beta * gap) * (carry + previous[1])
+            carry_lagged = np.exp(-beta * gap) * (carry_lagged + previous[2]) - gap * carry
+        tau = times[start:end] - origin
+        weights = np.exp(beta * tau)
+        cumulative, cumulative_lagged = np.cumsum(weights), np.cumsum(tau * weights)
+        # Exclusive cumulative sums, an event does not excite itself
+        decay = np.exp(-beta * tau)
+        decayed[start:end] = decay * (carry + cumulative - weights)
+        # sum_j (t_j - origin) exp(-beta (t_i - t_j)), from which the lags t_i - t_j follow
+        from_origin = decay * (carry_lagged + cumulative_lagged - tau * weights)
+        lagged[start:end] = tau * decayed[start:end] - from_origin
+        previous = (block, cumulative[-1], cumulative_lagged[-1])
+    # The tied events take the sums of the first of them, which only cover the strictly earlier events
+    first = np.searchsorted(times, times, side='left')
+    return decayed[first], lagged[first]
+
+
+class HawkesModel:
+    """
+    Hawkes process with exponential kernel, one baseline per district and a shared excitation.
+
+    :param cross_excitation: whether the events also excite the other districts (a spatio-temporal model
+                             at the district level), otherwise every district only excites itself
+    """
+
+    def __init__(self, cross_excitation=False):
+        self.cross_excitation = cross_excitation
+
+    def _prepare(self, data, district, time, incident, start, end):
+        # Event times in days since the start of the window, sorted, and the district code of every event
+        if incident is not None:
+            # One event per incident, not one per offense row of the incident
+            data = data.drop_duplicates(incident)
+        times = pd.to_datetime(data[time])
+        valid = (times.notna() & data[district].notna()).to_numpy()
+        times, districts = times[valid], data[district][valid]
+        self.start = pd.Timestamp(start) if start is not None else times.min().normalize()
+        self.end = pd.Timestamp(end) if end is not None else times.max().normalize() + pd.Timedelta(days=1)
+        inside = ((times >= self.start) & (times <= self.end)).to_numpy()
+        times, districts = times[inside], districts[inside]
+
+        codes, self.districts = pd.factorize(districts, sort=True)
+        days = ((times - self.start) / pd.Timedelta(days=1)).to_numpy()
+        order = np.argsort(days, kind='stable')
+        self.horizon = (self.end - self.start) / pd.Timedelta(days=1)
+        return days[order], codes[order]
+
+    def _sums(self, days, codes, beta):
+        # Decayed sums over the earlier events of the same district, and over all the earlier events
+        self_decayed, self_lagged = np.empty(len(days)), np.empty(len(days))
+        for code in range(len(self.districts)):
+            members = np.flatnonzero(codes == code)
+            self_decayed[members], self_lagged[members] = _decayed_sums(days[members], beta)
+        if not self.cross_excitation:
+            return self_decayed, self_lagged, np.zeros(len(days)), np.zeros(len(days))
+        all_decayed, all_lagged = _decayed_sums(days, beta)
+        return self_decayed, self_lagged, all_decayed - self_decayed, all_lagged - self_lagged
+
+    def _negative_log_likelihood(self, parameters, days, codes):
+        # Negative log likelihood and its gradient with respect to the logarithm of the parameters
+        n_districts = len(self.districts)
+        mu = np.exp(parameters[:n_districts])
+        alpha, beta = np.exp(parameters[n_districts]), np.exp(parameters[n_districts + 1])
+        gamma = np.exp(parameters[n_districts + 2]) if self.cross_excitation else 0.0
+        self_decayed, self_lagged, other_decayed, other_lagged = self._sums(days, codes, beta)
+
+        intensity = mu[codes] + beta * (alpha * self_decayed + gamma * other_decayed)
+        remaining = np.exp(-beta * (self.horizon - days))
+        excitation = alpha + gamma * (n_districts - 1)
+        compensator = self.horizon * mu.sum() + excitation * (1 - remaining).sum()
+        log_likelihood = np.log(intensity).sum() - compensator
+
+        inverse = 1 / intensity
+        gradient = [mu * (np.bincount(codes, weights=inverse, minlength=n_districts) - self.horizon),
+                    [alpha * ((beta * self_decayed * inverse).sum() - (1 - remaining).sum())],
+                    [beta * ((alpha * (self_decayed - beta * self_lagged)
+                              + gamma * (other_decayed - beta * other_lagged)) * inverse).sum()
+                     - beta * excitation * ((self.horizon - days) * remaining).sum()]]
+        if self.cross_excitation:
+            gradient.append([gamma * ((beta * other_decayed * inverse).sum() - (n_districts - 1) * (1 - remaining).sum())])
+        return -log_likelihood, -np.concatenate(gradient)
+
+    def fit(self, data, district='DISTRICT', time='OCCURRED_ON_DATE', incident='INCIDENT_NUMBER', start=None,
+            end=None):
+        """
+        Fit the model by maximum likelihood.
+
+        :param data: pandas DataFrame of the events, for example the shootings
+        :param district: name of the district column
+        :param time: name of the time column
+        :param incident: name of the incident number column, the rows of an incident with several offenses are
+                         one event; None when every row is an event
+        :param start: optional start of the observation window, the midnight before the first event when None
+        :param end: optional end of the observation window, the midnight after the last event when None
+        :return: the fitted model
+        """
+        days, codes = self._prepare(data, district, time, incident, start, end)
+        self.days, self.codes = days, codes
+        n_districts = len(self.districts)
+        counts = np.bincount(codes, minlength=n_districts)
+
+        # Start from half of the events explained by the baselines, with a one-day decay
+        initial = np.concatenate([np.log(np.maximum(counts, 1) / self.horizon / 2), [np.log(0.5), 0.0],
+                                  [np.log(0.01)] if self.cross_excitation else []])
+        bounds = [(-20, 10)] * n_districts + [(-20, 2), (np.log(1e-3), np.log(1e3))] \
+            + ([(-20, 2)] if self.cross_excitation else [])
+        result = minimize(self._negative_log_likelihood, initial, args=(days, codes), jac=True, method='L-BFGS-B',
+                          bounds=bounds)
+
+        self.baseline = pd.Series(np.exp(result.x[:n_districts]), index=pd.Index(self.districts, name=district),
+                                  name='baseline_per_day')
+        self.alpha, self.beta = np.exp(result.x[n_districts]), np.exp(result.x[n_districts + 1])
+        self.gamma = np.exp(result.x[n_districts + 2]) if self.cross_excitation else 0.0
+        self.log_likelihood = -result.fun
+        self.converged = result.success
+        return self
+
+    def _excitation_matrix(self):
+        # a[d, d'] is the expected number of events of district d triggered by an event of district d'
+        n_districts = len(self.districts)
+        return np.full((n_districts, n_districts), self.gamma) + (self.alpha - self.gamma) * np.eye(n_districts)
+
+    def forecast(self, days=7):
+        """
+        Expected number of events of every district on each of the days following the end of the window.
+
+        :param days: number of days to forecast
+        :return: pandas DataFrame indexed by day with one column per district
+        """
+        n_districts = len(self.districts)
+        excitation = self._excitation_matrix()
+        # State of the kernel sums of every district at the end of the window
+        state = self.beta * np.bincount(self.codes, weights=np.exp(-self.beta * (self.horizon - self.days)),
+                                        minlength=n_districts)
+
+        # The expected kernel sums z follow dz/dt = beta (A - I) z + beta mu, whose solution is
+        # z(t) = exp(M t) (z0 - z*) + z* with M = beta (A - I) and the stationary state z* = -beta M^-1 mu
+        matrix = self.beta * (excitation - np.eye(n_districts))
+        stationary = -self.beta * np.linalg.solve(matrix, self.baseline.to_numpy())
+        cumulative = []
+        for day in range(days + 1):
+            integral = np.linalg.solve(matrix, (expm(matrix * day) - np.eye(n_districts)) @ (state - stationary)) \
+                + stationary * day
+            cumulative.append(self.baseline.to_numpy() * day + excitation @ integral)
+
+        index = pd.date_range(self.end, periods=days, freq='D', name='day')
+        return pd.DataFrame(np.diff(cumulative, axis=0), index=index, columns=self.baseline.index)
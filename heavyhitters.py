@@ -0,0 +1,235 @@
+#%%
+# Streaming top-k of high-cardinality columns with bounded memory
+# value_counts() needs the whole column in memory and keeps a counter for every distinct value (thousands of
+# streets). A frequent items sketch (the Misra-Gries summary, whose counters plus the error bound are the
+# Space-Saving counters) keeps at most `capacity` counters: when a batch adds more, the (capacity + 1)-th largest
+# counter is subtracted from all of them and the non-positive ones are dropped. Every count is then at most
+# max_error below the true count, and max_error never exceeds n / (capacity + 1). Two sketches merge the same way,
+# so the chunks of a stream are sketched on worker processes and the sketches are combined. For a sliding window
+# the stream is sketched per time bucket (a day by default) and the buckets that leave the window are dropped,
+# next to the sketch of the whole stream, in the same pass over the chunks.
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from parallel import worker_count
+
+# Columns tracked by default
+HEAVY_HITTER_COLUMNS = ['OFFENSE_CODE_GROUP', 'STREET', 'REPORTING_AREA']
+
+# Number of counters of a sketch, the error of a count is at most n / (capacity + 1)
+DEFAULT_CAPACITY = 1024
+
+# Length of the sliding window and of its buckets
+DEFAULT_WINDOW = pd.Timedelta(days=28)
+DEFAULT_BUCKET = pd.Timedelta(days=1)
+
+
+class FrequentItems:
+    """
+    Mergeable frequent items sketch of a stream of values.
+
+    :param capacity: largest number of counters kept
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.counters = pd.Series(dtype=np.int64)
+        # Largest amount any count is below the true count, and number of values seen
+        self.max_error = 0
+        self.n = 0
+
+    def _add(self, counts, max_error, n):
+        # Add counters to the sketch, then subtract the (capacity + 1)-th largest counter if there are too many
+        counters = self.counters.add(counts, fill_value=0).astype(np.int64)
+        if len(counters) > self.capacity:
+            position = len(counters) - self.capacity - 1
+            threshold = np.partition(counters.to_numpy(), position)[position]
+            counters = counters[counters > threshold] - threshold
+            max_error += threshold
+        self.counters = counters
+        self.max_error += max_error
+        self.n += n
+
+    def update(self, values):
+        """
+        Count a batch of values, the missing values are ignored.
+
+        :param values: pandas Series or array of values
+        :return: the sketch
+        """
+        counts = pd.Series(values).value_counts(sort=False)
+        # Categorical value counts also list the categories that do not occur
+        counts = counts[counts > 0]
+        counts.index = pd.Index(np.asarray(counts.index))
+        self._add(counts, 0, int(counts.sum()))
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of another sketch, built on another part of the stream.
+
+        :param other: FrequentItems
+        :return: the sketch
+        """
+        self._add(other.counters, other.max_error, other.n)
+        return self
+
+    def top(self, k=10):
+        """
+        Most frequent values and the bounds of their counts.
+
+        :param k: number of values
+        :return: pandas DataFrame indexed by value with the lower ('count') and upper ('max_count') bounds of the
+                 true counts, and whether the value is certainly among the k most frequent ('guaranteed')
+        """
+        counters = self.counters.sort_values(ascending=False, kind='stable')
+        top = counters.head(k)
+        # No value outside the top k can have a true count above this
+        outside = (counters.iloc[k] if len(counters) > k else 0) + self.max_error
+        return pd.DataFrame({'count': top, 'max_count': top + self.max_error, 'guaranteed': top >= outside})
+
+
+class WindowedFrequentItems:
+    """
+    Frequent items sketch of the values of a sliding time window, one sketch per time bucket.
+
+    :param window: length of the window, ending at the bucket of the latest value
+    :param bucket: length of a bucket, the window moves one bucket at a time
+    :param capacity: largest number of counters of every bucket
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW, bucket=DEFAULT_BUCKET, capacity=DEFAULT_CAPACITY):
+        self.window, self.bucket, self.capacity = pd.Timedelta(window), pd.Timedelta(bucket), capacity
+        self.n_buckets = max(int(self.window // self.bucket), 1)
+        # Sketch of every bucket of the window, by bucket number since 1970-01-01
+        self.buckets = {}
+        self.latest = None
+
+    def _expire(self):
+        # Drop the buckets that left the window
+        for key in [key for key in self.buckets if key <= self.latest - self.n_buckets]:
+            del self.buckets[key]
+
+    def update(self, values, times):
+        """
+        Count a batch of timed values, the values with a missing time are ignored.
+
+        :param values: pandas Series of values
+        :param times: pandas Series of the times of the values
+        :return: the sketch
+        """
+        times = pd.to_datetime(pd.Series(times))
+        valid = times.notna().to_numpy()
+        keys = times[valid].to_numpy(dtype='datetime64[ns]').astype(np.int64) // self.bucket.value
+        if len(keys) == 0:
+            return self
+        self.latest = max(int(keys.max()), self.latest if self.latest is not None else int(keys.max()))
+        values = pd.Series(values)[valid]
+        for key, group in values.groupby(keys, sort=False):
+            if key > self.latest - self.n_buckets:
+                self.buckets.setdefault(key, FrequentItems(self.capacity)).update(group)
+        self._expire()
+        return self
+
+    def merge(self, other):
+        """
+        Add the counts of another windowed sketch, built on another part of the stream.
+
+        :param other: WindowedFrequentItems with the same bucket length
+        :return: the sketch
+        """
+        if other.latest is None:
+            return self
+        self.latest = max(other.latest, self.latest if self.latest is not None else other.latest)
+        for key, sketch in other.buckets.items():
+            if key > self.latest - self.n_buckets:
+                self.buckets.setdefault(key, FrequentItems(self.capacity)).merge(sketch)
+        self._expire()
+        return self
+
+    def sketch(self):
+        """
+        :return: FrequentItems of the whole window
+        """
+        merged = FrequentItems(self.capacity)
+        for key in sorted(self.buckets):
+            merged.merge(self.buckets[key])
+        return merged
+
+    def top(self, k=10):
+        """
+        Most frequent values of the window, see FrequentItems.top.
+
+        :param k: number of values
+        :return: pandas DataFrame of the counts and their bounds
+        """
+        return self.sketch().top(k)
+
+    @property
+    def start(self):
+        """
+        :return: pandas Timestamp of the start of the window, None before the first value
+        """
+        if self.latest is None:
+            return None
+        return pd.Timestamp((self.latest - self.n_buckets + 1) * self.bucket.value)
+
+
+def _sketch_chunk(chunk, columns, capacity, window, bucket, time):
+    # Sketches of the columns of one chunk, over the whole chunk and, with a window, per time bucket
+    sketches, windowed = {}, {}
+    for col in columns:
+        sketches[col] = FrequentItems(capacity).update(chunk[col])
+        if window is not None:
+            windowed[col] = WindowedFrequentItems(window, bucket, capacity).update(chunk[col], chunk[time])
+    return sketches, windowed
+
+
+def stream_heavy_hitters(chunks, columns=HEAVY_HITTER_COLUMNS, capacity=DEFAULT_CAPACITY, window=None,
+                         bucket=DEFAULT_BUCKET, time='OCCURRED_ON_DATE', n_jobs=None):
+    """
+    Sketch the most frequent values of columns over a stream of chunks, for example iter_crime_chunks(path).
+
+    The chunks are sketched on a process pool, with at most two chunks per worker in memory, and the sketches are
+    merged as they come back. With a window, the whole stream and the window are sketched in the same pass.
+
+    :param chunks: iterable of pandas DataFrames
+    :param columns: list of the columns to sketch
+    :param capacity: largest number of counters of a sketch
+    :param window: optional length of a sliding window sketched next to the whole stream
+    :param bucket: length of the buckets of the window
+    :param time: name of the time column, used with a window
+    :param n_jobs: number of worker processes, parallel.worker_count() when None
+    :return: dict of {column: FrequentItems} of the whole stream, and with a window a tuple of that dict and
+             a dict of {column: WindowedFrequentItems}
+    """
+    n_jobs = worker_count(n_jobs)
+    used = list(columns) + ([time] if window is not None else [])
+    sketches, windowed = {}, {}
+
+    def merge(chunk_sketches):
+        for merged, chunk_merged in zip((sketches, windowed), chunk_sketches):
+            for col, sketch in chunk_merged.items():
+                merged[col] = merged[col].merge(sketch) if col in merged else sketch
+
+    def result():
+        return sketches if window is None else (sketches, windowed)
+
+    if n_jobs == 1:
+        for chunk in chunks:
+            merge(_sketch_chunk(chunk[used], columns, capacity, window, bucket, time))
+        return result()
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        pending = set()
+        for chunk in chunks:
+            pending.add(executor.submit(_sketch_chunk, chunk[used], columns, capacity, window, bucket, time))
+            if len(pending) >= 2 * n_jobs:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    merge(future.result())
+        for future in pending:
+            merge(future.result())
+    return result()
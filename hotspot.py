@@ -0,0 +1,169 @@
+#%%
+# Kernel density hotspot surfaces of the incidents
+# A kernel density estimate evaluated directly costs one kernel evaluation per incident and grid cell.
+# Here the incidents are counted on a regular grid and the counts are convolved with a Gaussian kernel
+# through the FFT, which costs O(grid log grid) whatever the number of incidents. The grids of all the
+# groups of a column (every OFFENSE_CODE_GROUP, both severities, ...) are counted with one bincount and
+# convolved in one batched FFT, and the surfaces of every time window are cached once computed.
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from scipy import fft
+
+from density import DEFAULT_XLIM, DEFAULT_YLIM
+from spacetime import EARTH_RADIUS_M, REFERENCE_LAT
+
+# Number of grid cells along each axis
+DEFAULT_GRID_SIZE = 256
+
+# Standard deviation of the Gaussian kernel in metres
+DEFAULT_BANDWIDTH_M = 250
+
+
+class HotspotSurfaces:
+    """
+    Density surfaces of the groups of a column, in incidents per square kilometre.
+
+    :param labels: pandas Index of the groups
+    :param density: numpy array of shape (groups, rows, columns), row 0 is the southern edge
+    :param counts: numpy array of the number of incidents of every group inside the window
+    :param extent: (lon_min, lon_max, lat_min, lat_max) of the grid
+    """
+
+    def __init__(self, labels, density, counts, extent):
+        self.labels = labels
+        self.density = density
+        self.counts = counts
+        self.extent = extent
+
+    def __getitem__(self, label):
+        return self.density[self.labels.get_loc(label)]
+
+    def plot(self, label, ax=None, cmap='magma'):
+        """
+        Draw the surface of a group.
+
+        :param label: group to draw
+        :param ax: matplotlib Axes to draw on, the current Axes when None
+        :param cmap: name of the colour map
+        :return: matplotlib Axes
+        """
+        ax = ax or plt.gca()
+        image = ax.imshow(self[label], origin='lower', extent=self.extent, aspect='auto', cmap=cmap)
+        plt.colorbar(image, ax=ax, label='Incidents per km²')
+        ax.set_title(f"{label} ({self.counts[self.labels.get_loc(label)]} incidents)")
+        ax.set_xlabel('Long')
+        ax.set_ylabel('Lat')
+        return ax
+
+
+def _gaussian_kernel(sigma_rows, sigma_columns):
+    # Separable Gaussian kernel truncated at 4 standard deviations, normalised to sum to 1
+    rows = np.arange(-int(np.ceil(4 * sigma_rows)), int(np.ceil(4 * sigma_rows)) + 1)
+    columns = np.arange(-int(np.ceil(4 * sigma_columns)), int(np.ceil(4 * sigma_columns)) + 1)
+    kernel = np.outer(np.exp(-0.5 * (rows / sigma_rows) ** 2), np.exp(-0.5 * (columns / sigma_columns) ** 2))
+    return kernel / kernel.sum()
+
+
+def smooth_grids(grids, kernel):
+    """
+    Convolve a stack of grids with a kernel through one batched FFT.
+
+    The grids are zero-padded by the size of the kernel, so the density does not wrap around the edges.
+
+    :param grids: numpy array of shape (groups, rows, columns)
+    :param kernel: 2D numpy array with odd sizes
+    :return: numpy array of the same shape as grids
+    """
+    rows, columns = grids.shape[-2:]
+    half_rows, half_columns = kernel.shape[0] // 2, kernel.shape[1] // 2
+    shape = (fft.next_fast_len(rows + kernel.shape[0] - 1), fft.next_fast_len(columns + kernel.shape[1] - 1))
+
+    transformed = fft.rfft2(grids, s=shape, axes=(-2, -1)) * fft.rfft2(kernel, s=shape)
+    smoothed = fft.irfft2(transformed, s=shape, axes=(-2, -1))
+    return np.clip(smoothed[..., half_rows:half_rows + rows, half_columns:half_columns + columns], 0, None)
+
+
+class HotspotModel:
+    """
+    Batched FFT kernel density surfaces of the incidents, cached per column and time window.
+
+    :param data: pandas DataFrame of incidents with 'Lat', 'Long' and 'OCCURRED_ON_DATE'
+    :param xlim: (min, max) longitude of the grid
+    :param ylim: (min, max) latitude of the grid
+    :param grid_size: number of cells along each axis
+    :param bandwidth: standard deviation of the Gaussian kernel in metres
+    """
+
+    def __init__(self, data, xlim=DEFAULT_XLIM, ylim=DEFAULT_YLIM, grid_size=DEFAULT_GRID_SIZE,
+                 bandwidth=DEFAULT_BANDWIDTH_M):
+        self.xlim, self.ylim, self.grid_size = xlim, ylim, grid_size
+
+        # Times and grid cells of the incidents sorted by time, so a time window is a slice. The group columns
+        # are only put in that order when a surface of them is asked for, the table itself is not copied
+        self.data = data
+        times = pd.to_datetime(data['OCCURRED_ON_DATE']).to_numpy()
+        self.order = np.argsort(times, kind='stable')
+        self.times = times[self.order]
+
+        lon = data['Long'].to_numpy(dtype=np.float64)[self.order]
+        lat = data['Lat'].to_numpy(dtype=np.float64)[self.order]
+        column = np.floor((lon - xlim[0]) / (xlim[1] - xlim[0]) * grid_size)
+        row = np.floor((lat - ylim[0]) / (ylim[1] - ylim[0]) * grid_size)
+        inside = (column >= 0) & (column < grid_size) & (row >= 0) & (row < grid_size)
+        self.cells = np.where(inside, np.nan_to_num(row) * grid_size + np.nan_to_num(column), -1).astype(np.int32)
+        self.groups = {}
+
+        # Size of a cell in metres, to express the bandwidth in cells and the density per square kilometre
+        cell_height = np.radians((ylim[1] - ylim[0]) / grid_size) * EARTH_RADIUS_M
+        cell_width = np.radians((xlim[1] - xlim[0]) / grid_size) * EARTH_RADIUS_M * np.cos(np.radians(REFERENCE_LAT))
+        self.cell_area_km2 = cell_height * cell_width / 1e6
+        self.kernel = _gaussian_kernel(bandwidth / cell_height, bandwidth / cell_width)
+        self.cache = {}
+
+    def _groups(self, by):
+        # Codes of a column in time order and their labels, computed on first use
+        if by not in self.groups:
+            values = self.data[by]
+            categorical = isinstance(values.dtype, pd.CategoricalDtype)
+            if categorical:
+                codes, labels = values.cat.codes.to_numpy(), values.cat.categories
+            else:
+                codes, labels = pd.factorize(values, sort=True)
+            self.groups[by] = (codes.astype(np.int32)[self.order], labels, categorical)
+        return self.groups[by]
+
+    def surfaces(self, by, start=None, end=None):
+        """
+        Density surface of every group of a column, for the incidents of a time window.
+
+        :param by: name of the column whose groups get a surface each, for example 'OFFENSE_CODE_GROUP'
+        :param start: optional start of the window (included), anything accepted by pd.Timestamp
+        :param end: optional end of the window (excluded)
+        :return: HotspotSurfaces
+        """
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        key = (by, start, end)
+        if key not in self.cache:
+            first = np.searchsorted(self.times, start.to_datetime64()) if start is not None else 0
+            last = np.searchsorted(self.times, end.to_datetime64()) if end is not None else len(self.times)
+
+            codes, labels, categorical = self._groups(by)
+            codes = codes[first:last].astype(np.int64)
+            if not categorical:
+                # Like a factorization of the window, only the groups with incidents in it get a surface
+                present = np.unique(codes[codes >= 0])
+                codes, labels = np.where(codes >= 0, np.searchsorted(present, codes), -1), labels[present]
+            cells = self.cells[first:last].astype(np.int64)
+            valid = (codes >= 0) & (cells >= 0)
+
+            # One bincount for the grids of all the groups, one batched FFT for all the surfaces
+            cells_per_grid = self.grid_size * self.grid_size
+            grids = np.bincount(codes[valid] * cells_per_grid + cells[valid], minlength=len(labels) * cells_per_grid)
+            grids = grids.reshape(len(labels), self.grid_size, self.grid_size).astype(np.float64)
+            density = smooth_grids(grids, self.kernel) / self.cell_area_km2
+
+            self.cache[key] = HotspotSurfaces(pd.Index(labels, name=by), density, grids.sum(axis=(1, 2)).astype(np.int64),
+                                              (*self.xlim, *self.ylim))
+        return self.cache[key]
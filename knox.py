@@ -0,0 +1,168 @@
+#%%
+# Knox near-repeat test of the incidents
+# Does an incident (a shooting) raise the risk of another one nearby during the following days? The Knox test
+# counts the pairs of incidents by distance band and time lag band and compares the counts with the ones
+# obtained when the times are shuffled among the incidents. Comparing every pair is O(n²); here the pairs
+# closer than the largest distance band are found with a grid whose cells are as large as that distance (only
+# the incidents of the same and of the neighbouring cells are compared). The places do not move when the times
+# are shuffled, so the close pairs are found once, and the pairs farther apart only matter through the number of
+# pairs of every time lag band over all the pairs, which a permutation does not change either and is counted on
+# the sorted times. The permutations are spread over a process pool.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from parallel import worker_count
+from spacetime import project_coordinates
+from spatial import inside_city
+
+# Edges of the distance bands in metres and of the time lag bands in days, a last band holds everything beyond
+DISTANCE_BANDS_M = [0, 100, 200, 300, 400, 500]
+TIME_BANDS_DAYS = [0, 7, 14, 21, 28, 35, 42, 49, 56]
+
+# Offsets of the neighbouring grid cells, every pair of cells is visited once
+_CELL_OFFSETS = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def close_pairs(points, max_distance):
+    """
+    Pairs of points closer than a distance, using a grid whose cells are as large as the distance.
+
+    :param points: numpy array of shape (n, 2) of projected coordinates in metres
+    :param max_distance: distance in metres, the pairs at this distance or more are left out
+    :return: tuple of (first positions, second positions, distances) numpy arrays, every pair once
+    """
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+    cells = np.floor(points / max_distance).astype(np.int64)
+    cells -= cells.min(axis=0) - 1
+    height = cells[:, 1].max() + 2
+    keys = cells[:, 0] * height + cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    positions = np.arange(len(keys))
+
+    first, second, distances = [], [], []
+    for dx, dy in _CELL_OFFSETS:
+        target = keys + dx * height + dy
+        low, high = np.searchsorted(keys, target, 'left'), np.searchsorted(keys, target, 'right')
+        if (dx, dy) == (0, 0):
+            # Within a cell, every point is only paired with the points after it
+            low = np.maximum(low, positions + 1)
+        lengths = np.clip(high - low, 0, None)
+        i = np.repeat(positions, lengths)
+        j = low[i] + np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+
+        i, j = order[i], order[j]
+        distance = np.hypot(*(points[i] - points[j]).T)
+        close = distance < max_distance
+        first.append(i[close]), second.append(j[close]), distances.append(distance[close])
+    return np.concatenate(first), np.concatenate(second), np.concatenate(distances)
+
+
+def _lag_band_totals(times, time_edges):
+    # Number of pairs of every time lag band over all the pairs, the last band holds the lags beyond the last edge
+    times = np.sort(times)
+    positions = np.arange(len(times))
+    below = np.array([(np.searchsorted(times, times + edge, 'left') - positions - 1).clip(0).sum()
+                      for edge in time_edges[1:]])
+    total = len(times) * (len(times) - 1) // 2
+    return np.diff(np.concatenate([[0], below, [total]]))
+
+
+def _knox_table(first, second, distance_bins, n_distances, times, time_edges, band_totals):
+    # Knox table of the close pairs for a given assignment of the times, with a last row for the pairs farther apart
+    n_times = len(time_edges)
+    lags = np.abs(times[first] - times[second])
+    time_bins = np.searchsorted(time_edges, lags, 'right') - 1
+    table = np.bincount(distance_bins * n_times + time_bins, minlength=n_distances * n_times).reshape(n_distances, n_times)
+    return np.vstack([table, band_totals - table.sum(axis=0)])
+
+
+def _permutation_tables(first, second, distance_bins, n_distances, times, time_edges, band_totals, observed,
+                        permutations, seed):
+    # Sum of the tables of random permutations of the times, and the number of them reaching the observed counts
+    rng = np.random.default_rng(seed)
+    totals = np.zeros(observed.shape, dtype=np.int64)
+    exceedances = np.zeros(observed.shape, dtype=np.int64)
+    for _ in range(permutations):
+        table = _knox_table(first, second, distance_bins, n_distances, rng.permutation(times), time_edges, band_totals)
+        totals += table
+        exceedances += table >= observed
+    return totals, exceedances
+
+
+def knox_test(data, distance_bands=DISTANCE_BANDS_M, time_bands=TIME_BANDS_DAYS, permutations=999, n_jobs=None,
+              random_state=0, lat='Lat', lon='Long', time='OCCURRED_ON_DATE', incident='INCIDENT_NUMBER'):
+    """
+    Knox test of the near repeats among the incidents of a DataFrame.
+
+    :param data: pandas DataFrame of incidents, for example the shootings
+    :param distance_bands: edges of the distance bands in metres, starting at 0
+    :param time_bands: edges of the time lag bands in days, starting at 0
+    :param permutations: number of random permutations of the times
+    :param n_jobs: number of worker processes for the permutations, parallel.worker_count() when None
+    :param random_state: seed of the permutations
+    :param lat: name of the latitude column
+    :param lon: name of the longitude column
+    :param time: name of the time column
+    :param incident: name of the incident number column, the rows of an incident with several offenses are one
+                     point; None when every row is an incident
+    :return: pandas DataFrame indexed by distance band and time lag band with the observed and expected
+             number of pairs, their ratio (the Knox ratio) and the permutation p-value of the observed count
+    """
+    # One point per incident, otherwise the offense rows of an incident pair up at distance 0 and lag 0.
+    # The rows without coordinates inside the city (the Lat/Long = -1 placeholders) are left out for the same reason.
+    if incident is not None:
+        data = data.drop_duplicates(incident)
+    valid = inside_city(data[lat], data[lon]) & data[time].notna().to_numpy()
+    points = project_coordinates(data[lat].to_numpy()[valid], data[lon].to_numpy()[valid])
+    times = pd.to_datetime(data[time]).to_numpy(dtype='datetime64[ns]').astype(np.int64)[valid]
+    distance_edges = np.asarray(distance_bands, dtype=np.float64)
+    time_edges = (np.asarray(time_bands, dtype=np.float64) * pd.Timedelta(days=1).value).astype(np.int64)
+
+    first, second, distances = close_pairs(points, distance_edges[-1])
+    first, second = first.astype(np.int32), second.astype(np.int32)
+    distance_bins = np.searchsorted(distance_edges, distances, 'right') - 1
+    band_totals = _lag_band_totals(times, time_edges)
+
+    observed = _knox_table(first, second, distance_bins, len(distance_edges) - 1, times, time_edges, band_totals)
+
+    n_jobs = worker_count(n_jobs)
+    seeds = np.random.SeedSequence(random_state).spawn(n_jobs)
+    chunks = [permutations // n_jobs + (worker < permutations % n_jobs) for worker in range(n_jobs)]
+    arguments = (first, second, distance_bins, len(distance_edges) - 1, times, time_edges, band_totals, observed)
+    if n_jobs == 1:
+        totals, exceedances = _permutation_tables(*arguments, chunks[0], seeds[0])
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            futures = [executor.submit(_permutation_tables, *arguments, chunk, seed)
+                       for chunk, seed in zip(chunks, seeds) if chunk > 0]
+            results = [future.result() for future in futures]
+        totals, exceedances = sum(result[0] for result in results), sum(result[1] for result in results)
+
+    index = pd.MultiIndex.from_product(
+        [pd.IntervalIndex.from_breaks([*distance_edges, np.inf], closed='left', name='distance_m'),
+         pd.IntervalIndex.from_breaks([*np.asarray(time_bands, dtype=np.float64), np.inf], closed='left',
+                                      name='time_days')])
+    expected = totals / max(permutations, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = observed / expected
+    return pd.DataFrame({'observed': observed.ravel(), 'expected': expected.ravel(), 'knox_ratio': ratio.ravel(),
+                         'p_value': ((exceedances + 1) / (permutations + 1)).ravel()}, index=index)
+
+
+def knox_tests(data, column='OFFENSE_CODE_GROUP', groups=None, **kwargs):
+    """
+    Knox test of the incidents of every group of a column, each group on its own.
+
+    :param data: pandas DataFrame of incidents
+    :param column: name of the column defining the groups
+    :param groups: optional list of the groups to test, all the groups with at least two incidents when None
+    :param kwargs: arguments of knox_test
+    :return: pandas DataFrame of the knox_test results with the group as the first index level
+    """
+    sizes = data[column].value_counts()
+    groups = sizes.index[sizes >= 2] if groups is None else groups
+    return pd.concat({group: knox_test(data[data[column] == group], **kwargs) for group in groups}, names=[column])
@@ -0,0 +1,109 @@
+#%%
+# Chunked, typed loader for the raw crime_data.csv export
+# The raw export is many millions of rows. Reading it in one go with pandas' default
+# type inference keeps every text column as a Python object and only afterwards converts
+# the columns one at a time, so memory peaks at several times the size of the final frame.
+# Here the final data types are applied while parsing and the file is read in bounded chunks,
+# so the peak memory is roughly the size of the typed result.
+import time
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Final data types of the incident columns, matching the conversions done in the cleaning section
+# Low-cardinality columns are categorical, free text columns are strings,
+# and the small integer columns use nullable integer types
+CRIME_DTYPES = {
+    'INCIDENT_NUMBER': 'string',
+    'OFFENSE_CODE': 'Int16',
+    'OFFENSE_CODE_GROUP': 'string',
+    'OFFENSE_DESCRIPTION': 'string',
+    'DISTRICT': 'string',
+    'REPORTING_AREA': 'category',
+    'SHOOTING': 'category',
+    'YEAR': 'Int16',
+    'MONTH': 'Int8',
+    'DAY_OF_WEEK': 'category',
+    'HOUR': 'Int8',
+    'UCR_PART': 'category',
+    'STREET': 'string',
+    'Lat': 'float64',
+    'Long': 'float64',
+    'Location': 'string'
+}
+
+# Integer coded columns that are stored as categoricals once parsed,
+# so the categories stay numbers as they do with astype('category') on the integer column
+CRIME_INTEGER_CATEGORIES = ['OFFENSE_CODE', 'YEAR']
+
+# Timestamp columns parsed while reading
+CRIME_DATE_COLUMNS = ['OCCURRED_ON_DATE']
+
+# Default number of rows held in memory per chunk
+DEFAULT_CHUNKSIZE = 250_000
+
+
+def iter_crime_chunks(path, chunksize=DEFAULT_CHUNKSIZE, usecols=None, encoding='latin1'):
+    """
+    Stream the crime export in chunks with the final data types applied at parse time.
+
+    :param path: path of the CSV file
+    :param chunksize: number of rows per chunk
+    :param usecols: optional list of columns to read, all columns are read when None
+    :param encoding: file encoding, 'latin1' handles the special characters in the export
+    :return: generator of typed pandas DataFrames
+    """
+    header = pd.read_csv(path, nrows=0, encoding=encoding).columns
+    columns = header if usecols is None else [col for col in header if col in usecols]
+
+    dtypes = {col: dtype for col, dtype in CRIME_DTYPES.items() if col in columns}
+    date_columns = [col for col in CRIME_DATE_COLUMNS if col in columns]
+
+    reader = pd.read_csv(path, encoding=encoding, usecols=list(columns), dtype=dtypes,
+                         parse_dates=date_columns, chunksize=chunksize)
+    for chunk in reader:
+        for col in CRIME_INTEGER_CATEGORIES:
+            if col in chunk.columns:
+                chunk[col] = chunk[col].astype('category')
+        yield chunk
+
+
+def load_crime_data(path="crime_data.csv", chunksize=DEFAULT_CHUNKSIZE, usecols=None,
+                    encoding='latin1', verbose=True):
+    """
+    Load the crime export into a single typed DataFrame by streaming it in bounded chunks.
+
+    Categorical columns are combined with a union of the categories seen in every chunk,
+    so the result keeps the categorical data type instead of falling back to object.
+
+    :param path: path of the CSV file
+    :param chunksize: number of rows per chunk
+    :param usecols: optional list of columns to read, all columns are read when None
+    :param encoding: file encoding
+    :param verbose: print the number of rows and the throughput in rows/sec
+    :return: pandas DataFrame with the final data types
+    """
+    start = time.perf_counter()
+
+    chunks = list(iter_crime_chunks(path, chunksize=chunksize, usecols=usecols, encoding=encoding))
+    if not chunks:
+        return pd.read_csv(path, nrows=0, encoding=encoding, usecols=usecols)
+
+    columns = {}
+    for col in chunks[0].columns:
+        if isinstance(chunks[0][col].dtype, pd.CategoricalDtype):
+            columns[col] = pd.Series(union_categoricals([chunk[col] for chunk in chunks]), name=col)
+        else:
+            columns[col] = pd.concat([chunk[col] for chunk in chunks], ignore_index=True)
+        # Release the per-chunk copies of the column as soon as it has been combined
+        for chunk in chunks:
+            del chunk[col]
+
+    crime_data = pd.DataFrame(columns)
+
+    elapsed = time.perf_counter() - start
+    if verbose:
+        rows_per_sec = len(crime_data) / elapsed if elapsed > 0 else float('inf')
+        print(f"Loaded {len(crime_data)} rows in {elapsed:.2f} s ({rows_per_sec:,.0f} rows/sec)")
+
+    return crime_data
@@ -0,0 +1,40 @@
+#%%
+# Number of worker processes of the parallel computations
+# The process pools are started from the top-level cells of project.py, SMARTQ.py and EDA.py, which have no
+# `if __name__ == '__main__':` guard. Where the workers are started with spawn or forkserver (the default on
+# Windows and macOS), every worker imports the main script again, which without the guard re-runs the analysis and
+# stops with the bootstrapping RuntimeError of multiprocessing. In that case the computations run in the main
+# process unless a number of workers is asked for explicitly.
+import multiprocessing
+import os
+import re
+import sys
+
+# Line of a main script that guards its top-level code from the workers
+_MAIN_GUARD = re.compile(r"^if\s+__name__\s*==\s*['\"]__main__['\"]\s*:", re.MULTILINE)
+
+
+def _unguarded_main_script():
+    # Whether starting workers would re-run a main script that has no __main__ guard
+    if multiprocessing.get_start_method() == 'fork':
+        return False
+    path = getattr(sys.modules.get('__main__'), '__file__', None)
+    # Interactive sessions (IPython, notebooks, cell by cell runs) have no main script to re-run
+    if path is None or not os.path.isfile(path):
+        return False
+    with open(path, encoding='utf-8', errors='ignore') as file:
+        return _MAIN_GUARD.search(file.read()) is None
+
+
+def worker_count(n_jobs=None):
+    """
+    Number of worker processes of a parallel computation.
+
+    :param n_jobs: number of worker processes asked for, None for the default
+    :return: n_jobs when given, otherwise all the CPUs, or 1 when the workers would re-run an unguarded main script
+    """
+    if n_jobs:
+        return n_jobs
+    if _unguarded_main_script():
+        return 1
+    return os.cpu_count() or 1
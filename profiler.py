@@ -0,0 +1,182 @@
+#%%
+# One-pass column profiler for the sanity checks of the cleaning section
+# The cleaning section used to call value_counts(), nunique(), isnull().sum(), info() and describe()
+# separately for every column, i.e. five or more full scans per column. Here every column is scanned
+# once with value_counts(dropna=False), and the counts, null counts, distinct counts, min/max, top-k values
+# and the numeric statistics are all derived from that table of distinct values. The full value counts are
+# kept as well, so the printed sanity checks list every value like value_counts() did.
+# Profiles of files are cached next to the data file, keyed by the hash of the file content.
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from loader import load_crime_data
+from storage import file_hash, load_table
+
+# Number of most frequent values kept for every column
+DEFAULT_TOP_K = 10
+
+
+def _column_statistics(values, top_k):
+    """
+    Profile one column from a single value_counts scan.
+
+    :param values: pandas Series
+    :param top_k: number of most frequent values to keep
+    :return: tuple of (dict of statistics, Series of the value counts sorted by decreasing count)
+    """
+    counts = values.value_counts(dropna=False, sort=False)
+    null_mask = counts.index.isna()
+    null_count = int(counts[null_mask].sum())
+    counts = counts[~null_mask]
+    # Categorical value counts also list the categories that do not occur
+    counts = counts[counts > 0]
+
+    sorted_counts = counts.sort_values(ascending=False, kind='stable')
+    sorted_counts.name = 'count'
+    sorted_counts.index.name = values.name
+    top_values = sorted_counts.head(top_k)
+
+    stats = {
+        'dtype': str(values.dtype),
+        'count': len(values) - null_count,
+        'null_count': null_count,
+        'distinct': len(counts),
+        'top': top_values.index[0] if len(top_values) else None,
+        'freq': int(top_values.iloc[0]) if len(top_values) else 0,
+        'min': None, 'max': None, 'mean': np.nan, 'std': np.nan,
+        '25%': np.nan, '50%': np.nan, '75%': np.nan
+    }
+
+    # Distinct values in sorted order give the min/max, and for numeric columns the
+    # weighted moments and the quantiles, without scanning the rows again
+    keys = counts.index
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        keys = pd.Index(np.asarray(keys.astype(values.cat.categories.dtype)))
+    try:
+        order = np.argsort(keys.to_numpy(), kind='stable')
+    except TypeError:
+        return stats, sorted_counts
+    if len(order) == 0:
+        return stats, sorted_counts
+
+    sorted_keys = keys[order]
+    stats['min'], stats['max'] = sorted_keys[0], sorted_keys[-1]
+
+    if pd.api.types.is_numeric_dtype(sorted_keys) and not pd.api.types.is_bool_dtype(sorted_keys):
+        numbers = sorted_keys.to_numpy(dtype='float64')
+        weights = counts.to_numpy()[order].astype('float64')
+        total = weights.sum()
+        mean = (numbers * weights).sum() / total
+        stats['mean'] = mean
+        stats['std'] = np.sqrt(((numbers - mean) ** 2 * weights).sum() / (total - 1)) if total > 1 else np.nan
+
+        # Linear interpolation between the order statistics, as in Series.quantile
+        cumulative = np.cumsum(weights)
+        for label, q in [('25%', 0.25), ('50%', 0.5), ('75%', 0.75)]:
+            position = q * (total - 1)
+            lower = numbers[np.searchsorted(cumulative, np.floor(position), side='right')]
+            upper = numbers[np.searchsorted(cumulative, np.ceil(position), side='right')]
+            stats[label] = lower + (upper - lower) * (position - np.floor(position))
+
+    return stats, sorted_counts
+
+
+class TableProfile:
+    """
+    Profile of every column of a table, computed with one scan per column.
+
+    :param data: pandas DataFrame to profile
+    :param top_k: number of most frequent values returned by top_values
+    """
+
+    def __init__(self, data, top_k=DEFAULT_TOP_K):
+        rows = {}
+        self.counts = {}
+        for col in data.columns:
+            rows[col], self.counts[col] = _column_statistics(data[col], top_k)
+
+        self.top_k = top_k
+        self.rows = len(data)
+        self.summary = pd.DataFrame.from_dict(rows, orient='index')
+
+    def value_counts(self, col):
+        """
+        Values of a column and their counts, sorted like Series.value_counts.
+
+        :param col: column name
+        :return: pandas Series of counts indexed by value
+        """
+        return self.counts[col]
+
+    def top_values(self, col):
+        """
+        :param col: column name
+        :return: pandas Series of the counts of the top_k most frequent values of the column
+        """
+        return self.counts[col].head(self.top_k)
+
+    def nunique(self, col):
+        """
+        :param col: column name
+        :return: number of distinct non-missing values of the column
+        """
+        return int(self.summary.at[col, 'distinct'])
+
+    def null_count(self, col):
+        """
+        :param col: column name
+        :return: number of missing values of the column
+        """
+        return int(self.summary.at[col, 'null_count'])
+
+    def describe(self, col=None):
+        """
+        Statistics in the layout of DataFrame.describe().T, for one column or for every column.
+
+        :param col: optional column name
+        :return: pandas Series for a single column, pandas DataFrame otherwise
+        """
+        columns = ['dtype', 'count', 'null_count', 'distinct', 'top', 'freq',
+                   'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+        if col is None:
+            return self.summary[columns]
+        return self.summary.loc[col, columns]
+
+    def render(self, col):
+        """
+        Print the value counts, distinct count and missing count of a column.
+
+        :param col: column name
+        """
+        print(self.value_counts(col))
+        print(self.nunique(col))
+        print(f"\nNumber of missing values in {col}: ", self.null_count(col))
+
+
+def profile_file(path, data=None, top_k=DEFAULT_TOP_K):
+    """
+    Profile a data file, reusing the cached profile when the file content has not changed.
+
+    The profile is cached next to the data file as '<path>.<content hash>.top<k>.counts.profile.pkl'.
+
+    :param path: path of the CSV or Parquet data file
+    :param data: optional DataFrame already loaded from the file, used instead of reading it again on a cache miss
+    :param top_k: number of most frequent values returned by top_values
+    :return: TableProfile
+    """
+    cache_path = f"{path}.{file_hash(path)}.top{top_k}.counts.profile.pkl"
+    if os.path.exists(cache_path):
+        with open(cache_path, 'rb') as file:
+            return pickle.load(file)
+
+    if data is None:
+        data = load_table(path) if path.endswith('.parquet') else load_crime_data(path)
+
+    profile = TableProfile(data, top_k=top_k)
+    with open(cache_path, 'wb') as file:
+        pickle.dump(profile, file)
+
+    return profile
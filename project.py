@@ -13,7 +13,18 @@ import seaborn as sns
 # Loading the crime dataset into a pandas DataFrame
 # The dataset is read from a CSV file named 'crime.csv'
 # The 'encoding' parameter is set to 'latin1' to handle special characters in the data that may not be properly interpreted using the default UTF-8 encoding
-crime_data = pd.read_csv("crime_data.csv", encoding='latin1')
+# The file is streamed in bounded chunks with the final data types (categoricals, nullable integers
+# and parsed timestamps) applied while parsing, which keeps the peak memory close to the size of the typed result
+from loader import load_crime_data
+crime_data = load_crime_data("crime_data.csv")
+
+#%%
+# Profiling every column in a single pass
+# The counts, missing values, distinct values, min/max and most frequent values of all the columns are computed
+# with one scan per column and cached next to the data file, keyed by the hash of its content.
+# The sanity checks below read them from this profile instead of scanning the data again for every check.
+from profiler import profile_file
+raw_profile = profile_file("crime_data.csv", data=crime_data)
 
 #%% [markdown]
 # I) Data Cleaning and Data Preprocessing
@@ -29,8 +40,7 @@ print(len(crime_data))
 # This is a crucial step for data sanity check to ensure that each column is of the appropriate data type
 
 #%%
-crime_data.info()
-crime_data.describe()
+print(raw_profile.describe())
 
 #%%
 # Addressing Missing Values and Inappropriate Data Types
@@ -47,7 +57,7 @@ crime_data.describe()
 # This step involves checking whether each entry in the 'INCIDENT_NUMBER' column is unique.
 # If every incident number is found to be unique, it can serve as a primary key for the dataset,
 # ensuring that each row represents a distinct incident and thereby maintaining data integrity.
-number_of_unique_rows = crime_data['INCIDENT_NUMBER'].nunique()
+number_of_unique_rows = raw_profile.nunique('INCIDENT_NUMBER')
 print("\nTotal Number of Unique Values in the Incident Number column: ", number_of_unique_rows)
 
 # Observing Duplicate Entries in 'INCIDENT_NUMBER'
@@ -60,31 +70,17 @@ print("\nTotal Number of Unique Values in the Incident Number column: ", number_
 
 #%%
 # Verifying the presence of duplicate rows i.e. to check whether single incident is reported multiple times
-# Group by 'INCIDENT_NUMBER'
-grouped = crime_data.groupby('INCIDENT_NUMBER')
-
-# Initialize a counter for incidents with multiple distinct entries
-multiple_entries_count = 0
-
-# Initialize a counter for printing sets
-print_counter = 0
-
-# Iterate through each group
-for name, group in grouped:
-    # Drop the 'INCIDENT_NUMBER' column as it's the same for the group
-    group_without_id = group.drop(columns=['INCIDENT_NUMBER'])
-
-    # Check if there are distinct rows in the group
-    if group_without_id.drop_duplicates().shape[0] > 1:
-        # Increment counter if more than one distinct entry is found
-        multiple_entries_count += 1
-
-        # Print the first three sets of rows
-        if print_counter < 3:
-            print(f"Incident number: {name}")
-            print(group)
-            print("\n")  
-            print_counter += 1
+# Every row is hashed over all columns except 'INCIDENT_NUMBER' and the distinct hashes are counted per incident,
+# which avoids looping over hundreds of thousands of groups in Python
+from cleaning import find_multi_offense_incidents
+multiple_entries_count, multi_offense_incidents = find_multi_offense_incidents(crime_data)
+
+# Print the first three sets of rows
+examples = crime_data[crime_data['INCIDENT_NUMBER'].isin(multi_offense_incidents[:3])]
+for name, group in examples.groupby('INCIDENT_NUMBER'):
+    print(f"Incident number: {name}")
+    print(group)
+    print("\n")
 
 print("Number of incidents with multiple distinct entries:", multiple_entries_count)
 
@@ -104,14 +100,14 @@ print("Number of incidents with multiple distinct entries:", multiple_entries_co
 #%%
 # 2) Analyzing 'OFFENSE_CODE' Column
 # First, determine the number of unique offense codes present in the dataset
-unique_code = crime_data['OFFENSE_CODE'].value_counts()
-number_of_unique_code = crime_data['OFFENSE_CODE'].nunique()
+unique_code = raw_profile.value_counts('OFFENSE_CODE')
+number_of_unique_code = raw_profile.nunique('OFFENSE_CODE')
 print(unique_code)
 print(number_of_unique_code)
 
 #%% 
 # Next, check for any missing values in 'OFFENSE_CODE'
-num_missing_code = crime_data['OFFENSE_CODE'].isnull().sum()
+num_missing_code = raw_profile.null_count('OFFENSE_CODE')
 print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_code)
 
 # The analysis shows there are no missing values in 'OFFENSE_CODE'
@@ -119,151 +115,56 @@ print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_code)
 # Converting 'OFFENSE_CODE' to a 'categorical' data type can be beneficial because
 # categorical treatment allows for easy grouping and analysis of different crime types without implying any numerical relationship between them.
 
-#%%
-# Convert 'OFFENSE_CODE' column to a categorical data type
-crime_data['OFFENSE_CODE'] = crime_data['OFFENSE_CODE'].astype('category')
-
-# Verify the conversion
-print(crime_data['OFFENSE_CODE'].dtype)
-
 #%%
 # 3) Analyzing `OFFENSE_CODE_GROUP` Column
 # First, determine the number of unique offense code groups present in the dataset
-unique_code_group = crime_data['OFFENSE_CODE_GROUP'].value_counts()
-number_of_unique_code_group = crime_data['OFFENSE_CODE_GROUP'].nunique()
+unique_code_group = raw_profile.value_counts('OFFENSE_CODE_GROUP')
+number_of_unique_code_group = raw_profile.nunique('OFFENSE_CODE_GROUP')
 print(unique_code_group)
 print(number_of_unique_code_group)
 
 #%% 
 # Next, check for any missing values in 'OFFENSE_CODE_GROUP'
-num_missing_code_group = crime_data['OFFENSE_CODE_GROUP'].isnull().sum()
+num_missing_code_group = raw_profile.null_count('OFFENSE_CODE_GROUP')
 print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_code_group)
 
-#%%
-# It is observed that the 'OFFENSE_CODE_GROUP' column contains no missing values,
-# which is beneficial for a complete analysis. However, its current data type is 'object'.
-# For improved clarity and consistency in data handling, it would be advantageous to convert this column to 'string' type.
-# Convert 'OFFENSE_CODE_GROUP' column to string data type
-crime_data['OFFENSE_CODE_GROUP'] = crime_data['OFFENSE_CODE_GROUP'].astype('string')
-
-# Verify the conversion
-print(crime_data['OFFENSE_CODE_GROUP'].dtype)
-
 #%%
 # 4) Analyzing `OFFENSE_DESCRIPTION` Column
 # First, determine the number of unique offense description present in the dataset
-unique_description = crime_data['OFFENSE_DESCRIPTION'].value_counts()
-number_unique_description = crime_data['OFFENSE_DESCRIPTION'].nunique()
+unique_description = raw_profile.value_counts('OFFENSE_DESCRIPTION')
+number_unique_description = raw_profile.nunique('OFFENSE_DESCRIPTION')
 print(unique_description)
 print(number_unique_description)
 
 #%% 
 # Next, check for any missing values in 'OFFENSE_DESCRIPTION'
-num_missing_description = crime_data['OFFENSE_CODE_GROUP'].isnull().sum()
+num_missing_description = raw_profile.null_count('OFFENSE_CODE_GROUP')
 print("\nNumber of missing values in OFFENSE_CODE: ", num_missing_description)
 
-#%%
-# It is observed that the 'OFFENSE_DESCRIPTION' column contains no missing values,
-# However, its current data type is 'object'.
-# For improved clarity and consistency in data handling, it would be advantageous to convert this column to 'string' type.
-# Convert 'OFFENSE_DESCRIPTION' column to string data type
-crime_data['OFFENSE_DESCRIPTION'] = crime_data['OFFENSE_DESCRIPTION'].astype('string')
-
-# Verify the conversion
-print(crime_data['OFFENSE_DESCRIPTION'].dtype)
-
 #%%
 # 5) Analyzing `DISTRICT` Column
 # First, determine the number of unique districts present in this column
-unique_districts = crime_data['DISTRICT'].value_counts()
-num_unique_dstricts = crime_data['DISTRICT'].nunique()
+unique_districts = raw_profile.value_counts('DISTRICT')
+num_unique_dstricts = raw_profile.nunique('DISTRICT')
 print(unique_districts)
 print(num_unique_dstricts)
 
 #%% 
 # Next, check for any missing values in 'DISTRICT' column
-num_missing_districts = crime_data['DISTRICT'].isnull().sum()
+num_missing_districts = raw_profile.null_count('DISTRICT')
 print("\nNumber of missing values in DISTRICT: ", num_missing_districts)
 
-#%%
-# To impute missing district values using the 'REPORTING_AREA' information, 
-# a relationship between 'REPORTING_AREA' and 'DISTRICT' should be established. 
-# The idea is to find the most common 'DISTRICT' for each 'REPORTING_AREA',
-# and then use this information to fill in missing 'DISTRICT' values.
-# Step 1: Find the Most Common District for Each Reporting Area
-most_common_district = crime_data.groupby(['REPORTING_AREA', 'DISTRICT']).size().reset_index(name='count')
-most_common_district = most_common_district.sort_values(['REPORTING_AREA', 'count'], ascending=False).drop_duplicates('REPORTING_AREA').set_index('REPORTING_AREA')['DISTRICT']
-
-# Step 2: Impute Missing District Values
-crime_data['DISTRICT'] = crime_data.apply(
-    lambda row: most_common_district[row['REPORTING_AREA']] if pd.isnull(row['DISTRICT']) and row['REPORTING_AREA'] in most_common_district else row['DISTRICT'],
-    axis=1
-)
-
-#%% 
-# Verify missing values in 'DISTRICT' column
-num_missing_districts = crime_data['DISTRICT'].isnull().sum()
-print("\nNumber of missing values in DISTRICT: ", num_missing_districts)
-
-#%%
-# It is observed that the 'DISTRICT' column contains no missing values now,
-# However, its current data type is 'object'.
-# For improved clarity and consistency in data handling, it would be advantageous to convert this column to 'string' type.
-# Convert 'DISTRICT' column to string data type
-crime_data['DISTRICT'] = crime_data['DISTRICT'].astype('string')
-
-# Verify the conversion
-print(crime_data['DISTRICT'].dtype)
-
-#%%
-# Updating District Codes with Real-Time District Names
-# The current dataset uses district codes, which are not immediately informative in real-world context.
-# After referencing the Boston Police Department's website, it's identified that these codes correspond to specific district names.
-# To enhance the dataset's readability and practical relevance, this step involves replacing the district codes
-# with their actual names. This will make the dataset more intuitive and meaningful for analysis and interpretation.
-
-# Define a function to replace a single district code with its name
-def replace_district_code(district_code):
-    # Mapping of district codes to names
-    district_name_mapping = {
-        'A1' : 'Downtown',
-        'A15': 'Charlestown',
-        'A7': 'East Boston',
-        'B2': 'Roxbury',
-        'B3': 'Mattapan',
-        'C6': 'South Boston',
-        'C11': 'Dorchester',
-        'D4': 'South End',
-        'D14': 'Brighton',
-        'E5': 'West Roxbury',
-        'E13': 'Jamaica Plain',
-        'E18': 'Hyde Park'
-    }
-    
-    # Return the corresponding district name or the original code if not found in the mapping
-    return district_name_mapping.get(district_code, district_code)
-
-# Apply the function to each row for the 'DISTRICT' column
-crime_data['DISTRICT'] = crime_data['DISTRICT'].apply(replace_district_code)
-
-#%%
-# Verify the change
-unique_districts = crime_data['DISTRICT'].value_counts()
-num_unique_dstricts = crime_data['DISTRICT'].nunique()
-print("\nUnique Districts count: ", unique_districts)
-print("\nNumber of Unique Districts: ", num_unique_dstricts)
-
 #%%
 # 6) Analyzing `Reporting Area` column
 # First, determine the number of unique reporting areas present in this column
-unique_reporting_areas = crime_data['REPORTING_AREA'].value_counts()
-num_unique_reporting_areas = crime_data['REPORTING_AREA'].nunique()
+unique_reporting_areas = raw_profile.value_counts('REPORTING_AREA')
+num_unique_reporting_areas = raw_profile.nunique('REPORTING_AREA')
 print(unique_reporting_areas)
 print(num_unique_reporting_areas)
 
 #%% 
 # Next, check for any missing values in 'REPORTING_AREA' column
-num_missing_reporting_area = crime_data['REPORTING_AREA'].isnull().sum()
+num_missing_reporting_area = raw_profile.null_count('REPORTING_AREA')
 print("\nNumber of missing values in REPORTING_AREA: ", num_missing_reporting_area)
 
 # Regarding the 'REPORTING_AREA' column:
@@ -274,8 +175,8 @@ print("\nNumber of missing values in REPORTING_AREA: ", num_missing_reporting_ar
 #%%
 # 7) Analyzing `SHOOTING` Column
 # First, determine the number of unique shooting values present in this column
-unique_shooting_values = crime_data['SHOOTING'].value_counts()
-num_unique_shooting_values = crime_data['SHOOTING'].nunique()
+unique_shooting_values = raw_profile.value_counts('SHOOTING')
+num_unique_shooting_values = raw_profile.nunique('SHOOTING')
 print(unique_shooting_values)
 print(num_unique_shooting_values)
 
@@ -286,24 +187,6 @@ print(num_unique_shooting_values)
 # Then, the column is converted to a categorical data type for efficient storage and processing.
 # This conversion facilitates clearer and more consistent data analysis regarding shooting incidents.
 
-#%%
-# Replace all non-'Y' values in 'SHOOTING' with 'N'
-crime_data['SHOOTING'] = crime_data['SHOOTING'].apply(lambda x: 'N' if x != 'Y' else 'Y')
-
-# Convert 'SHOOTING' column to a categorical data type
-crime_data['SHOOTING'] = crime_data['SHOOTING'].astype('category')
-
-#%%
-# Verify the conversion
-print(crime_data['SHOOTING'].unique())
-print(crime_data['SHOOTING'].dtype)
-print(crime_data['SHOOTING'].value_counts())
-
-#%% 
-# Next, check for any missing values in 'SHOOTING' column
-num_missing_shooting = crime_data['SHOOTING'].isnull().sum()
-print("\nNumber of missing values in REPORTING_AREA: ", num_missing_shooting)
-
 # Status of 'SHOOTING' Column
 # It is observed that the `SHOOTING` column contains no missing values,
 # and have only two categories, 'Y' and 'N'.
@@ -311,19 +194,18 @@ print("\nNumber of missing values in REPORTING_AREA: ", num_missing_shooting)
 #%%
 # 8) Analyzing `OCCURRED_ON_DATE` Column (date and time of occurrence of crime)
 # First, determine the number of unique occurences present in this column
-unique_shooting_values = crime_data['OCCURRED_ON_DATE'].value_counts()
-num_unique_shooting_values = crime_data['OCCURRED_ON_DATE'].nunique()
+unique_shooting_values = raw_profile.value_counts('OCCURRED_ON_DATE')
+num_unique_shooting_values = raw_profile.nunique('OCCURRED_ON_DATE')
 print(unique_shooting_values)
 print(num_unique_shooting_values)
 
 #%% 
 # Next, check for any missing values in 'REPORTING_AREA' column
-num_missing_reporting_area = crime_data['REPORTING_AREA'].isnull().sum()
+num_missing_reporting_area = raw_profile.null_count('REPORTING_AREA')
 print("\nNumber of missing values in REPORTING_AREA: ", num_missing_reporting_area)
 
 #%%
-crime_data['OCCURRED_ON_DATE'].info()
-crime_data['OCCURRED_ON_DATE'].describe()
+print(raw_profile.describe('OCCURRED_ON_DATE'))
 
 # Status of 'OCCURRED_ON_DATE' Column
 # Currently, the 'OCCURRED_ON_DATE' column has no missing values, and its data type is appropriate for analysis.
@@ -332,24 +214,17 @@ crime_data['OCCURRED_ON_DATE'].describe()
 #%%
 # 9) Analyzing `YEAR` Column
 # First, determine the number of unique YEAR's present in this column
-unique_year = crime_data['YEAR'].value_counts()
-num_unique_years = crime_data['YEAR'].nunique()
+unique_year = raw_profile.value_counts('YEAR')
+num_unique_years = raw_profile.nunique('YEAR')
 print(unique_year)
 print(num_unique_years)
 
 #%% 
 # Next, check for any missing values in 'YEAR' column
-num_missing_year = crime_data['YEAR'].isnull().sum()
+num_missing_year = raw_profile.null_count('YEAR')
 print("\nNumber of missing values in YEAR: ", num_missing_year)
 print(crime_data['YEAR'].dtype)
 
-# %%
-# Convert 'YEAR' column to a categorical data type
-crime_data['YEAR'] = crime_data['YEAR'].astype('category')
-
-# Verify the conversion
-print(crime_data['YEAR'].dtype)
-
 # Status of the 'YEAR' Column
 # The 'YEAR' column currently has no missing values and is stored as a categorical data type. 
 # This format is chosen due to its utility in grouping, visualizing, and summarizing the data effectively.
@@ -359,19 +234,18 @@ print(crime_data['YEAR'].dtype)
 # %%
 # 10) Analyzing `MONTH` Column
 # First, determine the number of unique MONTH's present in this column
-unique_month = crime_data['MONTH'].value_counts()
-num_unique_months = crime_data['MONTH'].nunique()
+unique_month = raw_profile.value_counts('MONTH')
+num_unique_months = raw_profile.nunique('MONTH')
 print(unique_month)
 print(num_unique_months)
 
 # %%
 # Sanity check
-crime_data['MONTH'].info()
-crime_data['MONTH'].describe()
+print(raw_profile.describe('MONTH'))
 
 # %%
 # Next, check for any missing values in 'MONTH' column
-num_missing_month = crime_data['MONTH'].isnull().sum()
+num_missing_month = raw_profile.null_count('MONTH')
 print("\nNumber of missing values in MONTH: ", num_missing_month)
 
 # Status of the 'MONTH' Column
@@ -382,19 +256,18 @@ print("\nNumber of missing values in MONTH: ", num_missing_month)
 # %%
 # 11) Analyzing `DAY_OF_WEEK` Column
 # First, determine the number of unique values present in this column
-unique_day = crime_data['DAY_OF_WEEK'].value_counts()
-num_unique_day = crime_data['DAY_OF_WEEK'].nunique()
+unique_day = raw_profile.value_counts('DAY_OF_WEEK')
+num_unique_day = raw_profile.nunique('DAY_OF_WEEK')
 print(unique_day)
 print(num_unique_day)
 
 # %%
 # Sanity check
-crime_data['DAY_OF_WEEK'].info()
-crime_data['DAY_OF_WEEK'].describe()
+print(raw_profile.describe('DAY_OF_WEEK'))
 
 #%%
 # Next, check for any missing values in 'DAY_OF_WEEK' column
-num_missing_day = crime_data['DAY_OF_WEEK'].isnull().sum()
+num_missing_day = raw_profile.null_count('DAY_OF_WEEK')
 print("\nNumber of missing values in DAY_OF_WEEK: ", num_missing_day)
 
 # Converting 'DAY_OF_WEEK' Column to Categorical Type
@@ -405,12 +278,6 @@ print("\nNumber of missing values in DAY_OF_WEEK: ", num_missing_day)
 # which is semantically more appropriate for a categorical variable.
 # This conversion is expected to facilitate more efficient and effective data analysis involving days of the week.
 
-#%%
-crime_data['DAY_OF_WEEK'] = crime_data['DAY_OF_WEEK'].astype('category')
-
-# Verify the conversion
-print(crime_data['DAY_OF_WEEK'].dtype)
-
 # Status of the 'DAY_OF_WEEK' Column
 # The 'DAY_OF_WEEK' column in the dataset is complete with no missing values.
 # Additionally, the current data type of the 'DAY_OF_WEEK' column is appropriate for the type of data it represents,
@@ -418,19 +285,18 @@ print(crime_data['DAY_OF_WEEK'].dtype)
 # %%
 # 12) Analyzing `HOUR` Column
 # First, determine the number of unique values present in this column
-unique_HOUR = crime_data['HOUR'].value_counts()
-num_unique_HOUR = crime_data['HOUR'].nunique()
+unique_HOUR = raw_profile.value_counts('HOUR')
+num_unique_HOUR = raw_profile.nunique('HOUR')
 print(unique_HOUR)
 print(num_unique_HOUR)
 
 # %%
 # Sanity check
-crime_data['HOUR'].info()
-crime_data['HOUR'].describe()
+print(raw_profile.describe('HOUR'))
 
 # %%
 # Next, check for any missing values in 'HOUR' column
-num_missing_HOUR = crime_data['HOUR'].isnull().sum()
+num_missing_HOUR = raw_profile.null_count('HOUR')
 print("\nNumber of missing values in HOUR: ", num_missing_HOUR)
 
 # Status of the 'HOUR' Column
@@ -443,19 +309,18 @@ print("\nNumber of missing values in HOUR: ", num_missing_HOUR)
 #%%
 # 13) Analyzing 'UCR_PART' column
 # First, determine the number of unique values present in this column
-unique_UCR_PART = crime_data['UCR_PART'].value_counts()
-num_unique_UCR_PART = crime_data['UCR_PART'].nunique()
+unique_UCR_PART = raw_profile.value_counts('UCR_PART')
+num_unique_UCR_PART = raw_profile.nunique('UCR_PART')
 print(unique_UCR_PART)
 print(num_unique_UCR_PART)
 
 #%%
 # Sanity check
-crime_data['UCR_PART'].info()
-crime_data['UCR_PART'].describe()
+print(raw_profile.describe('UCR_PART'))
 
 # %%
 # Next, check for any missing values in 'UCR_PART' column
-num_missing_UCR_PART = crime_data['UCR_PART'].isnull().sum()
+num_missing_UCR_PART = raw_profile.null_count('UCR_PART')
 print("\nNumber of missing values in UCR_PART: ", num_missing_UCR_PART)
 
 # There are 90 missing values in UCR_PART
@@ -481,85 +346,21 @@ print(offense_code_for_missing_UCR_PART.value_counts())
 # which generally encompasses less severe offenses.
 # This classification is crucial for understanding the severity and nature of the crimes represented in the dataset.
 
-#%%
-# User defined function for imputing
-def impute_ucr_part_subset(data, subset):
-    """
-    Impute missing UCR_PART values in a subset of the DataFrame based on OFFENSE_CODE_GROUP.
-    
-    :param data: pandas DataFrame containing 'UCR_PART' and 'OFFENSE_CODE_GROUP' columns
-    :param subset: Series containing the OFFENSE_CODE_GROUPs of rows with missing UCR_PART
-    """
-    # Mapping from OFFENSE_CODE_GROUP to UCR_PART
-    ucr_part_mapping = {
-        'HUMAN TRAFFICKING': 'Part One',
-        'HUMAN TRAFFICKING - INVOLUNTARY SERVITUDE': 'Part One',
-        'HOME INVASION': 'Part One',
-        'INVESTIGATE PERSON': 'Part Three'
-    }
-
-    # Find the indices in the main DataFrame that correspond to the subset
-    indices_to_impute = subset.index
-
-    # Impute missing UCR_PART values in the subset
-    for index in indices_to_impute:
-        offense_code_group = data.at[index, 'OFFENSE_CODE_GROUP']
-        if offense_code_group in ucr_part_mapping:
-            data.at[index, 'UCR_PART'] = ucr_part_mapping[offense_code_group]
-
-# Call the function
-impute_ucr_part_subset(crime_data, offense_code_for_missing_UCR_PART)
-
-# Check the results for the imputed subset
-print(crime_data.loc[offense_code_for_missing_UCR_PART.index][['OFFENSE_CODE_GROUP', 'UCR_PART']])
-
-#%% 
-# Verify the change
-unique_UCR_PART = crime_data['UCR_PART'].value_counts()
-num_unique_UCR_PART = crime_data['UCR_PART'].nunique()
-print(unique_UCR_PART)
-print(num_unique_UCR_PART)
-
-num_missing_UCR_PART = crime_data['UCR_PART'].isnull().sum()
-print("\nNumber of missing values in UCR_PART: ", num_missing_UCR_PART)
-
-# %%
-# Converting 'UCR_PART' Column to Categorical Type
-# because it simplifies operations like sorting, grouping, and filtering, based on UCR_PART, making them faster and more intuitive.
-# Change the data type 
-crime_data['UCR_PART'] = crime_data['UCR_PART'].astype('category')
-
-#%%
-# Verify the conversion
-print(crime_data['UCR_PART'].dtype)
-
-# Status of the 'UCR_PART' Column
-# The 'UCR_PART' column in the dataset currently has no missing values.
-# Additionally, the data type of this column is appropriate for the kind of information it represents.
-
 # %%
 # 14) Analyzing `STREET` Column
 # First, determine the number of unique values present in this column
-unique_street = crime_data['STREET'].value_counts()
-num_unique_street = crime_data['STREET'].nunique()
+unique_street = raw_profile.value_counts('STREET')
+num_unique_street = raw_profile.nunique('STREET')
 print(unique_street)
 print(num_unique_street)
 
 # %%
 # Sanity check
-crime_data['STREET'].info()
-crime_data['STREET'].describe()
-
-#%% Convert the data type to 'STRING'
-crime_data['STREET'] = crime_data['STREET'].astype('string')
-
-#%%
-# Verify the change
-print(crime_data['STREET'].dtype)
+print(raw_profile.describe('STREET'))
 
 # %%
 # Next, check for any missing values in 'STREET' column
-num_missing_STREET = crime_data['STREET'].isnull().sum()
+num_missing_STREET = raw_profile.null_count('STREET')
 print("\nNumber of missing values in STREET: ", num_missing_STREET)
 
 # Handling Missing Values in 'STREET' Column
@@ -568,9 +369,66 @@ print("\nNumber of missing values in STREET: ", num_missing_STREET)
 # we categorize them as 'Not specified'. This allows us to maintain the integrity of the dataset 
 # while acknowledging the absence of certain location details.
 
+# State of the 'STREET' Column
+# There are no missing values present in the 'STREET' column of the dataset.
+# Additionally, the data type of the 'STREET' column is appropriately set as a string, which is ideal for textual street name data.
+
 #%%
-# Replace missing values in 'STREET' with 'Not specified'
-crime_data['STREET'].fillna('Not Specified', inplace=True)
+# Cleaning pipeline
+# The column rules decided above are declared once in CRIME_CLEANING_PIPELINE (cleaning.py), shared by project.py and SMARTQ.py:
+# - 'OFFENSE_CODE' is converted to a categorical data type, 'OFFENSE_CODE_GROUP' and 'OFFENSE_DESCRIPTION' to string
+# - the missing 'DISTRICT' values are imputed with the most common district of their 'REPORTING_AREA', looked up in the table
+#   with a single vectorized map (most_common_district_table and impute_district)
+# - the district codes are replaced by their names by renaming the categories of the column, once per distinct code
+# - all non-'Y' values in 'SHOOTING' are replaced with 'N' and the column is converted to a categorical data type
+# - 'YEAR' and 'DAY_OF_WEEK' are converted to a categorical data type
+# - the missing 'UCR_PART' values are imputed from 'OFFENSE_CODE_GROUP' with a rule table derived from the rows that already
+#   have a 'UCR_PART', extended with the classification above for the groups that never have one (UCR_PART_MAPPING),
+#   in a single vectorized assignment (impute_ucr_part), then the column is converted to a categorical data type
+# - 'STREET' is converted to string and its missing values are replaced with 'Not Specified'
+# The rules on the same column are fused, so each column is processed in one pass, and the wall time of every
+# step is reported (run(crime_data, memory=True) also reports the memory delta of every column, at the cost of
+# scanning the text columns twice more).
+from cleaning import CRIME_CLEANING_PIPELINE
+crime_data, cleaning_report = CRIME_CLEANING_PIPELINE.run(crime_data)
+
+#%%
+# Verify the conversions
+print(crime_data.dtypes)
+
+#%%
+# Verify the imputation and the district names
+num_missing_districts = crime_data['DISTRICT'].isnull().sum()
+print("\nNumber of missing values in DISTRICT: ", num_missing_districts)
+unique_districts = crime_data['DISTRICT'].value_counts()
+num_unique_dstricts = crime_data['DISTRICT'].nunique()
+print("\nUnique Districts count: ", unique_districts)
+print("\nNumber of Unique Districts: ", num_unique_dstricts)
+
+#%%
+# Verify the 'SHOOTING' conversion
+print(crime_data['SHOOTING'].unique())
+print(crime_data['SHOOTING'].dtype)
+print(crime_data['SHOOTING'].value_counts())
+
+#%% 
+# Next, check for any missing values in 'SHOOTING' column
+num_missing_shooting = crime_data['SHOOTING'].isnull().sum()
+print("\nNumber of missing values in REPORTING_AREA: ", num_missing_shooting)
+
+#%%
+# Check the results for the imputed subset of 'UCR_PART'
+print(crime_data.loc[offense_code_for_missing_UCR_PART.index][['OFFENSE_CODE_GROUP', 'UCR_PART']])
+
+#%% 
+# Verify the change
+unique_UCR_PART = crime_data['UCR_PART'].value_counts()
+num_unique_UCR_PART = crime_data['UCR_PART'].nunique()
+print(unique_UCR_PART)
+print(num_unique_UCR_PART)
+
+num_missing_UCR_PART = crime_data['UCR_PART'].isnull().sum()
+print("\nNumber of missing values in UCR_PART: ", num_missing_UCR_PART)
 
 #%%
 # Verify the operation
@@ -578,13 +436,39 @@ print(crime_data['STREET'].value_counts())
 num_missing_STREET = crime_data['STREET'].isnull().sum()
 print("\nNumber of missing values in STREET: ", num_missing_STREET)
 
-# State of the 'STREET' Column
-# There are no missing values present in the 'STREET' column of the dataset.
-# Additionally, the data type of the 'STREET' column is appropriately set as a string, which is ideal for textual street name data.
-
 #%%
-# Export the dataframe to a CSV file
-crime_data.to_csv('final_crime_data.csv', index = False)
+# Compact in-memory representation
+# Most columns are low-cardinality strings (12 districts, 7 days, 4 UCR parts, 2 SHOOTING values and a few hundred
+# offense groups and descriptions). Dictionary-encoding them as categoricals stores each distinct value once
+# with an int8/int16 code per row, the street names are interned in one dictionary and MONTH/HOUR become int8.
+from compact import to_compact_table, memory_report
+compact_crime_data = to_compact_table(crime_data)
+compact_memory = memory_report(crime_data, compact_crime_data)
+crime_data = compact_crime_data
+
+#%%
+# Export the dataframe to a compressed Parquet file
+# Unlike a CSV file, Parquet keeps the category/string data types set during cleaning,
+# so the later stages do not need to parse the text and infer the data types again
+from storage import save_table, load_table
+save_table(crime_data, 'final_crime_data.parquet')
+
+#%%
+# Streaming heavy hitters of the export
+# Most frequent offense groups, streets and reporting areas of the export, over the whole stream and over the
+# last 28 days, with bounded memory: the CSV is read once in chunks, every chunk is sketched on a worker process
+# (for the whole stream and per day of the window) and the sketches (at most 1024 counters per column, and per
+# column and day) are merged. The true count of every value lies between 'count' and 'max_count'.
+from loader import iter_crime_chunks
+from heavyhitters import HEAVY_HITTER_COLUMNS, stream_heavy_hitters
+usecols = HEAVY_HITTER_COLUMNS + ['OCCURRED_ON_DATE']
+heavy_hitters, recent_heavy_hitters = stream_heavy_hitters(iter_crime_chunks("crime_data.csv", usecols=usecols),
+                                                           window=pd.Timedelta(days=28))
+for col in HEAVY_HITTER_COLUMNS:
+    print(f"{col}: at most {heavy_hitters[col].max_error} below the true counts")
+    print(heavy_hitters[col].top(10))
+    print(f"{col} since {recent_heavy_hitters[col].start}:")
+    print(recent_heavy_hitters[col].top(10))
 
 
 # II) Exploratory Data Analysis 
@@ -599,11 +483,11 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import plotly.express as px
 from sklearn.preprocessing import LabelEncoder 
-from scipy.stats import chi2_contingency
+from chi_squared import chi_squared_tests, level_chi_squared_tests
 from plotly.subplots import make_subplots
 
 #%%
-crime_df = pd.read_csv("final_crime_data.csv", encoding='latin1')
+crime_df = load_table("final_crime_data.parquet")
 #%%
 crime_df.shape
 # crime_df.columns
@@ -611,6 +495,14 @@ crime_df.shape
 #%%
 crime_df['OCCURRED_ON_DATE'] = pd.to_datetime(crime_df['OCCURRED_ON_DATE'])
 crime_df['DATE'] = crime_df['OCCURRED_ON_DATE'].dt.day
+
+#%%
+# Count cube of the incidents over the chart dimensions, kept on disk next to the table
+# Every count chart below is a roll-up of the cube instead of a new scan of the incident rows.
+# The cube is built from the table on the first run only. The new incidents and corrections of a daily
+# data drop are absorbed without rescanning the history with crime_cube.update(drop) and crime_cube.save()
+from cube import IncrementalCountCube
+crime_cube = IncrementalCountCube.open("final_crime_data.parquet", data=crime_df)
 #%%
 # Dropping unwanted rows
 crime_df.drop(['INCIDENT_NUMBER','OFFENSE_DESCRIPTION','OCCURRED_ON_DATE','OFFENSE_CODE','Location'], axis=1, inplace = True)
@@ -624,7 +516,7 @@ crime_df.describe().T
 #UNIVARIATE ANALYSIS
 #%%
 #Count plot for YEAR
-sns.countplot(x = crime_df['YEAR'], color = '#FAB4C6')
+sns.barplot(data = crime_cube.rollup('YEAR').reset_index(), x = 'YEAR', y = 'count', color = '#FAB4C6')
 plt.title('Distribution of Incidents by Year')
 plt.xticks(rotation=90)
 plt.show()
@@ -633,7 +525,7 @@ plt.show()
 # The incidents were highest in the year 2017 and lowest in the year 2015
 #%%
 #Count plot for MONTH
-sns.countplot(x = crime_df['MONTH'], color = '#C8E4C5')
+sns.barplot(data = crime_cube.rollup('MONTH').reset_index(), x = 'MONTH', y = 'count', color = '#C8E4C5')
 plt.title('Distribution of Incidents by Month')
 plt.xticks(rotation=90)
 plt.show()
@@ -642,7 +534,7 @@ plt.show()
 # The incidents were highest in the month of July and August
 #%%
 #Count plot for HOUR
-sns.countplot(x = crime_df['HOUR'], color = '#FFB347')
+sns.barplot(data = crime_cube.rollup('HOUR').reset_index(), x = 'HOUR', y = 'count', color = '#FFB347')
 plt.title('Distribution of Incidents by Hour')
 plt.xticks(rotation=90)
 plt.show()
@@ -651,7 +543,7 @@ plt.show()
 # The Incidents recorded are higher between 9th hour to 19th hour and lower during the early morning
 #%%
 #Count plot for DATE
-sns.countplot(x = crime_df['DATE'], color = '#E6E200')
+sns.barplot(data = crime_cube.rollup('DATE').reset_index(), x = 'DATE', y = 'count', color = '#E6E200')
 plt.title('Distribution of Incidents by Day')
 plt.xticks(rotation=90)
 plt.show()
@@ -661,7 +553,7 @@ plt.show()
 #Count plot for DAY_OF_WEEK
 days_order = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
-sns.countplot(x = crime_df['DAY_OF_WEEK'], order = days_order, color = '#769FB6')
+sns.barplot(data = crime_cube.rollup('DAY_OF_WEEK').reset_index(), x = 'DAY_OF_WEEK', y = 'count', order = days_order, color = '#769FB6')
 
 plt.title('Distribution of Incidents by Day of the Week')
 plt.xticks(rotation=45)
@@ -671,7 +563,7 @@ plt.show()
 # It can be observed that the Incident rate is almost equal on all the days except the highest being on Friday and lowest on Sunday. 
 
 #%%
-sns.countplot(x = crime_df['DISTRICT'], color = '#CDB5CD')
+sns.barplot(data = crime_cube.rollup('DISTRICT').reset_index(), x = 'DISTRICT', y = 'count', color = '#CDB5CD')
 plt.title('Distribution of Incidents by District')
 plt.xticks(rotation=90)
 plt.show()
@@ -685,31 +577,32 @@ plt.show()
 # Analysis for SHOOTING variable
 #%%[markdown]
 # 1) Countplot for shooting
-sns.countplot(x=crime_df['SHOOTING'])
+sns.barplot(data=crime_cube.rollup('SHOOTING').reset_index(), x='SHOOTING', y='count')
 
 #%%[markdown]
 # 2)Pie Chart
-crime_df['SHOOTING'].value_counts().plot.pie(autopct = '%1.1f%%')
+crime_cube.value_counts('SHOOTING').plot.pie(autopct = '%1.1f%%')
 plt.title('Distribution of Shooting')
 #%%[markdown]
 # 3) Distribution for the occurance of Shooting over the Years
-sns.countplot(x = crime_df['YEAR'], hue = crime_df['SHOOTING'])
+sns.barplot(data = crime_cube.rollup(['YEAR', 'SHOOTING']).reset_index(), x = 'YEAR', y = 'count', hue = 'SHOOTING')
 plt.title('Distribution of Shooting')
 
 #%%[markdown]
 # 4) Distribution of Shooting District wise
-crime_df[crime_df['SHOOTING'] == 'Y']['DISTRICT'].value_counts().plot(kind = 'bar', color = '#8CD9A3')
+crime_cube.value_counts('DISTRICT', where = {'SHOOTING': 'Y'}).plot(kind = 'bar', color = '#8CD9A3')
 plt.title('Distribution of Shooting occuring in the district')
 #%%
-crime_df[crime_df['SHOOTING'] == 'N']['DISTRICT'].value_counts().plot(kind = 'bar', color = '#FF5C5C')
+crime_cube.value_counts('DISTRICT', where = {'SHOOTING': 'N'}).plot(kind = 'bar', color = '#FF5C5C')
 plt.title('Distribution of Shooting not occuring in the district')
 
 
 #%%[markdown]
 # Distribution of different offence District wise
-order = crime_df['OFFENSE_CODE_GROUP'].value_counts().head(6)
+order = crime_cube.value_counts('OFFENSE_CODE_GROUP').head(6)
 order = order.drop('Other').index
-sns.countplot(data = crime_df, x='OFFENSE_CODE_GROUP',hue='DISTRICT', order = order, palette = 'plasma')
+offense_district_counts = crime_cube.rollup(['OFFENSE_CODE_GROUP', 'DISTRICT'], where = {'OFFENSE_CODE_GROUP': order}).reset_index()
+sns.barplot(data = offense_district_counts, x='OFFENSE_CODE_GROUP', y='count', hue='DISTRICT', order = order, palette = 'plasma')
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2)
 plt.title('Distribution of different offence District wise')
 plt.xticks(rotation=75)
@@ -720,7 +613,7 @@ plt.show()
 #plotly
 #Line graph(District, Year, Offense code group)
 
-grouped = crime_df.groupby(['YEAR', 'DISTRICT'])['OFFENSE_CODE_GROUP'].count().reset_index()
+grouped = crime_cube.rollup(['YEAR', 'DISTRICT']).reset_index(name = 'OFFENSE_CODE_GROUP')
 fig = px.line(grouped, x='YEAR', y='OFFENSE_CODE_GROUP', color='DISTRICT', labels={'OFFENSE_CODE_GROUP': 'Number of Incidents', 'YEAR': 'YEAR'})
 
 # Update layout for legend
@@ -752,7 +645,7 @@ fig.show()
 #Line Graph for each district showing the number of incidents distributed over the months
 #Line graph(District, Month, Offense code group)
 
-grouped = crime_df.groupby(['MONTH', 'DISTRICT'])['OFFENSE_CODE_GROUP'].count().reset_index()
+grouped = crime_cube.rollup(['MONTH', 'DISTRICT']).reset_index(name = 'OFFENSE_CODE_GROUP')
 fig = px.line(grouped, x='MONTH', y='OFFENSE_CODE_GROUP', color='DISTRICT', labels={'OFFENSE_CODE_GROUP': 'Number of Incidents', 'MONTH': 'Month'})
 
 # Update layout for legend
@@ -784,8 +677,8 @@ fig.show()
 # * There is also a decline in incidents as the year progresses towards its end. This could be related to colder weather, fewer outdoor activities, or increased holiday season vigilance.
 #%%
 #Pie chart for all the Offence Code Group
-labels = crime_df['OFFENSE_CODE_GROUP'].astype('category').cat.categories.tolist()
-counts = crime_df['OFFENSE_CODE_GROUP'].value_counts()
+counts = crime_cube.value_counts('OFFENSE_CODE_GROUP')
+labels = counts.index.sort_values().tolist()
 sizes = [counts[var_cat] for var_cat in labels]
 fig1, ax1 = plt.subplots(figsize = (22,12))
 ax1.pie(sizes, labels=labels, autopct='%1.1f%%', startangle=140) 
@@ -797,7 +690,10 @@ plt.show()
 # Bivariate Analysis
 
 # %%
-numerical_columns = crime_df.select_dtypes(include=['int64']).columns
+# The data types are kept from cleaning (YEAR is categorical, MONTH and HOUR are small integers),
+# so the numerical columns are listed explicitly and converted to integers for the box plots
+numerical_columns = ['YEAR', 'MONTH', 'HOUR', 'DATE']
+numerical_df = crime_df[numerical_columns].astype('int64')
 len(numerical_columns)
 #%%
 # Determine the number of rows/columns for the subplot grid
@@ -811,7 +707,7 @@ fig, axes = plt.subplots(n_rows, n_cols, figsize=(n_cols*5, n_rows*5))
 axes = axes.flatten()
 
 for i, col in enumerate(numerical_columns):
-    sns.boxplot(x='SHOOTING', y=col, data=crime_df, ax=axes[i], color = '#d53e4f')
+    sns.boxplot(x=crime_df['SHOOTING'], y=numerical_df[col], ax=axes[i], color = '#d53e4f')
     axes[i].set_title(col)
     axes[i].set_xlabel('SHOOTING')
     axes[i].set_ylabel('')
@@ -826,17 +722,21 @@ plt.show()
 
 #%%
 #Chi-squared Test
-categorical_columns = crime_df.select_dtypes(include=['object', 'category']).columns
+categorical_columns = ['OFFENSE_CODE_GROUP', 'DISTRICT', 'REPORTING_AREA', 'SHOOTING', 'DAY_OF_WEEK', 'UCR_PART', 'STREET']
 
-for col in categorical_columns:
-    # Create a cross-tabulation
-    contingency_table = pd.crosstab(crime_df[col], crime_df['SHOOTING'])
-    # Perform the Chi-squared test
-    chi2, p, dof, ex = chi2_contingency(contingency_table)
+# Every contingency table is counted from the category codes and all the tests are computed at once
+chi_squared_results = chi_squared_tests(crime_df, categorical_columns, target='SHOOTING')
+for col, p in chi_squared_results['p_value'].items():
     print(f"Chi-squared test for {col}: p-value = {p}")
 #%%
+# Chi-squared test of every STREET against SHOOTING, each street against all the others
+# Most streets have only a few incidents, so their sparse tables get permutation p-values,
+# computed over a pool of worker processes
+street_chi_squared = level_chi_squared_tests(crime_df, 'STREET', target='SHOOTING', permutations=999)
+street_chi_squared.sort_values('p_value').head(10)
+#%%
 # Selecting categorical columns
-categorical_columns = crime_df.select_dtypes(include=['object', 'category']).columns
+categorical_columns = ['OFFENSE_CODE_GROUP', 'DISTRICT', 'REPORTING_AREA', 'SHOOTING', 'DAY_OF_WEEK', 'UCR_PART', 'STREET']
 # len(categorical_columns)
 #%%
 # Create a figure and a grid of subplots
@@ -855,11 +755,15 @@ plt.show()
 
 #%%
 # Assuming Shooting is a Yes/No variable, we convert it to 1/0
-crime_df['SHOOTING'] = crime_df['SHOOTING'].map({'Y': 1, 'N': 0})
+crime_df['SHOOTING'] = crime_df['SHOOTING'].map({'Y': 1, 'N': 0}).astype('int64')
 
 # %%[markdown]
 # Correlation Matrix
-correlations = crime_df[['YEAR','MONTH','HOUR','DATE','SHOOTING','Lat','Long']].corr()
+# The correlation statistics are accumulated batch by batch from the Parquet table,
+# so the matrix is computed without loading the full table into memory
+from correlation import correlation_from_table
+correlation_statistics = correlation_from_table("final_crime_data.parquet", ['YEAR','MONTH','HOUR','DATE','SHOOTING','Lat','Long'])
+correlations = correlation_statistics.correlation()
 correlations
 #%%
 shooting_correlations = correlations['SHOOTING'].sort_values()
@@ -870,7 +774,7 @@ sns.heatmap(correlations,annot = True)
 
 #%%
 # Scatterplot using plotly
-correlations = crime_df[['YEAR','MONTH','HOUR','DATE','SHOOTING','Lat','Long']].corr()
+correlations = correlation_statistics.correlation()
 
 # Create the heatmap
 fig = px.imshow(correlations, text_auto=True, aspect="auto", title='Correlation Heatmap')
@@ -881,11 +785,11 @@ fig.show()
 #%%[markdown]
 # Scatterplot for Latitude and Longitude
 custom_colors = [ '#1f77b4',  '#ff7f0e',   '#2ca02c',   '#d62728',   '#9467bd',   '#8c564b',  '#e377c2',   '#7f7f7f',   '#bcbd22',   '#17becf',   '#aec7e8',  '#ffbb78']
-sns.scatterplot(data=crime_df, x='Long', y='Lat', hue='DISTRICT', alpha=0.5, palette = custom_colors)
+# The incidents are binned into a pixel grid per district and shaded, instead of drawing one marker per incident
+from density import density_plot
+density_plot(crime_df, x='Long', y='Lat', hue='DISTRICT', palette = custom_colors, xlim=(-71.200,-71.000), ylim=(42.200,42.400))
 plt.legend(bbox_to_anchor=(1.05, 1), loc=2)
 plt.title('Scatter-plot for Latitude and Longitude')
-plt.xlim(-71.200,-71.000)
-plt.ylim(42.200,42.400)
 
 #%%[markdown]
 # Scatterplot to show the crime distribution across the Boston map
@@ -894,7 +798,7 @@ plt.ylim(42.200,42.400)
 #%%
 # For time series analysis 
 #%%
-crime_df = pd.read_csv("cleaned_data.csv", encoding='latin1')
+crime_df = load_table("cleaned_data.parquet")
 crime_df.shape
 crime_df.columns
 
@@ -902,12 +806,8 @@ crime_df.columns
 #%%[markdown]
 #Time series analysis
 
-# Convert 'OCCURRED_ON_DATE' to datetime and sort
-crime_df['OCCURRED_ON_DATE'] = pd.to_datetime(crime_df['OCCURRED_ON_DATE'])
-crime_df.sort_values('OCCURRED_ON_DATE', inplace=True)
-
-# Group by 'OCCURRED_ON_DATE' and 'SHOOTING', then count the incidents
-grouped_df = crime_df.groupby([pd.Grouper(key='OCCURRED_ON_DATE', freq='M'), 'SHOOTING']).size().reset_index(name='NUM_INCIDENTS')
+# Number of incidents per month and SHOOTING, rolled up from the count cube
+grouped_df = crime_cube.monthly('SHOOTING').reset_index(name='NUM_INCIDENTS')
 
 # Create the line plot
 fig = px.line(grouped_df, x='OCCURRED_ON_DATE', y='NUM_INCIDENTS', color='SHOOTING', title='Trend of Incidents Over Time by Shooting')
@@ -916,7 +816,7 @@ fig.show()
 # III) SMART QUESTIONS
 # I) 
 # Can we identify patterns or trends in the nature of crime over the years?
-crime_data = pd.read_csv("final_crime_data.csv", encoding='latin1')
+crime_data = load_table("final_crime_data.parquet")
 
 # Display the first few rows of the DataFrame to verify its structure
 print(crime_data.head())
@@ -925,22 +825,29 @@ print(crime_data.head())
 print(crime_data.columns)
 
 import pandas as pd
-from statsmodels.tsa.seasonal import seasonal_decompose
 import matplotlib.pyplot as plt
 
 crime_data['OCCURRED_ON_DATE'] = pd.to_datetime(crime_data['OCCURRED_ON_DATE'])
 
+# Hourly counts of every DISTRICT x OFFENSE_CODE_GROUP x SHOOTING series, counted once; the daily, weekly and
+# monthly series of any selection are derived from them without resampling the incidents again
+from timeseries import TimeSeriesStore
+crime_series = TimeSeriesStore(crime_data)
+
 # Set 'OCCURRED_ON_DATE' as the index
 crime_data.set_index('OCCURRED_ON_DATE', inplace=True)
 
-# Resample data to daily frequency
-crime_data_resampled = crime_data.resample('D').size()  # Adjust the frequency as needed
+# Daily number of incidents
+crime_data_resampled = crime_series.get('D')  # 'h', 'W' or 'M' for the other frequencies
 
 # Decompose time series data
-decomposition = seasonal_decompose(crime_data_resampled, model='additive', period=365)  # Assuming daily data with yearly seasonality
-trend = decomposition.trend
-seasonal = decomposition.seasonal
-residual = decomposition.resid
+# The decompositions of the series of the store are computed for all the series of a selection at once and cached
+from decomposition import BatchDecomposer
+decomposer = BatchDecomposer(crime_series)
+decomposition = decomposer.decompose(periods=[365])  # Assuming daily data with yearly seasonality
+trend = decomposition.trend['count']
+seasonal = decomposition.seasonal[365]['count']
+residual = decomposition.resid['count']
 
 # Plotting
 plt.figure(figsize=(12, 8))
@@ -968,19 +875,59 @@ plt.legend(loc='upper left')
 plt.tight_layout()
 plt.show()
 
+#%%
+# Trend, weekly and yearly seasonality of every district x offense group series, decomposed in one batch
+district_offense_decomposition = decomposer.decompose(by=['DISTRICT', 'OFFENSE_CODE_GROUP'], periods=[7, 365])
+
+# Weekly profile of every district, by the day of week of the dates (the series starts on the day of the first incident)
+weekly_seasonal = district_offense_decomposition.seasonal[7]
+weekly_profiles = weekly_seasonal.groupby(weekly_seasonal.index.dayofweek).mean().T.groupby(level='DISTRICT', observed=True).sum().T
+weekly_profiles.index = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+weekly_profiles.plot(figsize=(12, 6), title='Weekly seasonal component by district')
+plt.ylabel('Incidents per day')
+plt.show()
+
+# Offense groups whose trend changed the most between the first and the last year of the series
+group_trends = district_offense_decomposition.trend.T.groupby(level='OFFENSE_CODE_GROUP', observed=True).sum(min_count=1).T.dropna()
+print((group_trends.iloc[-1] - group_trends.iloc[0]).sort_values())
+
+#%%
+# Streaming detection of abnormal days: every district x offense group series keeps an EWMA baseline per day of
+# week and a CUSUM of its standardized daily counts, updated in O(1) per incident and checkpointed to disk.
+# The detector learns on the history up to the last 30 days, is saved, reloaded and fed the last 30 days one day
+# at a time, as a daily feed would be. Every feed day is closed by its calendar date, so a day without matching
+# incidents (no shooting) is still closed, and the alarms of the days an update closes on the way are kept too.
+from anomaly import AnomalyDetector
+# OCCURRED_ON_DATE is the index of crime_data since the time series analysis above
+daily_feed = crime_data.reset_index()[['OCCURRED_ON_DATE', 'DISTRICT', 'OFFENSE_CODE_GROUP', 'SHOOTING']]
+feed_start = daily_feed['OCCURRED_ON_DATE'].max().normalize() - pd.Timedelta(days=29)
+
+for name, detector in [('district_offense', AnomalyDetector()),
+                       ('shooting', AnomalyDetector(['DISTRICT'], where={'SHOOTING': 'Y'}))]:
+    detector.update(daily_feed[daily_feed['OCCURRED_ON_DATE'] < feed_start])
+    detector.save(f'{name}.detector.pkl')
+    detector = AnomalyDetector.load(f'{name}.detector.pkl')
+
+    feed_alarms = []
+    for day, incidents_of_day in daily_feed[daily_feed['OCCURRED_ON_DATE'] >= feed_start].groupby(
+            daily_feed['OCCURRED_ON_DATE'].dt.normalize()):
+        feed_alarms.append(detector.update(incidents_of_day))
+        feed_alarms.append(detector.close_day(day))
+    feed_alarms = pd.concat(feed_alarms, ignore_index=True)
+    print(f"{name}: {len(detector.keys)} series, {len(feed_alarms)} alarms in the last 30 days")
+    print(feed_alarms.sort_values('cusum', ascending=False).head(10))
+
 # II) 
 # Are there certain locations that have a higher or more violent crime rate compared to other areas of Boston?
 
-# Define a function to categorize crimes as "mild" or "brutal" based on their description
-def categorize_crime(description):
-    brutal_keywords = ['violence', 'assault', 'homicide', 'robbery', 'weapon', 'murder']
-    for keyword in brutal_keywords:
-        if keyword in description.lower():
-            return 'Brutal'
-    return 'Mild'
+# Categorize crimes as "mild" or "brutal" based on their description
+# The keywords ('violence', 'assault', 'homicide', 'robbery', 'weapon', 'murder') are each looked up on their own,
+# once per distinct description, and the result is broadcast to all rows through the category codes.
+# A different keyword table with more severity levels can be passed to SeverityClassifier.
+from severity import SeverityClassifier
 
 # Create a new column 'Crime_Category' based on the description
-crime_data['Crime_Category'] = crime_data['OFFENSE_DESCRIPTION'].apply(categorize_crime)
+crime_data['Crime_Category'] = SeverityClassifier().classify(crime_data['OFFENSE_DESCRIPTION'])
 
 # Calculate the count of "Brutal" crimes in each district
 brutal_counts = crime_data[crime_data['Crime_Category'] == 'Brutal']['DISTRICT'].value_counts().reset_index()
@@ -991,7 +938,7 @@ mild_counts = crime_data[crime_data['Crime_Category'] == 'Mild']['DISTRICT'].val
 mild_counts.columns = ['DISTRICT', 'Mild_Crime_Count']
 
 # Merge the "Brutal" and "Mild" counts based on the district
-merged_counts = pd.merge(brutal_counts, mild_counts, on='DISTRICT', how='outer').fillna(0)
+merged_counts = pd.merge(brutal_counts, mild_counts, on='DISTRICT', how='outer').fillna({'Brutal_Crime_Count': 0, 'Mild_Crime_Count': 0})
 
 # Sort the districts based on the number of "Brutal" crimes
 merged_counts = merged_counts.sort_values(by='Brutal_Crime_Count', ascending=False)
@@ -1015,12 +962,142 @@ plt.legend(handles=legend_handles, labels=legend_labels, title='Crime Category',
 
 plt.show()
 
+#%%
+# Locations below the district level
+# Every incident is assigned to a cell of a hierarchical geohash-style grid (about 300 m x 450 m at level 16,
+# four times larger per level up), and the index keeps the number of incidents of every cell by offense group,
+# severity and SHOOTING, so the queries below read the per-cell counts instead of the incident rows.
+from spatial import SpatialGridIndex
+grid_index = SpatialGridIndex(crime_data)
+
+# Hottest cells of about 1 km for brutal crimes and for shootings
+print(grid_index.hotspots(10, level=14, where={'Crime_Category': 'Brutal'}))
+print(grid_index.hotspots(10, level=14, where={'SHOOTING': 'Y'}))
+
+# Share of brutal crimes in the busiest cells
+cell_totals = grid_index.cell_counts(level=14)
+brutal_share = (grid_index.cell_counts(level=14, where={'Crime_Category': 'Brutal'}) / cell_totals).fillna(0)
+print(brutal_share[cell_totals.nlargest(20).index].sort_values(ascending=False))
+
+# Incidents around a point (its cell and the 8 cells around it) and in a bounding box
+print(grid_index.neighbourhood_count(42.3355, -71.0745, level=14))
+print(grid_index.bbox_count(42.33, 42.36, -71.08, -71.05, where={'Crime_Category': 'Brutal'}))
+
+#%%
+# Incidents near a point in a time window, and the nearest prior shooting of every incident
+# The coordinates are projected to metres and indexed with KD-trees per run of weekly time buckets,
+# so the queries of many points are answered at once without comparing every pair of incidents.
+from spacetime import SpatioTemporalIndex
+# OCCURRED_ON_DATE is the index of crime_data since the time series analysis of SMART question I
+incidents = crime_data.reset_index()
+incident_index = SpatioTemporalIndex(incidents)
+last_date = incidents['OCCURRED_ON_DATE'].max()
+nearby = incident_index.radius_query([42.3355], [-71.0745], [last_date], radius=300, window=pd.Timedelta(days=30))
+print(f"{len(nearby[0])} incidents within 300 m of the point in the 30 days up to {last_date}")
+print(incidents.iloc[nearby[0]]['OFFENSE_CODE_GROUP'].value_counts().head())
+
+# Distance in metres from every incident to the nearest shooting that happened before it
+shooting_index = SpatioTemporalIndex(incidents[incidents['SHOOTING'] == 'Y'])
+distance, _ = shooting_index.nearest_prior(incidents['Lat'], incidents['Long'], incidents['OCCURRED_ON_DATE'])
+nearest_prior_shooting = pd.Series(distance[:, 0], index=incidents.index).replace(np.inf, np.nan)
+print(nearest_prior_shooting.groupby(incidents['Crime_Category'], observed=True).median())
+
+#%%
+# Smoothed hotspot surfaces of brutal and mild crimes, of shootings and of every offense group
+# The incidents are counted on a 256 x 256 grid and the counts are convolved with a 250 m Gaussian kernel
+# through the FFT; the surfaces of every group of a column come from one batched call and are cached per time window.
+from hotspot import HotspotModel
+hotspot_model = HotspotModel(incidents)
+fig, axes = plt.subplots(1, 2, figsize=(16, 7))
+for ax, (start, end) in zip(axes, [('2016-01-01', '2017-01-01'), ('2017-01-01', '2018-01-01')]):
+    severity_surfaces = hotspot_model.surfaces('Crime_Category', start=start, end=end)
+    # Density of brutal crimes minus density of mild crimes, scaled to the same number of incidents
+    share = severity_surfaces.counts / severity_surfaces.counts.sum()
+    difference = severity_surfaces['Brutal'] / share[severity_surfaces.labels.get_loc('Brutal')] - severity_surfaces['Mild'] / share[severity_surfaces.labels.get_loc('Mild')]
+    limit = np.abs(difference).max()
+    image = ax.imshow(difference, origin='lower', extent=severity_surfaces.extent, aspect='auto', cmap='coolwarm', vmin=-limit, vmax=limit)
+    plt.colorbar(image, ax=ax, label='Brutal - Mild (per km², equal totals)')
+    ax.set_title(f'Brutal vs mild crime hotspots from {start} to {end}')
+plt.show()
+
+shooting_surfaces = hotspot_model.surfaces('SHOOTING')
+shooting_surfaces.plot('Y')
+plt.title('Shooting hotspots')
+plt.show()
+
+# Densest cell of every offense group, all the groups smoothed in one batched FFT
+offense_surfaces = hotspot_model.surfaces('OFFENSE_CODE_GROUP')
+print(pd.Series(offense_surfaces.density.max(axis=(1, 2)), index=offense_surfaces.labels).sort_values(ascending=False).head(10))
+
+#%%
+# Space-time clusters of shootings
+# Cylinders of map cells within 1.5 km of a centre cell over 1 to 8 consecutive weeks are scored by the likelihood ratio
+# of their share of shootings; 999 Monte Carlo replicates drawn on the grid of counts, spread over all the CPUs, give the p-values.
+from scan import SpaceTimeScan
+shooting_clusters = SpaceTimeScan(incidents).run(replicates=999)
+print(shooting_clusters.drop(columns='cells'))
+significant_clusters = shooting_clusters[shooting_clusters['p_value'] < 0.05]
+print(f"{len(significant_clusters)} significant shooting clusters")
+
+#%%
+# Near repeats: does a shooting raise the short-term risk of another one nearby?
+# The Knox test counts the pairs of shootings by distance band (100 m) and time lag band (7 days) and compares them
+# with 999 permutations of the times; a Knox ratio above 1 with a small p-value in the first bands means near repeats.
+from knox import knox_test, knox_tests
+shooting_knox = knox_test(incidents[incidents['SHOOTING'] == 'Y'], permutations=999)
+print(shooting_knox['knox_ratio'].unstack().round(2))
+print(shooting_knox['p_value'].unstack())
+
+# Same test for every offense group, the Knox ratio of the closest band (within 100 m and 7 days) of each
+offense_knox = knox_tests(incidents, 'OFFENSE_CODE_GROUP', permutations=99)
+closest_band = offense_knox.groupby(level='OFFENSE_CODE_GROUP', observed=True).head(1).droplevel(['distance_m', 'time_days'])
+print(closest_band.sort_values('knox_ratio', ascending=False))
+
 # III) Based on the three years' data, can we forecast the incidents of shootings for the upcoming years in Boston? 
 # Addressing the challenge of forecasting shooting incidents in Boston with three years of data involved constructing three distinct models: Logistic Regression, Classification Tree, and K-Nearest Neighbors (KNN). 
 # Each model was selected for its unique strengths and suitability in navigating the complexities of crime data, effectively tailoring the analysis to the specific requirements of the project.
 
 # Predictive Analysis and Modeling 
 
+#%%
+# Self-exciting (Hawkes) model of the shooting times
+# Every district has a baseline rate of shootings, and every shooting raises the rate of its district (and, with the
+# cross-district excitation, of the other districts) by a bump that decays exponentially. The likelihood is computed
+# with the O(n) recursion of the exponential kernel, so the three years of shootings are fitted in well under a second.
+# The offense rows of a shooting are one event (deduplicated by INCIDENT_NUMBER), and shootings at the same minute do not excite each other.
+from hawkes import HawkesModel
+shootings = incidents[incidents['SHOOTING'] == 'Y']
+shooting_hawkes = HawkesModel(cross_excitation=True).fit(shootings)
+print(shooting_hawkes.baseline)
+print(f"Shootings triggered per shooting: {shooting_hawkes.alpha:.3f} in its district, {shooting_hawkes.gamma:.4f} in every other district")
+print(f"Mean delay of a triggered shooting: {24 / shooting_hawkes.beta:.1f} hours")
+
+# Expected number of shootings of every district over the next 14 days
+shooting_forecast = shooting_hawkes.forecast(days=14)
+shooting_forecast.plot(figsize=(12, 6), title='Expected shootings per day and district (Hawkes model)')
+plt.ylabel('Expected shootings')
+plt.show()
+print(shooting_forecast.sum().sort_values(ascending=False))
+
+#%%
+# Weekly shooting counts per district: count models compared on rolling-origin backtests
+# Every one of the last 26 weeks is an origin, the models are fitted on the weeks before it and scored on the next 4 weeks.
+# The folds run in parallel and are cached in shooting_forecast.folds.pkl, so rerunning after a new week only fits the new origin.
+# The shootings are counted per incident, as in the scan, Knox and Hawkes analyses, not per offense row.
+from forecasting import ShootingForecaster, backtest_scores
+shooting_series = TimeSeriesStore(crime_data.reset_index(), dimensions=['DISTRICT', 'SHOOTING'], incident='INCIDENT_NUMBER')
+shooting_forecaster = ShootingForecaster(shooting_series, freq='W', cache_path='shooting_forecast.folds.pkl')
+shooting_folds = shooting_forecaster.backtest(horizon=4, n_origins=26)
+print(backtest_scores(shooting_folds))
+print(backtest_scores(shooting_folds, by=['DISTRICT', 'model'])['mae'].unstack())
+
+# Weekly shooting forecasts of the next 8 weeks with the model of the lowest backtest deviance
+best_model = backtest_scores(shooting_folds)['poisson_deviance'].idxmin()
+weekly_shooting_forecast = shooting_forecaster.forecast(8, model=best_model)
+weekly_shooting_forecast.plot(figsize=(12, 6), title=f'Expected shootings per week and district ({best_model})')
+plt.ylabel('Expected shootings')
+plt.show()
+
 #%%
 # Final dataset
 # Considering the interested columns.
@@ -1054,9 +1131,10 @@ reported_shootings = crime_data[crime_data['SHOOTING'] == 'Y']
 balanced_dataset = pd.concat([reported_shootings, sampled_non_reported], ignore_index=True)
 
 balanced_dataset = balanced_dataset.sample(frac=1, random_state=42).reset_index(drop=True)
-balanced_dataset.to_csv('Balanced_data.csv', index = False)
+save_table(balanced_dataset, 'Balanced_data.parquet')
 
-# After implementing the stratified sampling technique to balance our dataset, particularly focusing on the 'DISTRICT' variable, the resultant dataset was saved as a CSV file. 
+# After implementing the stratified sampling technique to balance our dataset, particularly focusing on the 'DISTRICT' variable, the resultant dataset was saved as a Parquet file
+# (the committed 'Balanced_data.csv' is converted to Parquet the first time it is loaded). 
 # This step is crucial for ensuring consistency in our modeling process. The reason behind saving the stratified sample to a CSV file stems from the nature of our sampling method: 
 # each execution of the stratified sampling code can potentially yield a slightly different dataset due to the randomness inherent in the sampling process.
 # By saving the stratified dataset as a CSV, we establish a fixed dataset that can be reliably used for all subsequent modeling. 
@@ -1080,7 +1158,7 @@ from sklearn.pipeline import Pipeline
 import matplotlib.pyplot as plt
 
 # Load the balanced_dataset
-crime_data = pd.read_csv('Balanced_data.csv')
+crime_data = load_table('Balanced_data.parquet')
 
 # Selecting features and target variable
 X = crime_data.drop(['OFFENSE_CODE', 'INCIDENT_NUMBER', 'OCCURRED_ON_DATE', 'SHOOTING'], axis=1)
@@ -1165,7 +1243,7 @@ from sklearn.preprocessing import StandardScaler, OneHotEncoder
 import matplotlib.pyplot as plt
 
 # Load the balanced dataset
-crime_data = pd.read_csv('Balanced_data.csv')
+crime_data = load_table('Balanced_data.parquet')
 
 # Selecting features and target variable
 X = crime_data.drop(['INCIDENT_NUMBER', 'OCCURRED_ON_DATE', 'SHOOTING'], axis=1)
@@ -1231,7 +1309,7 @@ from sklearn.model_selection import cross_val_score
 import matplotlib.pyplot as plt
 
 # Load the balanced_dataset
-crime_data = pd.read_csv('Balanced_data.csv')
+crime_data = load_table('Balanced_data.parquet')
 
 # Selecting features and target variable
 X = crime_data.drop(['OFFENSE_CODE', 'INCIDENT_NUMBER', 'OCCURRED_ON_DATE', 'SHOOTING'], axis=1)
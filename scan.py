@@ -0,0 +1,234 @@
+#%%
+# Space-time scan statistic for clusters of shootings
+# The shootings were only looked at as yearly and monthly counts. Here the incidents are counted on a grid of
+# map cells x weeks, and every cylinder (the cells within a radius of a centre cell, during a run of consecutive
+# weeks) is scored with the Bernoulli likelihood ratio of its shootings among all its incidents. The significance
+# of the best cylinders is obtained by Monte Carlo: the shootings are redistributed at random among the incidents
+# by drawing the counts of the grid directly, so a replicate never touches the incident rows, and the replicates
+# are spread over a process pool.
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from parallel import worker_count
+from spacetime import project_coordinates
+from spatial import cell_bounds, grid_cells
+
+# Grid level of the map cells (about 600 m x 900 m around Boston)
+SCAN_LEVEL = 15
+
+# Length of the time units, and the longest run of time units a cylinder covers
+DEFAULT_TIME_UNIT = pd.Timedelta(days=7)
+MAX_WINDOW_UNITS = 8
+
+# Largest radius of a cylinder in metres, and the largest number of cells it holds
+MAX_RADIUS_M = 1500
+MAX_NEIGHBOURS = 20
+
+# Columns of the clusters returned by SpaceTimeScan.run
+CLUSTER_COLUMNS = ['lat', 'lon', 'radius_m', 'cells', 'start', 'end', 'cases', 'population', 'expected',
+                   'relative_risk', 'llr', 'p_value']
+
+
+def _relative_risk(cases, population, total_cases, total_population):
+    # Case rate inside a cylinder over the case rate outside it, inf when all the cases are inside and
+    # undefined when all the incidents are inside
+    outside_cases, outside_population = total_cases - cases, total_population - population
+    if outside_population == 0:
+        return np.nan
+    if outside_cases == 0:
+        return np.inf
+    return (cases / population) / (outside_cases / outside_population)
+
+
+def _xlogx(n):
+    # Table of x * log(x) for the integers 0..n, with 0 log 0 = 0
+    values = np.arange(n + 1, dtype=np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.nan_to_num(values * np.log(values))
+
+
+def _prefix_sums(counts, neighbours):
+    # Counts of the growing circles of every centre, cumulated along the neighbours and then along time,
+    # so the count of a cylinder is a difference of two prefix sums. The neighbours padded with the index
+    # one past the last cell refer to an empty cell.
+    padded = np.vstack([counts, np.zeros((1, counts.shape[1]), dtype=counts.dtype)])
+    prefix = np.cumsum(np.cumsum(padded[neighbours], axis=1), axis=2)
+    return np.concatenate([np.zeros(prefix.shape[:2] + (1,), dtype=prefix.dtype), prefix], axis=2)
+
+
+def _log_likelihood_ratio(c, n, total_cases, total, xlogx):
+    # Bernoulli log likelihood ratio of c cases among n incidents inside a cylinder
+    null = xlogx[total_cases] + xlogx[total - total_cases] - xlogx[total]
+    return (xlogx[c] + xlogx[n - c] - xlogx[n] + xlogx[total_cases - c]
+            + xlogx[total - n - total_cases + c] - xlogx[total - n] - null)
+
+
+def _window_statistics(cases, population, neighbours, max_window):
+    # Log likelihood ratio of every cylinder, as one (centres, neighbours, starts) array per window length
+    total_cases, total = int(cases.sum()), int(population.sum())
+    xlogx = _xlogx(total)
+    prefix_cases, prefix_population = _prefix_sums(cases, neighbours), _prefix_sums(population, neighbours)
+    for length in range(1, min(max_window, cases.shape[1]) + 1):
+        c = prefix_cases[..., length:] - prefix_cases[..., :-length]
+        n = prefix_population[..., length:] - prefix_population[..., :-length]
+        # Only the cylinders with a higher rate inside than outside are clusters
+        high = c * total > total_cases * n
+        yield length, c, n, np.where(high, _log_likelihood_ratio(c, n, total_cases, total, xlogx), 0)
+
+
+def _replicate_maxima(population, neighbours, total_cases, max_window, replicates, seed):
+    # Largest statistic of every Monte Carlo replicate. Shuffling the shootings among the incidents gives
+    # grid counts drawn from a multivariate hypergeometric distribution with the population of the grid.
+    # The population is the same in every replicate, and only the cylinders with a high rate are scored.
+    rng = np.random.default_rng(seed)
+    total = int(population.sum())
+    xlogx = _xlogx(total)
+    prefix_population = _prefix_sums(population, neighbours)
+    maxima = np.zeros(replicates)
+    for replicate in range(replicates):
+        cases = rng.multivariate_hypergeometric(population.ravel(), total_cases).reshape(population.shape)
+        prefix_cases = _prefix_sums(cases, neighbours)
+        for length in range(1, min(max_window, population.shape[1]) + 1):
+            c = prefix_cases[..., length:] - prefix_cases[..., :-length]
+            n = prefix_population[..., length:] - prefix_population[..., :-length]
+            high = c * total > total_cases * n
+            if high.any():
+                statistics = _log_likelihood_ratio(c[high], n[high], total_cases, total, xlogx)
+                maxima[replicate] = max(maxima[replicate], statistics.max())
+    return maxima
+
+
+class SpaceTimeScan:
+    """
+    Bernoulli space-time scan statistic of the cases (by default the shootings) among all the incidents.
+
+    :param data: pandas DataFrame of incidents with 'Lat', 'Long' and 'OCCURRED_ON_DATE'
+    :param case_column: name of the column identifying the cases
+    :param case_label: value of case_column of the cases
+    :param incident: name of the incident number column, the rows of an incident with several offenses are one
+                     incident, a case when any of its rows is one; None when every row is an incident
+    :param level: grid level of the map cells
+    :param time_unit: length of the time units, a pandas Timedelta
+    :param max_window: largest number of consecutive time units of a cylinder
+    :param max_radius: largest radius of a cylinder in metres, between the centres of the cells
+    :param max_neighbours: largest number of cells of a cylinder
+    """
+
+    def __init__(self, data, case_column='SHOOTING', case_label='Y', incident='INCIDENT_NUMBER', level=SCAN_LEVEL,
+                 time_unit=DEFAULT_TIME_UNIT, max_window=MAX_WINDOW_UNITS, max_radius=MAX_RADIUS_M,
+                 max_neighbours=MAX_NEIGHBOURS):
+        self.level, self.max_window = level, max_window
+        self.time_unit = pd.Timedelta(time_unit)
+
+        is_case = data[case_column] == case_label
+        if incident is not None:
+            is_case = is_case.groupby(data[incident], dropna=False, observed=True).transform('any').astype(bool)
+            first = ~data[incident].duplicated()
+            data, is_case = data[first], is_case[first]
+        times = pd.to_datetime(data['OCCURRED_ON_DATE'])
+        cells = grid_cells(data['Lat'], data['Long'], level)
+        valid = (cells.notna() & times.notna()).to_numpy()
+        times, cells = times[valid], cells[valid].to_numpy(dtype=np.int64)
+        is_case = is_case.to_numpy()[valid]
+
+        # Grid of the incidents and of the cases, map cells x time units
+        self.start = times.min().normalize()
+        units = ((times - self.start) // self.time_unit).to_numpy()
+        cell_ids, self.cells = pd.factorize(cells, sort=True)
+        self.periods = pd.date_range(self.start, periods=units.max() + 1, freq=self.time_unit)
+        shape = (len(self.cells), len(self.periods))
+        flat = cell_ids * shape[1] + units
+        self.population = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+        self.cases = np.bincount(flat[is_case], minlength=shape[0] * shape[1]).reshape(shape)
+
+        # Cells around every centre cell by increasing distance, padded with the index of an empty cell
+        self.bounds = cell_bounds(self.cells, level)
+        centres = project_coordinates(self.bounds['lat'], self.bounds['lon'])
+        k = min(max_neighbours, len(self.cells))
+        distances, neighbours = cKDTree(centres).query(centres, k=k, distance_upper_bound=max_radius)
+        distances, neighbours = distances.reshape(len(centres), k), neighbours.reshape(len(centres), k)
+        # Columns past the largest circle within the radius only hold padding, they are dropped
+        k = max(int(np.isfinite(distances).sum(axis=1).max()), 1)
+        self.distances, self.neighbours = distances[:, :k], neighbours[:, :k]
+
+    def _candidates(self):
+        # Best time window of every circle, as a DataFrame of (centre, size, start, length, cases, population, llr)
+        best = None
+        for length, c, n, statistics in _window_statistics(self.cases, self.population, self.neighbours,
+                                                           self.max_window):
+            start = statistics.argmax(axis=2)
+            llr = np.take_along_axis(statistics, start[..., None], axis=2)[..., 0]
+            current = {'start': start, 'length': np.full(start.shape, length), 'llr': llr,
+                       'cases': np.take_along_axis(c, start[..., None], axis=2)[..., 0],
+                       'population': np.take_along_axis(n, start[..., None], axis=2)[..., 0]}
+            if best is None:
+                best = current
+            else:
+                better = current['llr'] > best['llr']
+                best = {key: np.where(better, current[key], best[key]) for key in best}
+
+        centre, size = np.indices(best['llr'].shape)
+        candidates = pd.DataFrame({'centre': centre.ravel(), 'size': size.ravel() + 1,
+                                   **{key: values.ravel() for key, values in best.items()}})
+        # Circles padded with the empty cell repeat the previous circle
+        return candidates[(candidates['llr'] > 0) & (self.neighbours[centre, size].ravel() < len(self.cells))]
+
+    def run(self, replicates=999, n_clusters=10, n_jobs=None, random_state=0):
+        """
+        Most likely cluster and the secondary clusters that do not overlap it, with their Monte Carlo p-values.
+
+        :param replicates: number of Monte Carlo replicates
+        :param n_clusters: largest number of clusters to return
+        :param n_jobs: number of worker processes for the replicates, parallel.worker_count() when None
+        :param random_state: seed of the replicates
+        :return: pandas DataFrame of the clusters ordered by likelihood ratio, with the centre, radius, cells
+                 and time window of every cluster, its cases, incidents, expected cases, relative risk,
+                 log likelihood ratio and p-value
+        """
+        candidates = self._candidates().sort_values('llr', ascending=False)
+
+        # Clusters overlapping a stronger cluster in space and time are skipped
+        clusters, taken = [], []
+        for row in candidates.itertuples():
+            cells = set(self.neighbours[row.centre, :row.size])
+            end = row.start + row.length
+            if any(cells & other_cells and row.start < other_end and other_start < end
+                   for other_cells, other_start, other_end in taken):
+                continue
+            taken.append((cells, row.start, end))
+            clusters.append(row)
+            if len(clusters) == n_clusters:
+                break
+
+        n_jobs = worker_count(n_jobs)
+        seeds = np.random.SeedSequence(random_state).spawn(n_jobs)
+        chunks = [replicates // n_jobs + (worker < replicates % n_jobs) for worker in range(n_jobs)]
+        arguments = (self.population, self.neighbours, int(self.cases.sum()), self.max_window)
+        if n_jobs == 1:
+            maxima = _replicate_maxima(*arguments, chunks[0], seeds[0])
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                futures = [executor.submit(_replicate_maxima, *arguments, chunk, seed)
+                           for chunk, seed in zip(chunks, seeds) if chunk > 0]
+                maxima = np.concatenate([future.result() for future in futures])
+
+        total_cases, total_population = self.cases.sum(), self.population.sum()
+        rate = total_cases / total_population
+        return pd.DataFrame([{
+            'lat': self.bounds['lat'].iloc[row.centre],
+            'lon': self.bounds['lon'].iloc[row.centre],
+            'radius_m': self.distances[row.centre, row.size - 1],
+            'cells': list(self.cells[self.neighbours[row.centre, :row.size]]),
+            'start': self.periods[row.start],
+            'end': self.periods[row.start] + row.length * self.time_unit,
+            'cases': row.cases,
+            'population': row.population,
+            'expected': row.population * rate,
+            'relative_risk': _relative_risk(row.cases, row.population, total_cases, total_population),
+            'llr': row.llr,
+            # A secondary cluster is compared with the most likely cluster of every replicate, which is conservative
+            'p_value': (1 + (maxima >= row.llr * (1 - 1e-12)).sum()) / (replicates + 1),
+        } for row in clusters], columns=CLUSTER_COLUMNS)
@@ -0,0 +1,78 @@
+#%%
+# Severity classification of offenses based on keywords in OFFENSE_DESCRIPTION
+# There are only a few hundred distinct descriptions, so the keyword rules are evaluated once per
+# distinct description, and the result is broadcast to every row through the category codes of the
+# description column. Every keyword is looked up on its own, so a keyword that overlaps or contains
+# another one (e.g. 'armed robbery' and 'robbery') cannot hide it.
+import numpy as np
+import pandas as pd
+
+# Keywords that mark an offense as 'Brutal', every other offense is 'Mild'
+BRUTAL_KEYWORDS = ['violence', 'assault', 'homicide', 'robbery', 'weapon', 'murder']
+
+# Default keyword to severity table, equivalent to the original two level categorize_crime
+DEFAULT_SEVERITY_KEYWORDS = {keyword: 'Brutal' for keyword in BRUTAL_KEYWORDS}
+
+# Default severity levels, ordered from the least to the most severe
+DEFAULT_SEVERITY_LEVELS = ['Mild', 'Brutal']
+
+
+class SeverityClassifier:
+    """
+    Classify offense descriptions into ordered severity levels from a keyword table.
+
+    A description containing several keywords gets the most severe of their levels,
+    and a description without any keyword gets the lowest level.
+
+    :param keyword_severity: dict mapping keywords (matched case-insensitively anywhere in the description) to levels
+    :param levels: list of severity levels ordered from the least to the most severe
+    """
+
+    def __init__(self, keyword_severity=None, levels=None):
+        self.keyword_severity = {keyword.lower(): level for keyword, level in
+                                 (keyword_severity or DEFAULT_SEVERITY_KEYWORDS).items()}
+        self.levels = list(levels or DEFAULT_SEVERITY_LEVELS)
+
+        unknown_levels = set(self.keyword_severity.values()) - set(self.levels)
+        if unknown_levels:
+            raise ValueError(f"Severity levels {sorted(unknown_levels)} are not in {self.levels}")
+
+        self.rank = {level: rank for rank, level in enumerate(self.levels)}
+
+        # Most severe keywords first, so the first keyword found gives the highest level of the description
+        self.ranked_keywords = sorted(self.keyword_severity.items(), key=lambda item: self.rank[item[1]],
+                                      reverse=True)
+
+    def classify_description(self, description):
+        """
+        Classify a single offense description.
+
+        :param description: offense description, missing values get the lowest level
+        :return: severity level
+        """
+        if not isinstance(description, str):
+            return self.levels[0]
+
+        description = description.lower()
+        for keyword, level in self.ranked_keywords:
+            if keyword in description:
+                return level
+        return self.levels[0]
+
+    def classify(self, descriptions):
+        """
+        Classify a column of offense descriptions.
+
+        :param descriptions: pandas Series of offense descriptions
+        :return: ordered categorical pandas Series of severity levels
+        """
+        descriptions = descriptions.astype('category')
+
+        # Severity of every distinct description, looked up for every row through the category codes
+        category_ranks = np.array([self.rank[self.classify_description(description)]
+                                   for description in descriptions.cat.categories], dtype=np.int8)
+        codes = descriptions.cat.codes.to_numpy()
+        ranks = np.where(codes >= 0, category_ranks[codes] if len(category_ranks) else 0, 0)
+
+        severity = pd.Categorical.from_codes(ranks, categories=self.levels, ordered=True)
+        return pd.Series(severity, index=descriptions.index, name='Crime_Category')
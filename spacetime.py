@@ -0,0 +1,237 @@
+#%%
+# Spatio-temporal radius and nearest-neighbour queries over the incidents
+# Questions such as "all incidents within 300 m of this point in the last 30 days" or "the nearest prior
+# shooting of every incident" used to require comparing every pair of rows. Here the coordinates are
+# projected to metres and the incidents are partitioned into fixed time buckets. KD-trees are built over
+# aligned runs of 1, 2, 4, 8, ... buckets (like the nodes of a segment tree), so any time window is covered
+# by a few trees plus the two buckets at its ends, whose incidents are filtered by time. Every tree is
+# searched for all the query points that need it at once.
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from spatial import inside_city
+
+# Reference point of the projection (Boston), and the Earth radius in metres
+REFERENCE_LAT = 42.32
+REFERENCE_LON = -71.08
+EARTH_RADIUS_M = 6_371_000
+
+# Length of the time buckets
+DEFAULT_BUCKET = pd.Timedelta(days=7)
+
+
+def project_coordinates(lat, lon):
+    """
+    Project latitudes and longitudes to metres east and north of the reference point.
+
+    The equirectangular projection is accurate to a fraction of a percent over the extent of a city.
+
+    :param lat: array-like of latitudes
+    :param lon: array-like of longitudes
+    :return: numpy array of shape (n, 2) with the x and y coordinates in metres
+    """
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    x = (lon - np.radians(REFERENCE_LON)) * np.cos(np.radians(REFERENCE_LAT)) * EARTH_RADIUS_M
+    y = (lat - np.radians(REFERENCE_LAT)) * EARTH_RADIUS_M
+    return np.column_stack([x, y])
+
+
+def _nanoseconds(times):
+    return pd.to_datetime(pd.Series(np.asarray(times))).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+
+
+def _query_points(lat, lon):
+    # Projected query points, the ones outside the city are missing and find nothing
+    points = project_coordinates(lat, lon)
+    points[~inside_city(lat, lon)] = np.nan
+    return points
+
+
+def _group_by(keys):
+    # Positions of every distinct key, as a list of (key, positions)
+    order = np.argsort(keys, kind='stable')
+    unique_keys, starts = np.unique(keys[order], return_index=True)
+    return zip(unique_keys, np.split(order, starts[1:]))
+
+
+class SpatioTemporalIndex:
+    """
+    KD-trees over the projected coordinates of the incidents, over aligned runs of time buckets.
+
+    The query results refer to the incidents by their row position in the indexed DataFrame (use .iloc),
+    the rows without time or without coordinates inside the city (the Lat/Long = -1 placeholders) are not indexed.
+
+    :param data: pandas DataFrame of incidents
+    :param bucket: length of the time buckets, a pandas Timedelta
+    :param lat: name of the latitude column
+    :param lon: name of the longitude column
+    :param time: name of the time column
+    """
+
+    def __init__(self, data, bucket=DEFAULT_BUCKET, lat='Lat', lon='Long', time='OCCURRED_ON_DATE'):
+        self.bucket = pd.Timedelta(bucket).value
+        valid = inside_city(data[lat], data[lon]) & data[time].notna().to_numpy()
+        times = _nanoseconds(data[time])[valid]
+        points = project_coordinates(data[lat].to_numpy()[valid], data[lon].to_numpy()[valid])
+
+        # Rows sorted by time, so every run of buckets is a contiguous slice
+        order = np.argsort(times, kind='stable')
+        self.positions = np.flatnonzero(valid)[order]
+        self.times = times[order]
+        self.points = points[order]
+        self.first_bucket = int(self.times[0] // self.bucket) if len(self.times) else 0
+        self.bucket_ids = self.times // self.bucket - self.first_bucket
+        self.n_buckets = int(self.bucket_ids[-1]) + 1 if len(self.times) else 0
+        self.trees = {}
+
+    def _tree(self, level, node):
+        # KD-tree of the buckets [node * 2**level, (node + 1) * 2**level), built on first use
+        if (level, node) not in self.trees:
+            start, end = np.searchsorted(self.bucket_ids, [node << level, (node + 1) << level])
+            self.trees[(level, node)] = (cKDTree(self.points[start:end]), start) if end > start else None
+        return self.trees[(level, node)]
+
+    def _plan(self, points, start, end):
+        # Trees to search for the time windows [start, end) of the queries: (level, node, queries, filter by time)
+        # The queries without coordinates or time are not planned, they find nothing
+        first = np.clip(start // self.bucket - self.first_bucket, 0, None)
+        last = np.clip((end - 1) // self.bucket - self.first_bucket, None, self.n_buckets - 1)
+        valid = (first <= last) & np.isfinite(points).all(axis=1) & (end > np.iinfo(np.int64).min + 1)
+
+        # The buckets at the ends of a window are only partly inside it, their incidents are filtered by time
+        # (a window inside a single bucket is filtered once)
+        partial_first = valid & (start > (first + self.first_bucket) * self.bucket)
+        partial_last = valid & (end < (last + 1 + self.first_bucket) * self.bucket) & ~(partial_first & (first == last))
+        plans = []
+        for mask, buckets in [(partial_first, first), (partial_last, last)]:
+            for node, queries in _group_by(buckets[mask]):
+                plans.append((0, int(node), np.flatnonzero(mask)[queries], True))
+
+        # The whole buckets in between are covered by aligned runs, as in a bottom-up segment tree query
+        low = np.where(partial_first, first + 1, first)
+        high = np.where(partial_last, last, last + 1)
+        low, high = np.where(valid, low, 0), np.where(valid, high, 0)
+        query_ids, levels, nodes = [], [], []
+        level = 0
+        while (low < high).any():
+            left = (low < high) & (low & 1 == 1)
+            query_ids.append(np.flatnonzero(left)), levels.append(np.full(left.sum(), level)), nodes.append(low[left])
+            low = low + left
+            right = (low < high) & (high & 1 == 1)
+            high = high - right
+            query_ids.append(np.flatnonzero(right)), levels.append(np.full(right.sum(), level)), nodes.append(high[right])
+            low, high, level = low >> 1, high >> 1, level + 1
+
+        if query_ids:
+            query_ids, levels, nodes = np.concatenate(query_ids), np.concatenate(levels), np.concatenate(nodes)
+            for key, members in _group_by(levels * (self.n_buckets + 1) + nodes):
+                level, node = divmod(int(key), self.n_buckets + 1)
+                plans.append((level, node, query_ids[members], False))
+        return plans
+
+    def radius_query(self, lat, lon, times, radius, window):
+        """
+        Incidents within a distance of every query point, during the window before the query time.
+
+        :param lat: array-like of query latitudes
+        :param lon: array-like of query longitudes
+        :param times: array-like of query times
+        :param radius: distance in metres
+        :param window: length of the window before every query time, the query time included, a pandas Timedelta
+        :return: list with, for every query point, a numpy array of the row positions of the incidents found
+        """
+        points = _query_points(lat, lon)
+        end = _nanoseconds(times) + 1
+        start = end - 1 - pd.Timedelta(window).value
+
+        query_ids, found = [], []
+        for level, node, queries, filtered in self._plan(points, start, end):
+            tree = self._tree(level, node)
+            if tree is None:
+                continue
+            tree, offset = tree
+            neighbours = tree.query_ball_point(points[queries], radius, return_sorted=False)
+            lengths = np.fromiter((len(rows) for rows in neighbours), dtype=np.int64, count=len(queries))
+            rows = offset + np.fromiter((row for rows in neighbours for row in rows), dtype=np.int64,
+                                        count=lengths.sum())
+            owners = np.repeat(queries, lengths)
+            if filtered:
+                in_window = (self.times[rows] >= start[owners]) & (self.times[rows] < end[owners])
+                rows, owners = rows[in_window], owners[in_window]
+            query_ids.append(owners)
+            found.append(self.positions[rows])
+
+        query_ids = np.concatenate(query_ids) if query_ids else np.zeros(0, dtype=np.int64)
+        found = np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+        order = np.argsort(query_ids, kind='stable')
+        return np.split(found[order], np.searchsorted(query_ids[order], np.arange(1, len(points))))
+
+    def _filtered_nearest(self, tree, offset, points, start, end, k):
+        # k nearest rows of a tree whose time is in [start, end), asking the tree for more
+        # neighbours until k of them are in the window or the tree is exhausted
+        distances = np.full((len(points), k), np.inf)
+        rows = np.full((len(points), k), -1, dtype=np.int64)
+        pending = np.arange(len(points))
+        candidates = min(2 * k, tree.n)
+        while len(pending):
+            found_distances, found_rows = tree.query(points[pending], k=candidates)
+            found_distances = found_distances.reshape(len(pending), -1)
+            found_rows = found_rows.reshape(len(pending), -1)
+
+            exists = found_rows < tree.n
+            found_times = self.times[offset + np.where(exists, found_rows, 0)]
+            keep = exists & (found_times >= start[pending, None]) & (found_times < end[pending, None])
+
+            # Kept neighbours first, in the order of their distance
+            rank = np.argsort(~keep, axis=1, kind='stable')[:, :k]
+            kept = np.take_along_axis(keep, rank, axis=1)
+            distances[pending, :rank.shape[1]] = np.where(kept, np.take_along_axis(found_distances, rank, axis=1), np.inf)
+            rows[pending, :rank.shape[1]] = np.where(kept, offset + np.take_along_axis(found_rows, rank, axis=1), -1)
+
+            done = (keep.sum(axis=1) >= k) | (candidates >= tree.n)
+            pending = pending[~done]
+            candidates = min(2 * candidates, tree.n)
+        return distances, rows
+
+    def nearest_prior(self, lat, lon, times, k=1, max_age=None):
+        """
+        k nearest incidents that happened strictly before every query time.
+
+        :param lat: array-like of query latitudes
+        :param lon: array-like of query longitudes
+        :param times: array-like of query times
+        :param k: number of neighbours
+        :param max_age: optional pandas Timedelta, only the incidents at most this long before the query are searched
+        :return: tuple of (distances in metres, row positions), numpy arrays of shape (n, k) padded with inf and -1
+        """
+        points = _query_points(lat, lon)
+        end = _nanoseconds(times)
+        if max_age is None:
+            start = np.full(len(end), self.times[0] if len(self.times) else 0)
+        else:
+            start = end - pd.Timedelta(max_age).value
+
+        best_distances = np.full((len(points), k), np.inf)
+        best_rows = np.full((len(points), k), -1, dtype=np.int64)
+        for level, node, queries, filtered in self._plan(points, start, end):
+            tree = self._tree(level, node)
+            if tree is None:
+                continue
+            tree, offset = tree
+            if filtered:
+                distances, rows = self._filtered_nearest(tree, offset, points[queries], start[queries], end[queries], k)
+            else:
+                distances, rows = np.full((len(queries), k), np.inf), np.full((len(queries), k), -1, dtype=np.int64)
+                found_distances, found_rows = tree.query(points[queries], k=min(k, tree.n))
+                distances[:, :min(k, tree.n)] = found_distances.reshape(len(queries), -1)
+                rows[:, :min(k, tree.n)] = offset + found_rows.reshape(len(queries), -1)
+
+            merged_distances = np.concatenate([best_distances[queries], distances], axis=1)
+            merged_rows = np.concatenate([best_rows[queries], rows], axis=1)
+            nearest = np.argsort(merged_distances, axis=1, kind='stable')[:, :k]
+            best_distances[queries] = np.take_along_axis(merged_distances, nearest, axis=1)
+            best_rows[queries] = np.take_along_axis(merged_rows, nearest, axis=1)
+
+        return best_distances, np.where(best_rows >= 0, self.positions[np.maximum(best_rows, 0)], -1)
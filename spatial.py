@@ -0,0 +1,210 @@
+#%%
+# Hierarchical spatial grid index over the incident coordinates
+# The location questions were only answered at DISTRICT granularity. Here every incident is assigned at
+# ingest to a cell of a geohash-style grid: the latitude and the longitude are quantized and their bits are
+# interleaved into one integer (a Morton code), so the cell of a coarser level is obtained by dropping the
+# last bits of the code. The index keeps the number of incidents of every cell by offense group, severity
+# and SHOOTING in a count cube, and the hotspot, bounding box and neighbourhood queries only read those
+# per-cell counts instead of the incident rows.
+import numpy as np
+import pandas as pd
+
+from cube import CountCube
+
+# Number of bits per axis of the cells kept in the index (about 300 m x 450 m around Boston)
+GRID_LEVEL = 16
+
+# Attributes the per-cell counts are split by
+GRID_ATTRIBUTES = ['OFFENSE_CODE_GROUP', 'Crime_Category', 'SHOOTING']
+
+# Name of the cell column added to the incidents
+CELL_COLUMN = 'GRID_CELL'
+
+# Extent of the city, the coordinates outside it (the Lat/Long = -1 placeholders of the export) are not locations
+CITY_LAT = (42.2, 42.45)
+CITY_LON = (-71.2, -70.9)
+
+
+def _spread_bits(values):
+    # Insert a zero bit between the bits of 32-bit integers
+    values = values.astype(np.uint64)
+    for shift, mask in [(16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)]:
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def _compact_bits(values):
+    # Inverse of _spread_bits, keep every other bit
+    values = values.astype(np.uint64) & np.uint64(0x5555555555555555)
+    for shift, mask in [(1, 0x3333333333333333), (2, 0x0F0F0F0F0F0F0F0F), (4, 0x00FF00FF00FF00FF),
+                        (8, 0x0000FFFF0000FFFF), (16, 0x00000000FFFFFFFF)]:
+        values = (values | (values >> np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def _axis_indices(lat, lon, level):
+    # Row and column of the cell of every point at a level, on the whole globe like geohash
+    size = 1 << level
+    row = np.floor((np.asarray(lat, dtype=np.float64) + 90) / 180 * size)
+    column = np.floor((np.asarray(lon, dtype=np.float64) + 180) / 360 * size)
+    return np.clip(row, 0, size - 1), np.clip(column, 0, size - 1)
+
+
+def _interleave(row, column):
+    # Morton code, the longitude bits come first as in geohash
+    return ((_spread_bits(column) << np.uint64(1)) | _spread_bits(row)).astype(np.int64)
+
+
+def _deinterleave(cells):
+    cells = np.asarray(cells, dtype=np.int64).astype(np.uint64)
+    return _compact_bits(cells).astype(np.int64), _compact_bits(cells >> np.uint64(1)).astype(np.int64)
+
+
+def inside_city(lat, lon):
+    """
+    Mask of the points with real coordinates, inside the extent of the city.
+
+    :param lat: array-like of latitudes
+    :param lon: array-like of longitudes
+    :return: numpy boolean array, False for the missing and the placeholder coordinates
+    """
+    lat, lon = np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)
+    return (lat >= CITY_LAT[0]) & (lat <= CITY_LAT[1]) & (lon >= CITY_LON[0]) & (lon <= CITY_LON[1])
+
+
+def grid_cells(lat, lon, level=GRID_LEVEL):
+    """
+    Cell of every point at a level of the grid.
+
+    :param lat: array-like of latitudes
+    :param lon: array-like of longitudes
+    :param level: number of bits per axis, up to 31
+    :return: pandas Series of nullable integer cell codes, missing for the points without coordinates or outside
+             the city
+    """
+    lat = pd.Series(lat, dtype='float64')
+    lon = pd.Series(lon, dtype='float64').set_axis(lat.index)
+    valid = inside_city(lat, lon)
+
+    row, column = _axis_indices(lat.to_numpy()[valid], lon.to_numpy()[valid], level)
+    cells = pd.Series(pd.NA, index=lat.index, dtype='Int64')
+    cells[valid] = _interleave(row, column)
+    return cells
+
+
+def cell_bounds(cells, level=GRID_LEVEL):
+    """
+    Extent of grid cells.
+
+    :param cells: array-like of cell codes at the given level
+    :param level: level of the cells
+    :return: pandas DataFrame indexed by cell with lat_min, lat_max, lon_min, lon_max, lat and lon (the centre)
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    row, column = _deinterleave(cells)
+    lat_size, lon_size = 180 / (1 << level), 360 / (1 << level)
+    bounds = pd.DataFrame({'lat_min': row * lat_size - 90, 'lat_max': (row + 1) * lat_size - 90,
+                           'lon_min': column * lon_size - 180, 'lon_max': (column + 1) * lon_size - 180},
+                          index=pd.Index(cells, name=CELL_COLUMN))
+    bounds['lat'] = (bounds['lat_min'] + bounds['lat_max']) / 2
+    bounds['lon'] = (bounds['lon_min'] + bounds['lon_max']) / 2
+    return bounds
+
+
+class SpatialGridIndex:
+    """
+    Per-cell incident counts on a hierarchical grid, split by offense group, severity and SHOOTING.
+
+    The counts are kept at the finest level, the queries at a coarser level add up the cells that share
+    the same leading bits.
+
+    :param data: pandas DataFrame of incidents with 'Lat', 'Long' and the attribute columns
+    :param level: number of bits per axis of the finest cells
+    :param attributes: list of the columns the counts are split by, the ones missing from data are left out
+    """
+
+    def __init__(self, data, level=GRID_LEVEL, attributes=GRID_ATTRIBUTES):
+        self.level = level
+        self.attributes = [col for col in attributes if col in data.columns]
+        self.cube = CountCube(self._with_cells(data), dimensions=[CELL_COLUMN] + self.attributes)
+
+    def _with_cells(self, data):
+        return pd.DataFrame({CELL_COLUMN: grid_cells(data['Lat'], data['Long'], self.level),
+                             **{col: data[col] for col in self.attributes}}, index=data.index)
+
+    def add(self, data):
+        """
+        Add a batch of new incidents to the index.
+
+        :param data: pandas DataFrame of incidents with 'Lat', 'Long' and the attribute columns
+        """
+        self.cube.update(self._with_cells(data))
+
+    def cell_counts(self, level=None, where=None):
+        """
+        Number of incidents of every non-empty cell.
+
+        :param level: level of the cells, the finest level when None
+        :param where: optional dict of {attribute: label or list of labels} to count only some incidents
+        :return: pandas Series of counts indexed by cell code
+        """
+        level = self.level if level is None else level
+        if level > self.level:
+            raise ValueError(f"The index is kept at level {self.level}, it cannot answer level {level}")
+
+        counts = self.cube.rollup(CELL_COLUMN, where=where)
+        cells = counts.index.to_numpy(dtype=np.int64) >> (2 * (self.level - level))
+        return counts.groupby(pd.Index(cells, name=CELL_COLUMN)).sum()
+
+    def hotspots(self, n=10, level=None, where=None):
+        """
+        Cells with the most incidents.
+
+        :param n: number of cells to return
+        :param level: level of the cells, the finest level when None
+        :param where: optional dict of {attribute: label or list of labels}, for example {'Crime_Category': 'Brutal'}
+        :return: pandas DataFrame of the n hottest cells with their count and extent
+        """
+        level = self.level if level is None else level
+        counts = self.cell_counts(level, where=where).nlargest(n)
+        return cell_bounds(counts.index, level).assign(count=counts.to_numpy())
+
+    def bbox_count(self, lat_min, lat_max, lon_min, lon_max, level=None, where=None):
+        """
+        Number of incidents in a bounding box, counting the cells whose centre is inside the box.
+
+        :param lat_min: southern latitude of the box
+        :param lat_max: northern latitude of the box
+        :param lon_min: western longitude of the box
+        :param lon_max: eastern longitude of the box
+        :param level: level of the cells, the finest level (the most precise) when None
+        :param where: optional dict of {attribute: label or list of labels}
+        :return: number of incidents
+        """
+        level = self.level if level is None else level
+        counts = self.cell_counts(level, where=where)
+        bounds = cell_bounds(counts.index, level)
+        inside = bounds['lat'].between(lat_min, lat_max) & bounds['lon'].between(lon_min, lon_max)
+        return int(counts[inside.to_numpy()].sum())
+
+    def neighbourhood_count(self, lat, lon, level=None, radius=1, where=None):
+        """
+        Number of incidents in the cell of a point and in the cells around it.
+
+        :param lat: latitude of the point
+        :param lon: longitude of the point
+        :param level: level of the cells, the finest level when None
+        :param radius: number of rings of neighbouring cells, 1 gives the 3 x 3 block
+        :param where: optional dict of {attribute: label or list of labels}
+        :return: number of incidents
+        """
+        level = self.level if level is None else level
+        row, column = _axis_indices([lat], [lon], level)
+        offsets = np.arange(-radius, radius + 1)
+        rows = np.clip(row[0] + offsets[:, None], 0, (1 << level) - 1)
+        columns = np.clip(column[0] + offsets[None, :], 0, (1 << level) - 1)
+        block = np.unique(_interleave(*np.broadcast_arrays(rows, columns)).ravel())
+
+        counts = self.cell_counts(level, where=where)
+        return int(counts.reindex(block, fill_value=0).sum())
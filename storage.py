@@ -0,0 +1,96 @@
+#%%
+# Columnar storage for the files handed from one stage of the analysis to the next
+# The stages used to exchange CSV files, so every re-read parsed the text again, inferred the
+# data types again and lost the category/string conversions done during cleaning.
+# The intermediates are stored as compressed Parquet files instead, which keep the data types
+# (categoricals, strings, nullable integers and timestamps) and allow reading only the needed columns.
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from loader import load_crime_data
+
+# Compression codec used for the Parquet files
+PARQUET_COMPRESSION = 'zstd'
+
+
+def file_hash(path, block_size=1 << 20):
+    """
+    Hash of the content of a file, used to key the caches derived from it.
+
+    :param path: path of the file
+    :param block_size: number of bytes read at a time, so large files are not held in memory
+    :return: hexadecimal blake2b digest
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def table_fingerprint(path):
+    """
+    Fingerprint of the content of a Parquet table, read from the file footer only.
+
+    It covers the number of rows, the schema, and the size and statistics (min, max, null count) of every column
+    chunk, so it changes when rows are added or removed, but not when the same table is written again, unlike the
+    modification time of the file. An edit that keeps every chunk size and statistic is not seen.
+
+    :param path: path of the Parquet file
+    :return: hexadecimal blake2b digest
+    """
+    metadata = pq.read_metadata(path)
+    parts = [metadata.num_rows, metadata.schema.to_arrow_schema().to_string(show_schema_metadata=False)]
+    for i in range(metadata.num_row_groups):
+        row_group = metadata.row_group(i)
+        for j in range(row_group.num_columns):
+            column = row_group.column(j)
+            statistics = column.statistics.to_dict() if column.statistics is not None else None
+            parts.append((column.path_in_schema, column.total_compressed_size, statistics))
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def save_table(data, path):
+    """
+    Persist a DataFrame as a compressed Parquet file with its data types preserved.
+
+    :param data: pandas DataFrame to store
+    :param path: destination path, normally ending in '.parquet'
+    """
+    data.to_parquet(path, engine='pyarrow', compression=PARQUET_COMPRESSION, index=False)
+
+
+def load_table(path, columns=None):
+    """
+    Load a table written by save_table, reading only the requested columns.
+
+    If the Parquet file does not exist yet but a CSV file with the same name does
+    (for example the committed 'Balanced_data.csv'), the CSV is read once with the
+    crime data types, converted to Parquet and returned.
+
+    :param path: path of the Parquet file
+    :param columns: optional list of columns to read, all columns are read when None
+    :return: pandas DataFrame
+    """
+    if not os.path.exists(path):
+        csv_path = os.path.splitext(path)[0] + '.csv'
+        if not os.path.exists(csv_path):
+            raise FileNotFoundError(f"Neither {path} nor {csv_path} exists")
+
+        save_table(load_crime_data(csv_path, verbose=False), path)
+
+    data = pd.read_parquet(path, engine='pyarrow', columns=columns)
+
+    # Parquet only keeps the dictionary encoding of text columns, so categoricals with
+    # numeric categories (OFFENSE_CODE, YEAR) are restored from the stored pandas metadata
+    pandas_metadata = pq.read_schema(path).pandas_metadata or {}
+    for column in pandas_metadata.get('columns', []):
+        col = column['name']
+        if column['pandas_type'] == 'categorical' and col in data.columns \
+                and not isinstance(data[col].dtype, pd.CategoricalDtype):
+            data[col] = data[col].astype('category')
+
+    return data
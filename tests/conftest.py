@@ -0,0 +1,56 @@
+# The analysis modules live at the root of the repository, next to the scripts that import them
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+# Labels of the random incidents
+DISTRICTS = ('A1', 'B2', 'C11', 'D4')
+OFFENSE_GROUPS = ('Larceny', 'Robbery', 'Vandalism', 'Aggravated Assault')
+
+
+def make_incidents(n, seed=0, first=0, start='2015-01-01', days=4 * 365, districts=DISTRICTS,
+                   offense_groups=OFFENSE_GROUPS, repeat=0.2, shooting=0.05, missing=0.0):
+    """
+    Random incidents in time order, with the columns of the crime export used by the analysis modules.
+
+    :param n: number of incidents, numbered from I<first>
+    :param seed: seed of the random generator
+    :param first: number of the first incident
+    :param start: time the incidents start from
+    :param days: number of days the incidents are spread over
+    :param districts: district codes, every reporting area lies mostly in one of them
+    :param offense_groups: offense groups, drawn for every offense row
+    :param repeat: fraction of the incidents with a second offense row
+    :param shooting: probability that an incident is a shooting
+    :param missing: fraction of the incidents with a missing DISTRICT and STREET
+    :return: pandas DataFrame with one row per offense
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.random(n)) * days * 86400, unit='s').round('s')
+    area = rng.integers(0, 4 * len(districts), n)
+    district = np.where(rng.random(n) < 0.1, rng.integers(0, len(districts), n), area // 4)
+    incidents = pd.DataFrame({
+        'INCIDENT_NUMBER': [f'I{number}' for number in range(first, first + n)],
+        'OCCURRED_ON_DATE': times,
+        'DISTRICT': np.array(districts, dtype=object)[district],
+        'REPORTING_AREA': area.astype(str),
+        'SHOOTING': np.where(rng.random(n) < shooting, 'Y', 'N'),
+        'STREET': [f'S{rank} ST' for rank in rng.zipf(1.3, n) % 3000],
+        'Lat': 42.25 + 0.15 * rng.random(n),
+        'Long': -71.15 + 0.2 * rng.random(n),
+    })
+    incidents.loc[rng.random(n) < missing, ['DISTRICT', 'STREET']] = None
+
+    # Some incidents get a second offense row, every row has its own offense group
+    rows = np.sort(np.concatenate([np.arange(n), rng.choice(n, int(n * repeat), replace=False)]))
+    data = incidents.iloc[rows].reset_index(drop=True)
+    data['OFFENSE_CODE_GROUP'] = rng.choice(offense_groups, len(data))
+    data['YEAR'] = data['OCCURRED_ON_DATE'].dt.year
+    data['MONTH'] = data['OCCURRED_ON_DATE'].dt.month
+    data['HOUR'] = data['OCCURRED_ON_DATE'].dt.hour
+    data['DAY_OF_WEEK'] = data['OCCURRED_ON_DATE'].dt.day_name()
+    return data
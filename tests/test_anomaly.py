@@ -0,0 +1,111 @@
+# Regression tests of the streaming anomaly detector: batch and per-incident feeds, checkpoints and alarms
+import numpy as np
+import pandas as pd
+
+from anomaly import ALARM_COLUMNS, AnomalyDetector
+from conftest import make_incidents
+
+
+def _incidents(days, seed):
+    # About 3 incidents a day in each of 4 districts x 2 offense groups, one row per incident
+    return make_incidents(24 * days, seed, start='2017-01-02', days=days, offense_groups=('Larceny', 'Robbery'),
+                          repeat=0, shooting=0.1)
+
+
+def _state(detector):
+    n = len(detector.keys)
+    return (detector.keys, detector.day, detector.late, detector.mean[:n], detector.variance[:n],
+            detector.observed[:n], detector.cusum[:n], detector.today[:n])
+
+
+def _assert_same_state(first, second):
+    for left, right in zip(_state(first), _state(second)):
+        if isinstance(left, np.ndarray):
+            np.testing.assert_allclose(left, right)
+        else:
+            assert left == right
+
+
+def test_batch_and_per_incident_feeds_agree():
+    data = _incidents(120, seed=0)
+    batch = AnomalyDetector()
+    batch_alarms = batch.update(data)
+
+    incremental = AnomalyDetector()
+    alarms = [incremental.add((row.DISTRICT, row.OFFENSE_CODE_GROUP), row.OCCURRED_ON_DATE)
+              for row in data.itertuples()]
+    incremental_alarms = pd.concat([alarm for alarm in alarms if alarm is not None], ignore_index=True)
+
+    _assert_same_state(batch, incremental)
+    pd.testing.assert_frame_equal(batch_alarms, incremental_alarms)
+
+
+def test_checkpoint_resumes_the_feed(tmp_path):
+    data = _incidents(150, seed=1)
+    history, feed = data.iloc[:len(data) * 2 // 3], data.iloc[len(data) * 2 // 3:]
+
+    uninterrupted = AnomalyDetector(where={'SHOOTING': 'N'})
+    uninterrupted.update(history)
+    expected_alarms = uninterrupted.update(feed)
+
+    detector = AnomalyDetector(where={'SHOOTING': 'N'})
+    detector.update(history)
+    detector.save(tmp_path / 'district.detector.pkl')
+    resumed = AnomalyDetector.load(tmp_path / 'district.detector.pkl')
+    _assert_same_state(detector, resumed)
+    pd.testing.assert_frame_equal(resumed.update(feed), expected_alarms)
+    _assert_same_state(uninterrupted, resumed)
+
+
+def test_spike_raises_an_alarm():
+    data = _incidents(90, seed=2)
+    detector = AnomalyDetector()
+    detector.update(data)
+    detector.close_day()
+
+    day = detector.day
+    spike = pd.DataFrame({'OCCURRED_ON_DATE': pd.Timestamp(day, unit='D') + pd.Timedelta(hours=12),
+                          'DISTRICT': ['C11'] * 20, 'OFFENSE_CODE_GROUP': ['Robbery'] * 20, 'SHOOTING': 'N'})
+    assert len(detector.update(spike)) == 0
+    alarms = detector.close_day()
+    assert list(alarms.columns) == detector.dimensions + ALARM_COLUMNS
+    assert alarms[['DISTRICT', 'OFFENSE_CODE_GROUP']].values.tolist() == [['C11', 'Robbery']]
+    assert alarms['count'].iloc[0] == 20
+    # The CUSUM of the series restarts after the alarm
+    assert detector.cusum[detector.ids[('C11', 'Robbery')]] == 0
+
+
+def test_late_and_empty_batches():
+    data = _incidents(40, seed=3)
+    detector = AnomalyDetector()
+    detector.update(data)
+    state = _state(detector)
+
+    # Incidents of a closed day are counted as late, a batch without matching incidents changes nothing
+    assert len(detector.update(data.iloc[:10])) == 0
+    assert detector.late == 10
+    assert len(detector.update(data.iloc[:0])) == 0
+    assert len(AnomalyDetector(where={'SHOOTING': 'maybe'}).update(data)) == 0
+    assert detector.day == state[1]
+
+
+def test_daily_feed_closes_the_feed_days_without_matching_incidents():
+    data = _incidents(90, seed=4)
+    days = data['OCCURRED_ON_DATE'].dt.normalize()
+    # No shooting on the last two days of the feed
+    data.loc[days >= days.max() - pd.Timedelta(days=1), 'SHOOTING'] = 'N'
+
+    batch = AnomalyDetector(['DISTRICT'], where={'SHOOTING': 'Y'}, warmup_days=7, threshold=1.0)
+    expected_alarms = pd.concat([batch.update(data), batch.close_day(days.max())], ignore_index=True)
+
+    detector = AnomalyDetector(['DISTRICT'], where={'SHOOTING': 'Y'}, warmup_days=7, threshold=1.0)
+    alarms = []
+    for day, incidents_of_day in data.groupby(days):
+        alarms.append(detector.update(incidents_of_day))
+        alarms.append(detector.close_day(day))
+        assert pd.Timestamp(detector.day, unit='D') == day + pd.Timedelta(days=1)
+    alarms = pd.concat(alarms, ignore_index=True)
+
+    _assert_same_state(batch, detector)
+    assert len(expected_alarms) > 0
+    pd.testing.assert_frame_equal(alarms, expected_alarms)
@@ -0,0 +1,62 @@
+# Regression tests of the batched chi-squared tests against chi2_contingency on pd.crosstab
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2_contingency
+
+from chi_squared import chi_squared_tests, level_chi_squared_tests
+from conftest import make_incidents
+
+
+def _features(n, seed, shooting=0.05):
+    data = make_incidents(n, seed, shooting=shooting, missing=0.05)
+    # A 2 x 2 table for Yates' correction, a constant column and a categorical with an unused category
+    data['NIGHT'] = data['HOUR'] < 6
+    data['CITY'] = 'Boston'
+    data['REPORTING_AREA'] = pd.Categorical(data['REPORTING_AREA'], categories=[str(area) for area in range(20)])
+    return data
+
+
+def _assert_matches_scipy(result, table):
+    chi2, p_value, dof, expected = chi2_contingency(table)
+    assert np.isclose(result['chi2'], chi2, rtol=1e-10, atol=0)
+    assert np.isclose(result['p_value'], p_value, rtol=1e-10, atol=1e-300)
+    assert result['dof'] == dof
+    assert result['n'] == table.to_numpy().sum()
+    assert np.isclose(result['min_expected'], expected.min())
+
+
+def test_statistics_match_chi2_contingency():
+    data = _features(5000, seed=0)
+    columns = ['DISTRICT', 'OFFENSE_CODE_GROUP', 'DAY_OF_WEEK', 'HOUR', 'NIGHT', 'CITY', 'REPORTING_AREA']
+    results = chi_squared_tests(data, columns)
+    assert list(results.index) == columns
+    assert results.loc['NIGHT', 'dof'] == 1 and results.loc['CITY', 'dof'] == 0
+    for col in columns:
+        _assert_matches_scipy(results.loc[col], pd.crosstab(data[col], data['SHOOTING']))
+
+
+def test_levels_match_chi2_contingency():
+    data = _features(5000, seed=1)
+    results = level_chi_squared_tests(data, 'OFFENSE_CODE_GROUP')
+    assert (results['dof'] == 1).all()
+    for level in data['OFFENSE_CODE_GROUP'].unique():
+        _assert_matches_scipy(results.loc[level], pd.crosstab(data['OFFENSE_CODE_GROUP'] == level, data['SHOOTING']))
+
+
+def test_permutation_p_values_of_the_sparse_tables():
+    # About 2 shootings expected in every reporting area, the district tables are not sparse
+    data = _features(3000, seed=2, shooting=0.01)
+    permutations = 4000
+    results = chi_squared_tests(data, ['DISTRICT', 'REPORTING_AREA'], permutations=permutations)
+    assert not results.loc['DISTRICT', 'sparse_table'] and np.isnan(results.loc['DISTRICT', 'permutation_p_value'])
+    assert results.loc['REPORTING_AREA', 'sparse_table']
+    # Without a dependence the permutation p-value is close to the chi-squared one
+    p_value = results.loc['REPORTING_AREA', 'permutation_p_value']
+    assert 1 / (permutations + 1) <= p_value <= 1
+    assert abs(p_value - results.loc['REPORTING_AREA', 'p_value']) < 0.05
+
+    # Fifteen shootings in one reporting area, the table stays sparse and no random table reaches its statistic
+    data.loc[data.index[data['REPORTING_AREA'] == '0'][:15], 'SHOOTING'] = 'Y'
+    results = chi_squared_tests(data, ['REPORTING_AREA'], permutations=permutations)
+    assert results.loc['REPORTING_AREA', 'sparse_table']
+    assert results.loc['REPORTING_AREA', 'permutation_p_value'] == 1 / (permutations + 1)
@@ -0,0 +1,43 @@
+# Regression tests of the vectorized cleaning rules against the row-by-row code they replaced
+import pandas as pd
+
+from cleaning import (DISTRICT_NAME_MAPPING, CRIME_CLEANING_PIPELINE, impute_district, most_common_district_table,
+                      rename_districts)
+from conftest import make_incidents
+
+
+def _districts(n, seed):
+    # Reporting areas mostly in one district, a tenth of the districts missing, one area never has a district
+    # and one district code is not in DISTRICT_NAME_MAPPING
+    data = make_incidents(n, seed, districts=tuple(DISTRICT_NAME_MAPPING) + ('External',), repeat=0, missing=0.1)
+    data.loc[data['REPORTING_AREA'] == '39', 'DISTRICT'] = None
+    return data[['REPORTING_AREA', 'DISTRICT']]
+
+
+def _impute_and_rename_district_rowwise(data, most_common_district):
+    # Row-by-row implementation of the cleaning section before the vectorized rules
+    district = data.apply(
+        lambda row: most_common_district[row['REPORTING_AREA']] if pd.isnull(row['DISTRICT']) and row['REPORTING_AREA'] in most_common_district else row['DISTRICT'],
+        axis=1
+    )
+    return district.astype('string').apply(lambda code: DISTRICT_NAME_MAPPING.get(code, code)).astype('string')
+
+
+def test_district_imputation_matches_the_rowwise_version():
+    data = _districts(5000, seed=0)
+    table = most_common_district_table(data)
+    expected = _impute_and_rename_district_rowwise(data, table)
+    result = rename_districts(impute_district(data, table))
+    pd.testing.assert_series_equal(result.astype('string'), expected, check_names=False)
+    # The areas without any known district stay missing
+    assert result[data['REPORTING_AREA'] == '39'].isna().all()
+
+
+def test_pipeline_district_column():
+    data = _districts(2000, seed=1)
+    for col in ['OFFENSE_CODE', 'OFFENSE_CODE_GROUP', 'OFFENSE_DESCRIPTION', 'SHOOTING', 'YEAR', 'DAY_OF_WEEK',
+                'UCR_PART', 'STREET']:
+        data[col] = 'x'
+    cleaned, _ = CRIME_CLEANING_PIPELINE.run(data, report=False)
+    expected = _impute_and_rename_district_rowwise(data, most_common_district_table(data))
+    pd.testing.assert_series_equal(cleaned['DISTRICT'].astype('string'), expected, check_names=False)
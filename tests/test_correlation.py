@@ -0,0 +1,76 @@
+# Regression tests of the streaming correlation matrix against DataFrame.corr() and DataFrame.cov()
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_incidents
+from correlation import CORRELATION_COLUMNS, StreamingCorrelation, correlation_from_table, crime_numeric_columns
+
+
+def _numeric(n, seed):
+    # The heatmap columns with missing values, missing coordinates in whole runs of rows as in the export
+    data = make_incidents(n, seed)
+    rng = np.random.default_rng(seed)
+    data.loc[rng.random(len(data)) < 0.1, 'SHOOTING'] = None
+    data.loc[rng.random(len(data)) < 0.05, 'HOUR'] = np.nan
+    data.loc[data.index[1000:1500], ['Lat', 'Long']] = np.nan
+    return data, crime_numeric_columns(data)
+
+
+def _reference(numeric):
+    # Pairwise complete two-pass covariance and correlation in extended precision
+    values = numeric.to_numpy()
+    size = values.shape[1]
+    covariance, correlation = np.zeros((size, size)), np.zeros((size, size))
+    for i in range(size):
+        for j in range(size):
+            both = ~np.isnan(values[:, i]) & ~np.isnan(values[:, j])
+            x, y = values[both, i].astype(np.longdouble), values[both, j].astype(np.longdouble)
+            x, y = x - x.mean(), y - y.mean()
+            covariance[i, j] = (x * y).sum() / (both.sum() - 1)
+            correlation[i, j] = (x * y).sum() / np.sqrt((x * x).sum() * (y * y).sum())
+    return covariance, correlation
+
+
+def _assert_close(accumulator, covariance, correlation, tolerance):
+    # The covariances are compared relative to the product of the standard deviations
+    scale = np.sqrt(np.outer(np.diag(covariance), np.diag(covariance)))
+    assert (np.abs(accumulator.correlation().to_numpy() - correlation) <= tolerance).all()
+    assert (np.abs(accumulator.covariance().to_numpy() - covariance) <= tolerance * scale).all()
+
+
+def _assert_matches_pandas(accumulator, numeric):
+    _assert_close(accumulator, *_reference(numeric), tolerance=1e-13)
+    # pandas loses about 1e-12 itself on the coordinates (Lat near 42, Long near -71)
+    _assert_close(accumulator, numeric.cov().to_numpy(), numeric.corr().to_numpy(), tolerance=1e-11)
+    pd.testing.assert_index_equal(accumulator.correlation().columns, numeric.corr().columns)
+
+
+def test_chunks_and_merges_match_pandas():
+    _, numeric = _numeric(5000, seed=0)
+    # Uneven chunks, one of them empty and one without any coordinates, spread over three accumulators
+    bounds = [0, 7, 7, 1000, 1200, 1500, 3100, len(numeric)]
+    workers = [StreamingCorrelation(CORRELATION_COLUMNS) for _ in range(3)]
+    for chunk, (start, end) in enumerate(zip(bounds[:-1], bounds[1:])):
+        workers[chunk % 3].update(numeric.iloc[start:end])
+
+    forward = StreamingCorrelation(CORRELATION_COLUMNS)
+    for worker in workers:
+        forward.merge(worker)
+    _assert_matches_pandas(forward, numeric)
+    backward = StreamingCorrelation(CORRELATION_COLUMNS).merge(workers[2]).merge(workers[1].merge(workers[0]))
+    _assert_matches_pandas(backward, numeric)
+
+
+def test_merge_checks_the_columns():
+    with pytest.raises(ValueError):
+        StreamingCorrelation(['HOUR', 'YEAR']).merge(StreamingCorrelation(['YEAR', 'HOUR']))
+
+
+@pytest.mark.parametrize('n_jobs', [1, 2])
+def test_table_matches_pandas(tmp_path, n_jobs):
+    data, numeric = _numeric(5000, seed=1)
+    path = tmp_path / 'incidents.parquet'
+    data.to_parquet(path, index=False, row_group_size=1500)
+    accumulator = correlation_from_table(path, batch_size=700, n_jobs=n_jobs)
+    _assert_matches_pandas(accumulator, numeric)
@@ -0,0 +1,114 @@
+# Regression tests of the incremental count cube against pandas groupby on the same rows
+import pandas as pd
+
+from conftest import make_incidents
+from cube import IncrementalCountCube
+from storage import save_table
+
+DIMENSIONS = ['YEAR', 'DISTRICT', 'SHOOTING']
+
+
+def _incidents(n, seed, **kwargs):
+    # A fifth of the incidents without a district, to check that the cube drops them as groupby does
+    return make_incidents(n, seed, missing=0.2, **kwargs)
+
+
+def _expected(rows, dimensions):
+    return rows.groupby(dimensions).size()
+
+
+def _assert_matches(cube, rows):
+    for dimensions in [['YEAR'], ['DISTRICT'], ['DISTRICT', 'SHOOTING'], DIMENSIONS]:
+        result = cube.rollup(dimensions)
+        expected = _expected(rows, dimensions)
+        pd.testing.assert_series_equal(result, expected, check_names=False, check_index_type=False,
+                                       check_dtype=False)
+    assert cube.total == len(rows)
+
+
+def test_build_matches_groupby():
+    rows = _incidents(2000, seed=0)
+    _assert_matches(IncrementalCountCube(rows, dimensions=DIMENSIONS), rows)
+
+
+def test_update_with_new_and_corrected_incidents():
+    rows = _incidents(2000, seed=0)
+    cube = IncrementalCountCube(rows, dimensions=DIMENSIONS)
+
+    # New incidents, and corrections carrying all the rows of 100 existing incidents
+    new_rows = _incidents(500, seed=1, first=2000)
+    corrected = _incidents(100, seed=2).drop_duplicates('INCIDENT_NUMBER')
+    batch = pd.concat([new_rows, corrected], ignore_index=True)
+    cube.update(batch)
+    current = pd.concat([rows[~rows['INCIDENT_NUMBER'].isin(batch['INCIDENT_NUMBER'])], batch])
+    _assert_matches(cube, current)
+
+    # Applying the same batch again does not count it twice
+    cube.update(batch)
+    _assert_matches(cube, current)
+
+
+def test_remove():
+    rows = _incidents(2000, seed=0)
+    cube = IncrementalCountCube(rows, dimensions=DIMENSIONS)
+    withdrawn = rows['INCIDENT_NUMBER'].drop_duplicates().sample(300, random_state=0).tolist() + ['unknown']
+    cube.remove(withdrawn)
+    _assert_matches(cube, rows[~rows['INCIDENT_NUMBER'].isin(withdrawn)])
+    assert cube.n_incidents == rows['INCIDENT_NUMBER'].nunique() - 300
+
+
+def test_repack_when_a_dimension_outgrows_its_bits():
+    rows = _incidents(2000, seed=0)
+    cube = IncrementalCountCube(rows, dimensions=DIMENSIONS)
+    bits = cube.bits['DISTRICT']
+
+    # Enough new districts to overflow the bit field, in a batch that also corrects existing incidents
+    districts = [f'Z{number}' for number in range(1 << bits)]
+    batch = pd.concat([_incidents(3000, seed=3, districts=districts, first=2000),
+                       _incidents(50, seed=4).drop_duplicates('INCIDENT_NUMBER')], ignore_index=True)
+    cube.update(batch)
+    assert cube.bits['DISTRICT'] > bits
+    _assert_matches(cube, pd.concat([rows[~rows['INCIDENT_NUMBER'].isin(batch['INCIDENT_NUMBER'])], batch]))
+
+    # The incidents remembered before the repack are still removed correctly
+    withdrawn = rows['INCIDENT_NUMBER'].iloc[:200].tolist()
+    cube.remove(withdrawn)
+    current = pd.concat([rows[~rows['INCIDENT_NUMBER'].isin(batch['INCIDENT_NUMBER'])], batch])
+    _assert_matches(cube, current[~current['INCIDENT_NUMBER'].isin(withdrawn)])
+
+
+def test_open_keeps_the_absorbed_drops(tmp_path):
+    rows = _incidents(2000, seed=0)
+    table_path = str(tmp_path / 'incidents.parquet')
+    save_table(rows, table_path)
+
+    cube = IncrementalCountCube.open(table_path, dimensions=DIMENSIONS)
+    batch = _incidents(500, seed=1, first=2000)
+    cube.update(batch)
+    cube.save()
+    reopened = IncrementalCountCube.open(table_path, dimensions=DIMENSIONS)
+    assert reopened.path == cube.path == table_path + '.cube.pkl'
+    _assert_matches(reopened, pd.concat([rows, batch]))
+
+    # Writing the same table again, as the scripts do on every run, keeps the cube and its drops
+    (tmp_path / 'incidents.parquet.0123456789abcdef.cube.pkl').write_bytes(b'')
+    save_table(rows, table_path)
+    reopened = IncrementalCountCube.open(table_path, dimensions=DIMENSIONS)
+    _assert_matches(reopened, pd.concat([rows, batch]))
+    assert sorted(path.name for path in tmp_path.glob('*.cube.pkl')) == ['incidents.parquet.cube.pkl']
+
+    # A table with other rows gets a new cube
+    save_table(pd.concat([rows, batch]).iloc[::2], table_path)
+    rebuilt = IncrementalCountCube.open(table_path, dimensions=DIMENSIONS)
+    _assert_matches(rebuilt, pd.concat([rows, batch]).iloc[::2])
+
+
+def test_corrections_compact_the_key_log():
+    rows = _incidents(2000, seed=0)
+    cube = IncrementalCountCube(rows, dimensions=DIMENSIONS)
+    for seed in range(5, 15):
+        corrected = _incidents(2000, seed=seed).drop_duplicates('INCIDENT_NUMBER').sample(1500, random_state=seed)
+        cube.update(corrected)
+        rows = pd.concat([rows[~rows['INCIDENT_NUMBER'].isin(corrected['INCIDENT_NUMBER'])], corrected])
+        assert cube.n_rows <= 2 * len(rows)
+    _assert_matches(cube, rows)
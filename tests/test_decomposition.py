@@ -0,0 +1,45 @@
+# Regression tests of the batched decomposition against statsmodels' seasonal_decompose, one series at a time
+import numpy as np
+import pandas as pd
+import pytest
+from statsmodels.tsa.seasonal import seasonal_decompose
+
+from conftest import make_incidents
+from decomposition import BatchDecomposer, decompose_matrix
+from timeseries import TimeSeriesStore
+
+
+def _assert_matches_statsmodels(series, trend, seasonal, resid, period):
+    # Equal up to the rounding of sums of the observations, the missing ends included
+    expected = seasonal_decompose(series, model='additive', period=period)
+    tolerance = 1e-15 * np.abs(series).max()
+    np.testing.assert_allclose(trend, expected.trend, rtol=0, atol=tolerance)
+    np.testing.assert_allclose(seasonal, expected.seasonal, rtol=0, atol=tolerance)
+    np.testing.assert_allclose(resid, expected.resid, rtol=0, atol=tolerance)
+
+
+@pytest.mark.parametrize('period', [7, 12, 365])
+def test_single_period_matches_seasonal_decompose(period):
+    # Counts with a trend and a seasonal cycle, over a number of observations that is not a whole number of periods
+    rng = np.random.default_rng(period)
+    n_obs = 3 * period + period // 3 + 1
+    time = np.arange(n_obs)
+    rates = 20 + 0.01 * time + 5 * np.sin(2 * np.pi * time / period) + rng.uniform(0, 10, (6, 1))
+    values = rng.poisson(rates).astype(np.float64)
+    trend, seasonal, resid = decompose_matrix(values, periods=[period])
+    assert list(seasonal) == [period]
+    for row in range(len(values)):
+        _assert_matches_statsmodels(values[row], trend[row], seasonal[period][row], resid[row], period)
+
+
+def test_store_series_match_seasonal_decompose():
+    data = make_incidents(5000, seed=0, days=120)
+    decomposition = BatchDecomposer(TimeSeriesStore(data, dimensions=['DISTRICT'])).decompose('DISTRICT', periods=[7])
+    for district, series in decomposition.observed.items():
+        _assert_matches_statsmodels(series, decomposition.trend[district], decomposition.seasonal[7][district],
+                                    decomposition.resid[district], 7)
+
+
+def test_short_series_are_refused():
+    with pytest.raises(ValueError):
+        decompose_matrix(np.zeros((2, 20)), periods=[12])
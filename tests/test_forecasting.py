@@ -0,0 +1,39 @@
+# Regression tests of the shooting forecaster: counts per incident and the fold cache
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from conftest import make_incidents
+from forecasting import ShootingForecaster
+from timeseries import TimeSeriesStore
+
+
+def _shootings(weeks, seed):
+    # About one shooting a week in each of 2 districts, a third of them with a second offense row
+    return make_incidents(2 * weeks, seed, start='2016-01-04', days=7 * weeks, districts=('A1', 'B2'),
+                          repeat=1 / 3, shooting=0.8)
+
+
+def test_shootings_are_counted_per_incident():
+    data = _shootings(60, seed=0)
+    store = TimeSeriesStore(data, dimensions=['DISTRICT', 'SHOOTING'], incident='INCIDENT_NUMBER')
+    series = ShootingForecaster(store).series
+    shootings = data[data['SHOOTING'] == 'Y'].drop_duplicates('INCIDENT_NUMBER')
+    expected = shootings.groupby([pd.Grouper(key='OCCURRED_ON_DATE', freq='W'), 'DISTRICT']).size().unstack()
+    expected = expected.reindex(series.index).fillna(0)
+    np.testing.assert_array_equal(series.to_numpy(), expected[series.columns].to_numpy())
+
+
+def test_fold_cache_keeps_only_the_current_origins(tmp_path):
+    cache_path = tmp_path / 'shooting.folds.pkl'
+    data = _shootings(60, seed=1)
+    first = ShootingForecaster(TimeSeriesStore(data.iloc[:len(data) * 3 // 4], dimensions=['DISTRICT', 'SHOOTING']),
+                               cache_path=cache_path)
+    first.backtest(horizon=2, n_origins=3, models=('mean',), min_history=10, n_jobs=1)
+
+    later = ShootingForecaster(TimeSeriesStore(data, dimensions=['DISTRICT', 'SHOOTING']), cache_path=cache_path)
+    folds = later.backtest(horizon=2, n_origins=3, models=('mean',), min_history=10, n_jobs=1)
+    with open(cache_path, 'rb') as file:
+        cache = pickle.load(file)
+    assert len(cache) == len(later.cache) == folds.groupby(['DISTRICT', 'origin']).ngroups == 2 * 3
@@ -0,0 +1,89 @@
+# Regression tests of the frequent items sketches: error bounds, merges and sliding windows
+import numpy as np
+import pandas as pd
+
+from conftest import make_incidents
+from heavyhitters import FrequentItems, WindowedFrequentItems, stream_heavy_hitters
+
+
+def _streets(n, seed, **kwargs):
+    # Zipf-like street names, with missing values
+    data = make_incidents(n, seed, repeat=0, missing=0.02, **kwargs)
+    data['STREET'] = data['STREET'].astype('category')
+    return data
+
+
+def _assert_bounds(sketch, values):
+    truth = pd.Series(values).value_counts()
+    truth = truth[truth > 0]
+    truth.index = np.asarray(truth.index)
+    assert sketch.n == truth.sum()
+    assert len(sketch.counters) <= sketch.capacity
+    assert sketch.max_error <= sketch.n / (sketch.capacity + 1)
+    kept = truth.reindex(sketch.counters.index)
+    assert (sketch.counters <= kept).all()
+    assert (sketch.counters + sketch.max_error >= kept).all()
+    # A value without a counter has a true count of at most max_error
+    assert (truth.drop(sketch.counters.index) <= sketch.max_error).all()
+
+
+def test_update_in_batches_bounds_the_counts():
+    values = _streets(50_000, seed=0)['STREET']
+    sketch = FrequentItems(capacity=64)
+    for start in range(0, len(values), 5000):
+        sketch.update(values.iloc[start:start + 5000])
+    _assert_bounds(sketch, values)
+    assert sketch.max_error > 0
+
+
+def test_small_columns_are_exact():
+    values = _streets(20_000, seed=1)['STREET'].astype(object).str[:2]
+    sketch = FrequentItems(capacity=1024).update(values)
+    assert sketch.max_error == 0
+    top = sketch.top(5)
+    expected = values.value_counts().head(5)
+    assert top['count'].tolist() == expected.tolist()
+    assert top['guaranteed'].all()
+
+
+def test_merges_keep_the_bounds_in_any_order():
+    parts = [_streets(10_000, seed=seed)['STREET'] for seed in range(6)]
+    sketches = [FrequentItems(capacity=64).update(part) for part in parts]
+    forward = FrequentItems(capacity=64)
+    for sketch in sketches:
+        forward.merge(sketch)
+    tree = FrequentItems(capacity=64).merge(sketches[0]).merge(sketches[1]).merge(
+        FrequentItems(capacity=64).merge(sketches[2]).merge(sketches[3]).merge(
+            FrequentItems(capacity=64).merge(sketches[4]).merge(sketches[5])))
+    values = pd.concat(parts, ignore_index=True)
+    _assert_bounds(forward, values)
+    _assert_bounds(tree, values)
+    # The most frequent street is found whatever the merge order
+    assert forward.top(1).index[0] == tree.top(1).index[0] == values.value_counts().index[0]
+
+
+def test_window_keeps_only_the_recent_buckets():
+    rng = np.random.default_rng(2)
+    data = _streets(30_000, seed=2, start='2017-01-01', days=100)
+    values, times = data['STREET'], data['OCCURRED_ON_DATE']
+    window = WindowedFrequentItems(window=pd.Timedelta(days=14), capacity=64)
+    # Chunks out of time order, the buckets that left the window are dropped
+    for chunk in np.array_split(rng.permutation(len(values)), 7):
+        window.update(values.iloc[chunk], times.iloc[chunk])
+    assert len(window.buckets) <= window.n_buckets
+    assert window.start == times.max().normalize() - pd.Timedelta(days=13)
+    _assert_bounds(window.sketch(), values[(times >= window.start).to_numpy()])
+
+
+def test_stream_parallel_matches_the_bounds():
+    data = _streets(40_000, seed=3, start='2017-01-01', days=60)[['STREET', 'OCCURRED_ON_DATE']]
+    chunks = [data.iloc[start:start + 4000] for start in range(0, len(data), 4000)]
+    for n_jobs in (1, 2):
+        sketches = stream_heavy_hitters(iter(chunks), columns=['STREET'], capacity=64, n_jobs=n_jobs)
+        _assert_bounds(sketches['STREET'], data['STREET'])
+        # One pass gives both the whole stream and the window
+        sketches, windowed = stream_heavy_hitters(iter(chunks), columns=['STREET'], capacity=64, n_jobs=n_jobs,
+                                                  window=pd.Timedelta(days=7))
+        _assert_bounds(sketches['STREET'], data['STREET'])
+        windowed = windowed['STREET']
+        _assert_bounds(windowed.sketch(), data['STREET'][(data['OCCURRED_ON_DATE'] >= windowed.start).to_numpy()])
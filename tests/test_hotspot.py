@@ -0,0 +1,30 @@
+# Regression tests of the hotspot surfaces: time windows over an unsorted table and the counts of every group
+import numpy as np
+import pandas as pd
+
+from conftest import make_incidents
+from hotspot import HotspotModel
+
+
+def test_window_counts_match_a_filter_of_the_table():
+    data = make_incidents(5000, seed=0).sample(frac=1, random_state=0)
+    data['DISTRICT'] = data['DISTRICT'].astype('category')
+    model = HotspotModel(data, xlim=(-71.2, -70.9), ylim=(42.2, 42.45), grid_size=64)
+    assert model.data is data
+
+    for start, end in [(None, None), ('2016-03-01', '2016-09-01'), ('2016-03-01 12:00', '2016-03-02')]:
+        window = data
+        if start is not None:
+            window = data[(data['OCCURRED_ON_DATE'] >= start) & (data['OCCURRED_ON_DATE'] < end)]
+        for by in ['OFFENSE_CODE_GROUP', 'DISTRICT']:
+            surfaces = model.surfaces(by, start, end)
+            expected = window[by].value_counts(sort=False)
+            if by == 'OFFENSE_CODE_GROUP':
+                # Only the groups of the window get a surface, all the categories do
+                expected = expected[expected > 0]
+            expected = expected.reindex(surfaces.labels)
+            np.testing.assert_array_equal(surfaces.counts, expected.to_numpy())
+            # The kernel keeps the mass of the incidents away from the edges of the grid
+            mass = surfaces.density.sum(axis=(1, 2)) * model.cell_area_km2
+            np.testing.assert_allclose(mass, surfaces.counts, rtol=1e-6, atol=1e-9)
+    assert model.surfaces('DISTRICT') is model.surfaces('DISTRICT', None, None)
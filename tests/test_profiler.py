@@ -0,0 +1,36 @@
+# Regression tests of the one-pass column profiler against the pandas calls it replaces
+import numpy as np
+import pandas as pd
+
+from conftest import make_incidents
+from profiler import TableProfile
+
+
+def _table(n=5000, seed=0):
+    # Streets with missing values, and a categorical SHOOTING with an unused category as in the raw export
+    data = make_incidents(n, seed, missing=0.05)[['STREET', 'HOUR', 'SHOOTING']]
+    data['SHOOTING'] = pd.Categorical(data['SHOOTING'].where(data['SHOOTING'] == 'Y'), categories=['N', 'Y'])
+    return data
+
+
+def test_value_counts_are_complete():
+    data = _table()
+    profile = TableProfile(data, top_k=10)
+    for col in data.columns:
+        expected = data[col].value_counts()
+        expected = expected[expected > 0]
+        result = profile.value_counts(col)
+        assert len(result) == profile.nunique(col) == data[col].nunique()
+        pd.testing.assert_series_equal(result.sort_index(), expected.sort_index(), check_names=False,
+                                       check_index_type=False, check_categorical=False)
+        assert list(profile.top_values(col)) == list(result.head(10))
+
+
+def test_statistics_match_pandas():
+    data = _table(seed=1)
+    profile = TableProfile(data)
+    for col in data.columns:
+        assert profile.null_count(col) == data[col].isnull().sum()
+    describe = data['HOUR'].describe()
+    for label in ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']:
+        assert np.isclose(profile.describe('HOUR')[label], describe[label])
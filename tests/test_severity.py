@@ -0,0 +1,31 @@
+# Regression tests of the keyword severity classifier
+import pandas as pd
+
+from severity import SeverityClassifier
+
+LEVELS = ['Mild', 'Serious', 'Brutal']
+
+
+def test_default_table_matches_the_two_level_rule():
+    classifier = SeverityClassifier()
+    descriptions = pd.Series(['ASSAULT - AGGRAVATED', 'Larceny shoplifting', 'MURDER, NON-NEGLIGENT', None])
+    assert list(classifier.classify(descriptions)) == ['Brutal', 'Mild', 'Brutal', 'Mild']
+
+
+def test_longer_lower_keyword_does_not_hide_a_shorter_higher_one():
+    classifier = SeverityClassifier({'armed robbery attempt': 'Serious', 'robbery': 'Brutal'}, LEVELS)
+    assert classifier.classify_description('ARMED ROBBERY ATTEMPT') == 'Brutal'
+
+
+def test_overlapping_keywords_are_matched_independently():
+    classifier = SeverityClassifier({'vandalism': 'Serious', 'ism': 'Mild', 'dali': 'Brutal'}, LEVELS)
+    assert classifier.classify_description('Vandalism') == 'Brutal'
+    assert classifier.classify_description('Tourism') == 'Mild'
+
+
+def test_classify_broadcasts_the_levels_of_the_distinct_descriptions():
+    classifier = SeverityClassifier({'weapon': 'Serious', 'homicide': 'Brutal'}, LEVELS)
+    descriptions = pd.Series(['weapon violation', 'HOMICIDE', 'weapon violation', 'towed'] * 3)
+    result = classifier.classify(descriptions)
+    assert result.cat.ordered and list(result.cat.categories) == LEVELS
+    assert list(result) == ['Serious', 'Brutal', 'Serious', 'Mild'] * 3
@@ -0,0 +1,84 @@
+# Regression tests of the spatio-temporal index against brute-force searches over all the incidents
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import make_incidents
+from spacetime import SpatioTemporalIndex, project_coordinates
+from spatial import inside_city
+
+
+def _incidents(n, seed):
+    # One row per incident, so no two incidents are at the same distance, with placeholder coordinates and missing times
+    data = make_incidents(n, seed, days=120, repeat=0)
+    rng = np.random.default_rng(seed)
+    data.loc[rng.random(n) < 0.05, ['Lat', 'Long']] = -1
+    data.loc[rng.random(n) < 0.01, 'OCCURRED_ON_DATE'] = pd.NaT
+    return data
+
+
+def _queries(data, seed):
+    # Incidents at their own time, random points at random times (some before and after all the incidents)
+    # and points outside the city
+    rng = np.random.default_rng(seed)
+    incidents = data.dropna(subset=['OCCURRED_ON_DATE']).sample(150, random_state=seed)
+    start = data['OCCURRED_ON_DATE'].min()
+    n = 250
+    lat = np.concatenate([incidents['Lat'], 42.25 + 0.15 * rng.random(n - 50), np.full(25, -1.0), np.full(25, 43.0)])
+    lon = np.concatenate([incidents['Long'], -71.15 + 0.2 * rng.random(n - 50), np.full(25, -1.0),
+                          np.full(25, -71.0)])
+    times = np.concatenate([incidents['OCCURRED_ON_DATE'].to_numpy(),
+                            (start + pd.to_timedelta(rng.uniform(-10, 130, n), unit='D')).to_numpy()])
+    return lat, lon, pd.Series(times)
+
+
+def _brute_force(data, lat, lon, times):
+    # Distances from every query to every indexed incident, and the incident times, unindexed rows at infinity
+    valid = inside_city(data['Lat'], data['Long']) & data['OCCURRED_ON_DATE'].notna().to_numpy()
+    points = project_coordinates(data['Lat'], data['Long'])
+    queries = project_coordinates(lat, lon)
+    distances = np.sqrt(((queries[:, None, :] - points[None, :, :]) ** 2).sum(axis=2))
+    distances[:, ~valid] = np.inf
+    distances[~inside_city(lat, lon)] = np.inf
+    return distances, data['OCCURRED_ON_DATE'].to_numpy()[None, :], times.to_numpy()[:, None]
+
+
+@pytest.mark.parametrize('window', [pd.Timedelta(days=1), pd.Timedelta(days=30), pd.Timedelta(days=365)])
+def test_radius_query_matches_brute_force(window):
+    data = _incidents(3000, seed=0)
+    index = SpatioTemporalIndex(data)
+    lat, lon, times = _queries(data, seed=1)
+    distances, incident_times, query_times = _brute_force(data, lat, lon, times)
+    with np.errstate(invalid='ignore'):
+        in_window = (incident_times >= query_times - window) & (incident_times <= query_times)
+    for radius in (300, 1000):
+        found = index.radius_query(lat, lon, times, radius, window)
+        assert len(found) == len(lat)
+        expected = (distances <= radius) & in_window
+        for query, rows in enumerate(found):
+            np.testing.assert_array_equal(np.sort(rows), np.flatnonzero(expected[query]))
+    # The window of one day lies inside a single bucket, the longer ones cover several trees
+    assert any(len(rows) for rows in found)
+
+
+@pytest.mark.parametrize('k', [1, 3])
+@pytest.mark.parametrize('max_age', [None, pd.Timedelta(days=1), pd.Timedelta(days=20)])
+def test_nearest_prior_matches_brute_force(k, max_age):
+    data = _incidents(3000, seed=2)
+    index = SpatioTemporalIndex(data)
+    lat, lon, times = _queries(data, seed=3)
+    distances, incident_times, query_times = _brute_force(data, lat, lon, times)
+    with np.errstate(invalid='ignore'):
+        prior = incident_times < query_times
+        if max_age is not None:
+            prior &= incident_times >= query_times - max_age
+    distances = np.where(prior, distances, np.inf)
+    expected_rows = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    expected_distances = np.take_along_axis(distances, expected_rows, axis=1)
+    expected_rows = np.where(np.isfinite(expected_distances), expected_rows, -1)
+
+    found_distances, found_rows = index.nearest_prior(lat, lon, times, k=k, max_age=max_age)
+    np.testing.assert_allclose(found_distances, expected_distances, rtol=1e-9)
+    np.testing.assert_array_equal(found_rows, expected_rows)
+    # The points outside the city find nothing
+    assert (found_rows[-50:] == -1).all()
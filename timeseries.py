@@ -0,0 +1,123 @@
+#%%
+# Dense hourly time series of the incident counts
+# The time series analyses set OCCURRED_ON_DATE as the index and resample the whole incident table, which sorts
+# and buckets every row again for every series. The store counts the incidents once per hour for every combination
+# of DISTRICT, OFFENSE_CODE_GROUP and SHOOTING that occurs, into one contiguous array (series x hours) sharing a
+# time axis that starts on a Monday at midnight and covers whole weeks. The daily and weekly views are reshapes of
+# that array followed by a sum, the monthly view sums the days between the month starts, and the series are
+# selected and grouped on their keys, so no view touches the incident rows.
+import numpy as np
+import pandas as pd
+
+# Dimensions the series are split by
+TIMESERIES_DIMENSIONS = ['DISTRICT', 'OFFENSE_CODE_GROUP', 'SHOOTING']
+
+# Labels of the views, like the labels of DataFrame.resample
+FREQUENCIES = ['h', 'D', 'W', 'M']
+
+
+class TimeSeriesStore:
+    """
+    Hourly incident counts of every combination of the dimensions, on a shared time axis.
+
+    :param data: pandas DataFrame of incidents with the time column and the dimension columns
+    :param dimensions: list of the columns the series are split by
+    :param time: name of the time column
+    :param incident: optional name of the incident number column, one row per incident is counted instead of
+                     one per offense row, the dimensions should then be the same on every row of an incident
+    """
+
+    def __init__(self, data, dimensions=TIMESERIES_DIMENSIONS, time='OCCURRED_ON_DATE', incident=None):
+        self.dimensions = list(dimensions)
+        if incident is not None:
+            data = data.drop_duplicates(incident)
+        times = pd.to_datetime(data[time])
+        valid = times.notna().to_numpy()
+        times = times[valid]
+
+        # Time axis of whole weeks, from the Monday before the first incident
+        self.first, self.last = times.min(), times.max()
+        self.origin = self.first.normalize() - pd.Timedelta(days=self.first.dayofweek)
+        n_weeks = (self.last - self.origin) // pd.Timedelta(weeks=1) + 1
+        self.hours = pd.date_range(self.origin, periods=n_weeks * 7 * 24, freq='h')
+        hour = ((times - self.origin) // pd.Timedelta(hours=1)).to_numpy()
+
+        # One series per combination of the dimensions that occurs, missing values are a label of their own
+        codes, labels = [], []
+        for col in self.dimensions:
+            column_codes, column_labels = pd.factorize(data[col][valid], sort=True, use_na_sentinel=False)
+            codes.append(column_codes), labels.append(column_labels)
+        combination = np.ravel_multi_index(codes, [len(column_labels) for column_labels in labels]) if codes \
+            else np.zeros(len(hour), dtype=np.int64)
+        combinations, series = np.unique(combination, return_inverse=True)
+        keys = np.unravel_index(combinations, [len(column_labels) for column_labels in labels])
+        self.series = pd.MultiIndex.from_arrays([column_labels[key] for column_labels, key in zip(labels, keys)],
+                                                names=self.dimensions)
+
+        # Only the non-empty hours are counted, the array holds the smallest integer type fitting the counts
+        cells, counts = np.unique(series.ravel() * len(self.hours) + hour, return_counts=True)
+        self.counts = np.zeros((len(self.series), len(self.hours)), dtype=np.min_scalar_type(counts.max(initial=0)))
+        self.counts.ravel()[cells] = counts
+
+    def _selection(self, where):
+        # Mask of the series matching the conditions
+        mask = np.ones(len(self.series), dtype=bool)
+        for col, values in (where or {}).items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            mask &= self.series.get_level_values(col).isin(values)
+        return mask
+
+    def _resample(self, counts, freq):
+        # Counts of the periods of a frequency and their labels, over the periods from the one of the first
+        # incident to the one of the last incident
+        days = self.hours[::24]
+        if freq == 'h':
+            starts = labels = self.hours
+            ends = starts + pd.Timedelta(hours=1)
+        elif freq == 'D':
+            counts = counts.reshape(len(counts), -1, 24).sum(axis=2, dtype=np.int64)
+            starts = labels = days
+            ends = starts + pd.Timedelta(days=1)
+        elif freq == 'W':
+            counts = counts.reshape(len(counts), -1, 7 * 24).sum(axis=2, dtype=np.int64)
+            starts = self.hours[::7 * 24]
+            ends = starts + pd.Timedelta(weeks=1)
+            # Weeks ending on Sunday, labelled by their last day as with resample('W')
+            labels = starts + pd.Timedelta(days=6)
+        elif freq == 'M':
+            daily = counts.reshape(len(counts), -1, 24).sum(axis=2, dtype=np.int64)
+            month_starts = np.flatnonzero(np.append(True, days.month[1:] != days.month[:-1]))
+            counts = np.add.reduceat(daily, month_starts, axis=1)
+            starts = days[month_starts]
+            # Months labelled by their last day as with resample('M')
+            labels = starts + pd.offsets.MonthEnd(0)
+            ends = labels + pd.Timedelta(days=1)
+        else:
+            raise ValueError(f"Unknown frequency {freq}, expected one of {FREQUENCIES}")
+
+        inside = (starts <= self.last) & (ends > self.first)
+        return counts[:, inside], pd.DatetimeIndex(labels[inside], name='OCCURRED_ON_DATE')
+
+    def get(self, freq='D', where=None, by=None):
+        """
+        Incident counts per period, like data.resample(freq).size() on the matching incidents.
+
+        :param freq: 'h' (hourly), 'D' (daily), 'W' (weekly, ending on Sunday) or 'M' (monthly)
+        :param where: optional dict of {dimension: label or list of labels} to count only some incidents
+        :param by: optional dimension or list of dimensions, one column per group of them
+        :return: pandas Series indexed by period, or a DataFrame with one column per group when by is given
+        """
+        mask = self._selection(where)
+        counts, index = self._resample(self.counts[mask], freq)
+        if by is None:
+            return pd.Series(counts.sum(axis=0, dtype=np.int64), index=index, name='count')
+
+        groups = self.series[mask].droplevel([col for col in self.dimensions if col not in np.atleast_1d(by)])
+        group_codes, group_labels = pd.factorize(groups, sort=True, use_na_sentinel=False)
+        order = np.argsort(group_codes, kind='stable')
+        starts = np.searchsorted(group_codes[order], np.arange(len(group_labels)))
+        grouped = np.add.reduceat(counts[order].astype(np.int64), starts, axis=0) if len(order) \
+            else np.zeros((0, len(index)), dtype=np.int64)
+        columns = pd.MultiIndex.from_tuples(group_labels, names=groups.names) if groups.nlevels > 1 \
+            else pd.Index(group_labels, name=groups.name)
+        return pd.DataFrame(grouped.T, index=index, columns=columns)